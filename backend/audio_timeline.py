@@ -0,0 +1,260 @@
+"""
+Audio Timeline - Dựng audio của cả video ở dạng PCM rồi encode AAC đúng 1 lần
+
+Renderer "segments" trước đây encode AAC cho từng clip, encode lại khi concat
+từng batch rồi encode lần nữa khi concat các batch (3 thế hệ AAC, lệch
+timestamp ở mỗi chỗ nối), và bỏ mất âm thanh transition (audioTracks).
+Module này thay toàn bộ phần đó:
+
+- Timeline tính bằng SỐ MẪU (48 kHz), ranh giới mỗi đoạn = round(thời điểm
+  tích luỹ * 48000) -> không cộng dồn sai số làm tròn.
+- Mỗi đoạn audio (clip gốc cắt theo cutFrom, transition...) được decode
+  thẳng từ file nguồn ra PCM s16le thô, pad/cắt bằng apad + atrim tới đúng
+  số mẫu. Cùng nguồn + đoạn cắt chỉ decode 1 lần (vd: âm thanh transition).
+- Ghép bằng cách nối byte (PCM thô không có header/priming) -> track nền.
+  audioTracks được xếp vào các lớp hiệu ứng không chồng nhau, chỗ trống là
+  im lặng, nên mỗi lớp cũng là 1 file PCM dài đúng bằng track nền.
+- Kiểm tra căn chỉnh: từng đoạn phải đúng số mẫu (lệch -> cảnh báo + sửa),
+  tổng số mẫu phải khớp thời lượng video (lệch > 1 frame -> AudioAlignmentError,
+  job render lỗi).
+- Bước cuối: amix các lớp, encode AAC 1 lần và mux với video (-c:v copy)
+  trong cùng 1 lệnh ffmpeg.
+
+Sử dụng:
+    timeline = AudioTimeline()
+    timeline.add_segment("clip.mp4", cut_from=2.0, samples=seconds_to_samples(3.0))
+    timeline.add_segment(None, 0, 24000)           # 0.5s im lặng
+    timeline.add_track("sting.mov", start_sample=96000, cut_from=0, samples=48000)
+
+    cmds = timeline.plan_extract(temp_dir)
+    run_parallel(cmds)
+    layers = timeline.assemble(temp_dir)
+    run(timeline.mux_cmd(layers, "video_only.mp4", "out.mp4"))
+"""
+
+import os
+
+from media_index import probe_media_many
+
+AUDIO_RATE = 48000
+AUDIO_CHANNELS = 2
+SAMPLE_BYTES = 2 * AUDIO_CHANNELS  # s16le stereo, 1 mẫu = 4 byte
+PCM_INPUT_ARGS = ["-f", "s16le", "-ar", str(AUDIO_RATE), "-ac", str(AUDIO_CHANNELS)]
+AUDIO_CODEC_ARGS = ["-c:a", "aac", "-b:a", "320k", "-ar", str(AUDIO_RATE), "-ac", str(AUDIO_CHANNELS)]
+
+_COPY_CHUNK = 1024 * 1024
+
+
+class AudioAlignmentError(RuntimeError):
+    """Audio của video đầu ra lệch hình quá 1 frame (report: báo cáo audio của timeline)"""
+
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report or {}
+
+
+def seconds_to_samples(seconds):
+    return int(round(float(seconds) * AUDIO_RATE))
+
+
+def _write_silence(f, samples):
+    remaining = samples * SAMPLE_BYTES
+    zeros = bytes(min(remaining, _COPY_CHUNK))
+    while remaining > 0:
+        n = min(remaining, len(zeros))
+        f.write(zeros[:n])
+        remaining -= n
+
+
+def _copy_samples(src_path, dst, samples):
+    """
+    Chép đúng `samples` mẫu từ file PCM sang dst (thiếu -> bù im lặng,
+    thừa -> bỏ). Trả về số mẫu lệch của file nguồn (âm = thiếu).
+    """
+    wanted = samples * SAMPLE_BYTES
+    copied = 0
+    with open(src_path, "rb") as src:
+        while copied < wanted:
+            chunk = src.read(min(_COPY_CHUNK, wanted - copied))
+            if not chunk:
+                break
+            dst.write(chunk)
+            copied += len(chunk)
+    if copied < wanted:
+        _write_silence(dst, (wanted - copied) // SAMPLE_BYTES)
+    actual = os.path.getsize(src_path) // SAMPLE_BYTES
+    return actual - samples
+
+
+class AudioTimeline:
+    """
+    Timeline audio: các đoạn nền nối tiếp nhau (clip, transition, im lặng)
+    + các track hiệu ứng đặt ở vị trí tuyệt đối (audioTracks).
+    Mọi vị trí/độ dài tính bằng số mẫu ở AUDIO_RATE.
+    """
+
+    def __init__(self):
+        self.segments = []
+        self.tracks = []
+        self.report = {}
+        self._pcm = {}
+
+    @property
+    def total_samples(self):
+        return sum(s["samples"] for s in self.segments)
+
+    def add_segment(self, path, cut_from, samples, volume=1.0):
+        """Đoạn nền tiếp theo. path=None -> im lặng"""
+        if samples > 0:
+            self.segments.append({"path": path, "cut_from": float(cut_from or 0),
+                                  "samples": int(samples), "volume": float(volume)})
+
+    def add_track(self, path, start_sample, cut_from, samples, volume=1.0):
+        """Track hiệu ứng bắt đầu tại start_sample (mẫu), phần vượt quá cuối timeline bị cắt"""
+        if samples > 0 and path:
+            self.tracks.append({"path": path, "start": max(0, int(start_sample)),
+                                "cut_from": float(cut_from or 0), "samples": int(samples),
+                                "volume": float(volume)})
+
+    def track_layers(self):
+        """Xếp track vào các lớp không chồng nhau (mỗi track vào lớp đầu tiên còn trống)"""
+        layers = []
+        ends = []
+        for track in sorted(self.tracks, key=lambda t: t["start"]):
+            for i, end in enumerate(ends):
+                if track["start"] >= end:
+                    layers[i].append(track)
+                    ends[i] = track["start"] + track["samples"]
+                    break
+            else:
+                layers.append([track])
+                ends.append(track["start"] + track["samples"])
+        return layers
+
+    # --- decode ra PCM ---
+    @staticmethod
+    def _piece_key(piece):
+        return piece["path"], round(piece["cut_from"], 6), piece["samples"], piece["volume"]
+
+    def plan_extract(self, temp_dir):
+        """
+        Lệnh ffmpeg decode từng đoạn (chưa chạy). Đoạn im lặng hoặc file không
+        có audio không cần lệnh. Cùng nguồn + đoạn cắt + độ dài chỉ decode 1 lần.
+        """
+        pieces = [s for s in self.segments if s["path"]] + self.tracks
+        infos = probe_media_many(sorted({p["path"] for p in pieces}))
+        cmds = []
+        for piece in pieces:
+            key = self._piece_key(piece)
+            if key in self._pcm:
+                continue
+            info = infos.get(piece["path"])
+            if not info or not info.get("has_audio"):
+                self._pcm[key] = None
+                continue
+            out = os.path.join(temp_dir, f"audio_{len(self._pcm):05d}.pcm")
+            self._pcm[key] = out
+            cmds.append(self._extract_cmd(piece, out))
+        return cmds
+
+    @staticmethod
+    def _extract_cmd(piece, out_path):
+        chain = [f"aresample={AUDIO_RATE}"]
+        if piece["volume"] != 1.0:
+            chain.append(f"volume={piece['volume']:g}")
+        chain += ["aformat=sample_fmts=s16:channel_layouts=stereo",
+                  "apad", f"atrim=end_sample={piece['samples']}"]
+        cmd = ["ffmpeg", "-y"]
+        if piece["cut_from"] > 0:
+            cmd += ["-ss", f"{piece['cut_from']:.6f}"]
+        cmd += ["-t", f"{piece['samples'] / AUDIO_RATE:.6f}", "-i", piece["path"],
+                "-map", "0:a:0", "-af", ",".join(chain), "-f", "s16le", out_path]
+        return cmd
+
+    # --- ghép + kiểm tra ---
+    def _write_piece(self, dst, piece, stats):
+        pcm = self._pcm.get(self._piece_key(piece))
+        if pcm is None:
+            _write_silence(dst, piece["samples"])
+            return
+        error = _copy_samples(pcm, dst, piece["samples"])
+        if error:
+            stats["fixed"] += 1
+            stats["max_error_samples"] = max(stats["max_error_samples"], abs(error))
+            print(f"⚠️ Audio {os.path.basename(piece['path'])} lệch {error} mẫu "
+                  f"({error * 1000 / AUDIO_RATE:+.2f}ms), đã pad/cắt cho khớp")
+
+    def assemble(self, temp_dir):
+        """
+        Ghép các đoạn đã decode thành track nền + các lớp hiệu ứng (file PCM
+        cùng độ dài). Trả về list đường dẫn, phần tử đầu là track nền.
+        """
+        total = self.total_samples
+        stats = {"pieces": len(self.segments) + len(self.tracks), "fixed": 0, "max_error_samples": 0}
+
+        base = os.path.join(temp_dir, "audio_base.pcm")
+        with open(base, "wb") as f:
+            for segment in self.segments:
+                self._write_piece(f, segment, stats)
+        outputs = [base]
+
+        for i, layer in enumerate(self.track_layers()):
+            path = os.path.join(temp_dir, f"audio_fx_{i}.pcm")
+            cursor = 0
+            with open(path, "wb") as f:
+                for track in layer:
+                    if track["start"] >= total:
+                        continue
+                    piece = dict(track, samples=min(track["samples"], total - track["start"]))
+                    _write_silence(f, piece["start"] - cursor)
+                    self._write_piece(f, piece, stats)
+                    cursor = piece["start"] + piece["samples"]
+                _write_silence(f, total - cursor)
+            outputs.append(path)
+
+        for path in outputs:
+            written = os.path.getsize(path) // SAMPLE_BYTES
+            if written != total:
+                raise RuntimeError(f"Audio timeline sai độ dài: {path} có {written} mẫu, cần {total}")
+        stats["samples"] = total
+        stats["layers"] = len(outputs)
+        self.report.update(stats)
+        return outputs
+
+    def check_alignment(self, video_duration, fps):
+        """
+        So tổng số mẫu với thời lượng video. Trả về độ lệch (giây, dương =
+        audio dài hơn); lệch quá 1 frame -> AudioAlignmentError (report
+        "ok" = False). Không đọc được thời lượng video (None) -> bỏ qua,
+        "ok" = None.
+        """
+        if not video_duration:
+            print("⚠️ Không đọc được thời lượng video, bỏ qua kiểm tra audio")
+            self.report["ok"] = None
+            return None
+        drift = self.total_samples / AUDIO_RATE - float(video_duration)
+        self.report["drift_ms"] = round(drift * 1000, 3)
+        self.report["ok"] = not (fps and abs(drift) > 1.0 / float(fps))
+        if not self.report["ok"]:
+            self.report["error"] = f"audio lệch video {drift * 1000:+.1f}ms (> 1 frame)"
+            raise AudioAlignmentError(f"Audio timeline không khớp video: {self.report['error']}", self.report)
+        return drift
+
+    def mux_cmd(self, layers, video_path, out_path, audio_args=AUDIO_CODEC_ARGS, video_input_args=(),
+                video_args=("-c:v", "copy")):
+        """
+        1 lệnh: mix các lớp PCM, encode AAC 1 lần, mux với video (mặc định -c:v copy).
+        video_input_args: vd ["-f", "nut"] khi video_path là pipe:0
+        """
+        cmd = ["ffmpeg", "-y"] + list(video_input_args) + ["-i", video_path]
+        for path in layers:
+            cmd += PCM_INPUT_ARGS + ["-i", path]
+        if len(layers) > 1:
+            pads = "".join(f"[{i + 1}:a]" for i in range(len(layers)))
+            cmd += ["-filter_complex",
+                    f"{pads}amix=inputs={len(layers)}:normalize=0:duration=first[aout]",
+                    "-map", "0:v", "-map", "[aout]"]
+        else:
+            cmd += ["-map", "0:v", "-map", "1:a"]
+        cmd += list(video_args) + list(audio_args) + [out_path]
+        return cmd
@@ -1,32 +1,19 @@
 import datetime
 import random
-import subprocess
 import json
 import os
-from tkinter import messagebox
+from media_index import probe_media
+from helper import notify
 
 def get_clip_duration(clip_path: str) -> float:
     """
-    Dùng ffprobe để lấy thời lượng clip (tính bằng giây).
+    Lấy thời lượng clip (tính bằng giây) từ media index.
     """
-    try:
-        result = subprocess.run(
-            [
-                "ffprobe", "-v", "error",
-                "-select_streams", "v:0",
-                "-show_entries", "stream=duration",
-                "-of", "json", clip_path
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        info = json.loads(result.stdout)
-        duration = float(info["streams"][0]["duration"])
-        return duration
-    except Exception as e:
-        print(f"Lỗi khi đọc thời lượng clip: {clip_path} ({e})")
+    info = probe_media(clip_path)
+    if not info:
+        print(f"Lỗi khi đọc thời lượng clip: {clip_path}")
         return 0.0
+    return info["duration"]
 
 
 def select_clips(topic: str, target_time: float, used_videos: list) -> list:
@@ -60,7 +47,7 @@ def select_clips(topic: str, target_time: float, used_videos: list) -> list:
     # Loại bỏ clip đã dùng
     available_clips = [clip for clip in all_clips if clip not in used_video_paths]
     if not available_clips:
-        messagebox.showerror("Lỗi", "Không còn clip mới để chọn!")
+        notify("error", "Lỗi", "Không còn clip mới để chọn!")
 
     # Chọn ngẫu nhiên cho đến khi đủ thời lượng
     selected = []
@@ -4,11 +4,31 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 TEMP_DIR = PROJECT_ROOT / "Temp"
 THUMBNAIL_SIZE = (160, 90)  # Kích thước thumbnail (rộng, cao)
+THUMBNAIL_FORMAT = "jpg"  # jpg / webp (thumbnail_engine)
 PIXELS_PER_SECOND = 50  # Giữ lại để vẽ timeline
 CHANNELS_DIR = PROJECT_ROOT / "Channels"
 MAIN_CLIPS_DIR = os.path.join(PROJECT_ROOT, "Main_clips")
 OUT_DIR = PROJECT_ROOT / "Output"
 HISTORY_IN_CHANNEL_FOLDER = "history"
+CACHE_DIR = PROJECT_ROOT / "Cache"  # Cache lâu dài (không xoá khi đóng app)
+MEDIA_INDEX_DB = CACHE_DIR / "media_index.sqlite3"
+ASSET_CACHE_DIR = CACHE_DIR / "assets"  # transition/logo đã chuẩn hoá theo kích thước/fps
+ASSET_CACHE_MAX_BYTES = 2 * 1024 ** 3
+SEGMENT_CACHE_DIR = CACHE_DIR / "segments"  # clip đã render (nền blur + logo) dùng lại giữa các lần render
+SEGMENT_CACHE_MAX_BYTES = 20 * 1024 ** 3
+THUMBNAIL_CACHE_DIR = CACHE_DIR / "thumbnails"  # thumbnail clip, dùng lại giữa các phiên
+THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 ** 2
+ENCODER_CAPS_FILE = CACHE_DIR / "encoder_caps.json"  # encoder/hwaccel dùng được trên từng máy
+RENDER_QUEUE_DB = PROJECT_ROOT / "Queue" / "render_queue.sqlite3"  # hàng đợi job render (không xoá)
+SCRATCH_REGISTRY_DIR = TEMP_DIR / "scratch"  # file/thư mục tạm đang dùng, dọn lại nếu render chết giữa chừng
+SCRATCH_DIR = TEMP_DIR / "render"  # file trung gian của render khi không có scratch_dir / tmpfs (scratch_space)
+LOG_DIR = PROJECT_ROOT / "Logs"
+FFMPEG_METRICS_LOG = LOG_DIR / "ffmpeg_metrics.jsonl"  # mỗi lệnh ffmpeg 1 dòng: thời gian, fps, speed
+RENDER_REPORTS_LOG = LOG_DIR / "render_reports.jsonl"  # mỗi lần render 1 dòng: thời gian từng giai đoạn
+DEFAULT_BLUR_QUALITY = "full"  # nền blur: full / high / medium / low (blur ở 1, 1/2, 1/4, 1/8 độ phân giải)
+DEFAULT_BG_MODE = "dynamic"  # nền blur: dynamic (mỗi frame) / hold / crossfade (tính ở bg_fps rồi giữ / hoà dần)
+DEFAULT_BG_FPS = 2
+DEFAULT_FILTER_BACKEND = "cpu"  # dựng hình: cpu / auto (theo encoder) / cuda / vaapi - GPU phải bật trong config kênh
 
 
 CODEC_NAME = 'Apple ProRes 422'
\ No newline at end of file
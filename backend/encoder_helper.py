@@ -0,0 +1,222 @@
+"""
+Encoder Helper - Dò encoder H.264 / hwaccel mà ffmpeg trên máy này dùng được
+
+- Liệt kê encoder (-encoders) và hwaccel (-hwaccels) 1 lần, sau đó chạy thử
+  một lần encode/decode rất ngắn cho từng ứng viên: có trong danh sách chưa
+  chắc chạy được (thiếu driver, máy không có GPU, hết phiên NVENC...).
+- Kết quả lưu ở Cache/encoder_caps.json theo từng máy (hostname + bản ffmpeg),
+  nên các lần mở app sau không phải dò lại.
+- Không có GPU -> tự dùng libx264, không còn lỗi "Device creation failed".
+
+Sử dụng:
+    from encoder_helper import best_gpu_type, video_encoder_args, hwaccel_args
+
+    gpu_type = best_gpu_type()          # "nvidia" / "amd" / "intel" / "cpu"
+    cmd = ["ffmpeg", "-y"] + hwaccel_args() + ["-i", src]
+    cmd += video_encoder_args(quality=23) + [out]
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+
+from consts import ENCODER_CAPS_FILE
+
+FFMPEG_EXEC = "ffmpeg"
+
+# Tăng số này khi thay đổi cách dò -> kết quả cũ trong cache bị bỏ qua
+CAPS_VERSION = 2
+
+# (gpu_type, encoder) theo thứ tự ưu tiên, libx264 luôn là phương án cuối
+ENCODER_PRIORITY = [
+    ("nvidia", "h264_nvenc"),
+    ("amd", "h264_amf"),
+    ("intel", "h264_qsv"),
+    ("cpu", "libx264"),
+]
+
+# hwaccel decode thử theo thứ tự ưu tiên
+HWACCEL_PRIORITY = ["cuda", "qsv", "d3d11va", "videotoolbox", "vaapi"]
+
+# Filter xử lý frame ngay trên GPU (filter_backends) - ghi lại cái nào ffmpeg có
+HW_FILTERS = ["scale_cuda", "overlay_cuda", "scale_vaapi", "overlay_vaapi"]
+
+TEST_TIMEOUT = 20
+
+_caps = None
+_caps_lock = threading.Lock()
+
+
+def _ffmpeg_list(flag):
+    """Tên trong output của `ffmpeg -encoders` / `ffmpeg -filters` / `ffmpeg -hwaccels`"""
+    result = subprocess.run([FFMPEG_EXEC, "-hide_banner", flag],
+                            capture_output=True, text=True, timeout=TEST_TIMEOUT)
+    names = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if not parts or line.rstrip().endswith(":"):
+            continue
+        # -encoders: " V....D h264_nvenc  NVIDIA NVENC ..." ; -filters: " ... scale_cuda  V->V ..." ;
+        # -hwaccels: "cuda"
+        names.add(parts[1] if len(parts) > 1 and flag in ("-encoders", "-filters") else parts[0])
+    return names
+
+
+def _try(cmd):
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=TEST_TIMEOUT)
+        return result.returncode == 0
+    except Exception:
+        return False
+
+
+def _test_encode(encoder, out_path):
+    """Encode thử 5 frame (256x256 - trên mức kích thước tối thiểu của NVENC/AMF)"""
+    return _try([
+        FFMPEG_EXEC, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", "color=c=black:s=256x256:r=30:d=0.2",
+        "-frames:v", "5", "-pix_fmt", "yuv420p", "-c:v", encoder, out_path
+    ])
+
+
+def _test_decode(hwaccel, sample_path):
+    return _try([
+        FFMPEG_EXEC, "-hide_banner", "-loglevel", "error",
+        "-hwaccel", hwaccel, "-i", sample_path, "-f", "null", "-"
+    ])
+
+
+def _machine_key():
+    """Máy + bản ffmpeg đang dùng: đổi máy hoặc cập nhật ffmpeg thì dò lại"""
+    exe = shutil.which(FFMPEG_EXEC) or FFMPEG_EXEC
+    try:
+        st = os.stat(exe)
+        build = f"{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        build = ""
+    return f"{socket.gethostname()}|{os.path.abspath(exe)}|{build}"
+
+
+def detect_encoder_caps():
+    """
+    Dò trực tiếp (không cache).
+    Trả về {"encoders": [...], "hwaccels": [...], "filters": [...], "gpu_type": "..."}
+    với encoder/hwaccel xếp theo thứ tự ưu tiên, chỉ gồm những cái chạy được;
+    filters: các HW_FILTERS mà bản ffmpeg này có.
+    """
+    try:
+        listed_encoders = _ffmpeg_list("-encoders")
+        listed_hwaccels = _ffmpeg_list("-hwaccels")
+        listed_filters = _ffmpeg_list("-filters")
+    except Exception as e:
+        print(f"⚠️ Không chạy được ffmpeg để dò encoder: {e}")
+        return {"encoders": ["libx264"], "hwaccels": [], "filters": [], "gpu_type": "cpu"}
+
+    encoders = []
+    hwaccels = []
+    with tempfile.TemporaryDirectory(prefix="encoder_probe_") as tmp:
+        sample = os.path.join(tmp, "sample.mp4")
+        for _, encoder in ENCODER_PRIORITY:
+            if encoder in listed_encoders and _test_encode(encoder, os.path.join(tmp, f"{encoder}.mp4")):
+                encoders.append(encoder)
+
+        # Cần 1 file H.264 mẫu để thử decode bằng hwaccel
+        if encoders and _test_encode(encoders[-1], sample):
+            for hwaccel in HWACCEL_PRIORITY:
+                if hwaccel in listed_hwaccels and _test_decode(hwaccel, sample):
+                    hwaccels.append(hwaccel)
+
+    if "libx264" not in encoders:
+        encoders.append("libx264")
+    gpu_type = next(g for g, e in ENCODER_PRIORITY if e == encoders[0])
+    filters = [name for name in HW_FILTERS if name in listed_filters]
+    return {"encoders": encoders, "hwaccels": hwaccels, "filters": filters, "gpu_type": gpu_type}
+
+
+def _load_cache():
+    try:
+        with open(ENCODER_CAPS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_cache(data):
+    try:
+        os.makedirs(os.path.dirname(ENCODER_CAPS_FILE), exist_ok=True)
+        tmp_path = f"{ENCODER_CAPS_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, ENCODER_CAPS_FILE)
+    except Exception as e:
+        print(f"⚠️ Không ghi được cache encoder: {e}")
+
+
+def get_encoder_caps(refresh=False):
+    """Khả năng encode của máy này (dò 1 lần, sau đó đọc từ cache)"""
+    global _caps
+    with _caps_lock:
+        if _caps is not None and not refresh:
+            return _caps
+
+        key = _machine_key()
+        data = _load_cache()
+        entry = data.get(key)
+        if refresh or not entry or entry.get("version") != CAPS_VERSION:
+            print("🔍 Đang dò encoder/hwaccel của ffmpeg trên máy này...")
+            entry = dict(detect_encoder_caps(), version=CAPS_VERSION)
+            data[key] = entry
+            _save_cache(data)
+            print(f"✅ Encoder: {', '.join(entry['encoders'])} | "
+                  f"hwaccel: {', '.join(entry['hwaccels']) or 'không có'}")
+
+        _caps = entry
+        return _caps
+
+
+def best_gpu_type():
+    """Loại encoder nhanh nhất chạy được: "nvidia" / "amd" / "intel" / "cpu" """
+    return get_encoder_caps()["gpu_type"]
+
+
+def is_gpu_type_available(gpu_type):
+    encoder = dict(ENCODER_PRIORITY).get(gpu_type)
+    return encoder in get_encoder_caps()["encoders"]
+
+
+def best_encoder():
+    return get_encoder_caps()["encoders"][0]
+
+
+def hwaccel_args():
+    """["-hwaccel", "<tốt nhất>"] nếu decode bằng phần cứng chạy được, ngược lại []"""
+    hwaccels = get_encoder_caps()["hwaccels"]
+    return ["-hwaccel", hwaccels[0]] if hwaccels else []
+
+
+def has_hw_filters(*names):
+    """ffmpeg trên máy này có đủ các filter GPU `names` (trong HW_FILTERS)"""
+    available = get_encoder_caps().get("filters", [])
+    return all(name in available for name in names)
+
+
+def video_encoder_args(quality=23, encoder=None):
+    """
+    Tham số -c:v cho encoder tốt nhất (hoặc `encoder` chỉ định), chất lượng
+    tương đương nhau giữa các encoder (quality ~ CRF/CQ, càng thấp càng đẹp)
+    """
+    encoder = encoder or best_encoder()
+    q = str(quality)
+    if encoder == "h264_nvenc":
+        return ["-c:v", "h264_nvenc", "-preset", "p6", "-tune", "hq",
+                "-rc", "vbr", "-cq", q, "-b:v", "0"]
+    if encoder == "h264_amf":
+        return ["-c:v", "h264_amf", "-quality", "quality", "-rc", "cqp",
+                "-qp_i", q, "-qp_p", q, "-qp_b", q]
+    if encoder == "h264_qsv":
+        return ["-c:v", "h264_qsv", "-preset", "medium", "-global_quality", q]
+    return ["-c:v", "libx264", "-preset", "medium", "-crf", q]
@@ -0,0 +1,352 @@
+"""
+FFmpeg Runner - Chạy ffmpeg và đọc tiến trình trực tiếp (-progress pipe:1)
+
+- Mỗi ~0.5s ffmpeg ghi frame / fps / speed / out_time ra stdout, runner tính
+  % hoàn thành + ETA (khi biết thời lượng đầu ra) và gửi cho:
+    * callback on_progress của từng lệnh
+    * các listener toàn cục (add_progress_listener) - render_cli, UI...
+    * console (1 dòng tóm tắt mỗi PRINT_INTERVAL giây)
+- Kết thúc lệnh: ghi 1 dòng JSON vào Logs/ffmpeg_metrics.jsonl (thời gian,
+  CPU time, byte đọc/ghi, số frame, fps trung bình, speed) để biết bước nào
+  chậm, và gửi cho các metrics listener (add_metrics_listener - render_report).
+  CPU time lấy từ os.wait4 (không có trên Windows -> None).
+- Linux: ffmpeg được tạo với PR_SET_PDEATHSIG=SIGKILL nên tự chết khi
+  thread/tiến trình Python tạo ra nó chết (kể cả bị kill -9), không để lại
+  ffmpeg mồ côi.
+- pipe_output=True: ffmpeg ghi kết quả ra stdout (vd: "-f nut pipe:1") để
+  tiến trình khác đọc qua stdin (stdin=...) - không có file trung gian,
+  tiến trình/metrics lấy ở lệnh đọc.
+- Không truyền duration thì tự đoán: "-t" của input, tổng thời lượng file
+  trong concat list, hoặc thời lượng input đầu tiên (qua media index).
+
+Sử dụng:
+    from ffmpeg_runner import run_ffmpeg, add_progress_listener
+
+    add_progress_listener(lambda p: print(p["label"], p["percent"], p["eta"]))
+    run_ffmpeg(["ffmpeg", "-y", "-i", "in.mp4", "out.mp4"], label="encode")
+"""
+
+import json
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from consts import FFMPEG_METRICS_LOG
+from media_index import probe_media, probe_media_many
+
+PRINT_INTERVAL = 5  # giây giữa 2 dòng tiến trình in ra console
+
+_listeners = []
+_metrics_listeners = []
+_listeners_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+
+
+def add_progress_listener(callback):
+    """callback(progress_dict) được gọi cho MỌI lệnh ffmpeg chạy qua runner"""
+    with _listeners_lock:
+        _listeners.append(callback)
+
+
+def remove_progress_listener(callback):
+    with _listeners_lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+
+def add_metrics_listener(callback):
+    """callback(metrics_dict) được gọi khi MỖI lệnh ffmpeg kết thúc (kể cả lỗi)"""
+    with _listeners_lock:
+        _metrics_listeners.append(callback)
+
+
+def remove_metrics_listener(callback):
+    with _listeners_lock:
+        if callback in _metrics_listeners:
+            _metrics_listeners.remove(callback)
+
+
+def pdeathsig_preexec(sig=signal.SIGKILL):
+    """
+    preexec_fn (Linux): tiến trình con nhận `sig` khi thread cha kết thúc
+    (render_queue dùng SIGTERM cho render_cli để nó kịp dọn file tạm).
+    libc nạp sẵn ở tiến trình cha. Không phải Linux -> None.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        prctl = ctypes.CDLL("libc.so.6", use_errno=True).prctl
+    except (OSError, AttributeError):
+        return None
+
+    def _preexec():
+        prctl(1, sig)  # PR_SET_PDEATHSIG
+
+    return _preexec
+
+
+_PREEXEC = pdeathsig_preexec()
+
+
+def _parse_time(value):
+    """'00:01:02.500000' -> 62.5"""
+    try:
+        h, m, s = value.split(":")
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _read_concat_list(list_file):
+    files = []
+    try:
+        with open(list_file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("file "):
+                    files.append(line[5:].strip().strip("'").replace("'\\''", "'"))
+    except OSError:
+        pass
+    return files
+
+
+def guess_output_duration(cmd):
+    """Đoán thời lượng đầu ra (giây) từ input đầu tiên của lệnh, None nếu không biết"""
+    try:
+        first_input = cmd.index("-i")
+    except ValueError:
+        return None
+    input_opts = cmd[1:first_input]
+    src = cmd[first_input + 1]
+
+    if "-t" in input_opts:
+        try:
+            return float(input_opts[input_opts.index("-t") + 1])
+        except (IndexError, ValueError):
+            pass
+    if "concat" in input_opts:
+        files = _read_concat_list(src)
+        infos = probe_media_many(files)
+        return sum((infos.get(f) or {}).get("duration", 0) for f in files) or None
+    if "lavfi" in input_opts:
+        return None
+    info = probe_media(src)
+    return info["duration"] if info and info["duration"] > 0 else None
+
+
+def _input_bytes(cmd):
+    """Tổng dung lượng các file input (file trong concat list được tính từng file)"""
+    total = 0
+    for i, arg in enumerate(cmd[:-1]):
+        if arg != "-i":
+            continue
+        src = cmd[i + 1]
+        files = _read_concat_list(src) if "concat" in cmd[max(0, i - 4):i] else [src]
+        for f in files:
+            try:
+                total += os.path.getsize(f)
+            except OSError:
+                pass
+    return total
+
+
+def _output_path(cmd):
+    return cmd[-1] if cmd and not cmd[-1].startswith("-") else ""
+
+
+def _default_label(cmd):
+    """Tên file input đầu tiên (file tạm/cache thường có tên hash, khó đọc)"""
+    try:
+        return os.path.basename(cmd[cmd.index("-i") + 1])
+    except (ValueError, IndexError):
+        return os.path.basename(_output_path(cmd)) or "ffmpeg"
+
+
+class FfmpegJob:
+    """
+    1 tiến trình ffmpeg có theo dõi tiến trình.
+    start() -> (kill() nếu cần huỷ) -> wait() trả về dict metrics, lỗi thì
+    raise CalledProcessError.
+    """
+
+    def __init__(self, cmd, duration=None, label=None, on_progress=None, quiet=False,
+                 stdin=None, pipe_output=False):
+        self.cmd = list(cmd)
+        self.duration = duration if duration is not None else guess_output_duration(self.cmd)
+        self.label = label or _default_label(self.cmd)
+        self.on_progress = on_progress
+        self.quiet = quiet
+        self.stdin = stdin
+        self.pipe_output = pipe_output
+        self.proc = None
+        self.progress = {}
+        self._started_at = None
+        self._last_print = 0.0
+        self._rusage = None
+
+    def _full_cmd(self):
+        # stdout là dữ liệu media khi pipe_output -> không ghi tiến trình ra đó
+        extra = ["-nostats"] if self.pipe_output else ["-progress", "pipe:1", "-nostats"]
+        if self.quiet:
+            # Log gọn lại để output của nhiều tiến trình không lẫn vào nhau
+            extra = ["-hide_banner", "-loglevel", "error"] + extra
+        return [self.cmd[0]] + extra + self.cmd[1:]
+
+    def start(self):
+        print("⚙️ Run:", " ".join(shlex.quote(c) for c in self.cmd))
+        self._started_at = time.time()
+        stdin = self.stdin if self.stdin is not None else subprocess.DEVNULL
+        if self.pipe_output:
+            self.proc = subprocess.Popen(self._full_cmd(), stdin=stdin, stdout=subprocess.PIPE,
+                                         preexec_fn=_PREEXEC)
+        else:
+            self.proc = subprocess.Popen(self._full_cmd(), stdin=stdin, stdout=subprocess.PIPE,
+                                         text=True, encoding="utf-8", errors="replace", preexec_fn=_PREEXEC)
+        return self
+
+    def kill(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
+
+    def _publish(self, block):
+        elapsed = time.time() - self._started_at
+        out_time = None
+        for key in ("out_time_us", "out_time_ms"):  # cả 2 đều là micro giây
+            if block.get(key, "N/A") not in ("N/A", ""):
+                try:
+                    out_time = int(block[key]) / 1_000_000
+                    break
+                except ValueError:
+                    pass
+        if out_time is None:
+            out_time = _parse_time(block.get("out_time"))
+
+        try:
+            speed = float(block.get("speed", "").rstrip("x"))
+        except ValueError:
+            speed = None
+        try:
+            fps = float(block.get("fps", ""))
+        except ValueError:
+            fps = None
+
+        percent, eta = None, None
+        if self.duration and out_time is not None and out_time >= 0:
+            percent = min(100.0, out_time / self.duration * 100)
+            if out_time > 0:
+                eta = max(0.0, (self.duration - out_time) * elapsed / out_time)
+        if block.get("progress") == "end":
+            percent, eta = (100.0 if self.duration else None), 0.0
+
+        self.progress = {
+            "label": self.label,
+            "frame": int(block.get("frame", 0) or 0),
+            "fps": fps,
+            "speed": speed,
+            "out_time": out_time,
+            "duration": self.duration,
+            "percent": round(percent, 2) if percent is not None else None,
+            "eta": round(eta, 1) if eta is not None else None,
+            "elapsed": round(elapsed, 2),
+            "done": block.get("progress") == "end",
+        }
+
+        callbacks = [self.on_progress] if self.on_progress else []
+        with _listeners_lock:
+            callbacks += list(_listeners)
+        for cb in callbacks:
+            try:
+                cb(dict(self.progress))
+            except Exception as e:
+                print(f"⚠️ Lỗi trong progress callback: {e}")
+
+        now = time.time()
+        if now - self._last_print >= PRINT_INTERVAL and not self.progress["done"]:
+            self._last_print = now
+            pct = f"{self.progress['percent']:.1f}%" if percent is not None else "?%"
+            eta_txt = f"ETA {int(eta) // 60:02d}:{int(eta) % 60:02d}" if eta is not None else ""
+            print(f"⏳ {self.label}: {pct} | frame={self.progress['frame']} "
+                  f"fps={fps or 0:.1f} speed={speed or 0:.2f}x {eta_txt}")
+
+    def wait(self):
+        block = {}
+        # pipe_output: stdout thuộc về lệnh đọc, ở đây chỉ đợi tiến trình kết thúc
+        for line in (() if self.pipe_output else self.proc.stdout):
+            key, sep, value = line.strip().partition("=")
+            if not sep:
+                continue
+            block[key] = value
+            if key == "progress":
+                self._publish(block)
+                block = {}
+        returncode = self._reap()
+        metrics = self._record_metrics(returncode)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.cmd)
+        return metrics
+
+    def _reap(self):
+        """Đợi tiến trình kết thúc; dùng os.wait4 để lấy luôn CPU time của ffmpeg"""
+        if hasattr(os, "wait4") and self.proc.returncode is None:
+            try:
+                _, status, self._rusage = os.wait4(self.proc.pid, 0)
+                self.proc.returncode = os.waitstatus_to_exitcode(status)
+            except ChildProcessError:
+                # Đã được reap ở chỗ khác (vd: poll() trong kill) -> không có rusage
+                pass
+        return self.proc.wait()
+
+    def _record_metrics(self, returncode):
+        wall = time.time() - self._started_at
+        frames = self.progress.get("frame", 0)
+        out_time = self.progress.get("out_time") or 0
+        output = _output_path(self.cmd)
+        try:
+            bytes_written = os.path.getsize(output)
+        except OSError:
+            bytes_written = 0
+        cpu_user = cpu_sys = None
+        if self._rusage is not None:
+            cpu_user, cpu_sys = round(self._rusage.ru_utime, 3), round(self._rusage.ru_stime, 3)
+        metrics = {
+            "time": round(time.time(), 3),
+            "label": self.label,
+            "output": output,
+            "returncode": returncode,
+            "wall": round(wall, 3),
+            "cpu_user": cpu_user,
+            "cpu_sys": cpu_sys,
+            "bytes_read": _input_bytes(self.cmd),
+            "bytes_written": bytes_written,
+            "frames": frames,
+            "avg_fps": round(frames / wall, 2) if wall > 0 else None,
+            "speed": round(out_time / wall, 3) if wall > 0 and out_time else None,
+            "out_time": out_time,
+            "duration": self.duration,
+        }
+        try:
+            with _metrics_lock:
+                os.makedirs(os.path.dirname(FFMPEG_METRICS_LOG), exist_ok=True)
+                with open(FFMPEG_METRICS_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(metrics, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️ Không ghi được metrics ffmpeg: {e}")
+
+        with _listeners_lock:
+            callbacks = list(_metrics_listeners)
+        for cb in callbacks:
+            try:
+                cb(dict(metrics))
+            except Exception as e:
+                print(f"⚠️ Lỗi trong metrics callback: {e}")
+        return metrics
+
+
+def run_ffmpeg(cmd, duration=None, label=None, on_progress=None, quiet=False):
+    """Chạy 1 lệnh ffmpeg tới khi xong, trả về dict metrics (lỗi -> CalledProcessError)"""
+    return FfmpegJob(cmd, duration, label, on_progress, quiet).start().wait()
@@ -0,0 +1,191 @@
+"""
+File Cache - Cache file theo nội dung (content-addressed) trên đĩa
+
+- Mỗi entry là 1 file, tên file = key (sha256 hex), chia thư mục con theo
+  2 ký tự đầu của key để không dồn hàng nghìn file vào 1 thư mục.
+- Chỉ mục SQLite (index.sqlite3) lưu kích thước + thời điểm dùng gần nhất,
+  dùng để giới hạn dung lượng (max_bytes) và xoá theo LRU.
+- Ghi file qua reserve() -> put(): file tạm được os.replace vào chỗ, nên
+  tiến trình khác không bao giờ đọc phải file ghi dở.
+
+Sử dụng:
+    cache = FileCache(CACHE_DIR / "assets", max_bytes=2 * 1024**3)
+    key = make_key({"src": file_digest(path), "width": 1920})
+    out = cache.get(key, ".mp4")
+    if out is None:
+        tmp = cache.reserve(key, ".mp4")
+        ...  # ghi file vào tmp
+        out = cache.put(key, tmp, ".mp4")
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# File tạm (.part) cũ hơn mức này chắc chắn là của tiến trình đã chết -> được xoá
+PARTIAL_MAX_AGE = 6 * 3600
+
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+
+def make_key(parts):
+    """sha256 của một dict/list bất kỳ (JSON, sort key để ổn định)"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(file_path):
+    """Dấu vân tay rẻ của file: (đường dẫn tuyệt đối, size, mtime_ns)"""
+    abs_path = os.path.normcase(os.path.abspath(file_path))
+    st = os.stat(abs_path)
+    return abs_path, st.st_size, st.st_mtime_ns
+
+
+def file_digest(file_path):
+    """sha256 nội dung file (nhớ theo size + mtime trong phiên chạy)"""
+    fingerprint = file_fingerprint(file_path)
+    with _digest_lock:
+        if fingerprint in _digest_memo:
+            return _digest_memo[fingerprint]
+
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[fingerprint] = digest
+    return digest
+
+
+class FileCache:
+    def __init__(self, root, max_bytes=None):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(self.root, "index.sqlite3")
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    rel_path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def path_for(self, key, ext=""):
+        return os.path.join(self.root, key[:2], key + ext)
+
+    def get(self, key, ext=""):
+        """Đường dẫn file đã cache (và đánh dấu vừa dùng), hoặc None"""
+        path = self.path_for(key, ext)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT rel_path FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(path):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        return path
+
+    def reserve(self, key, ext=""):
+        """Đường dẫn file tạm (cùng thư mục với file đích) để ghi dữ liệu mới"""
+        shard_dir = os.path.join(self.root, key[:2])
+        os.makedirs(shard_dir, exist_ok=True)
+        # Giữ nguyên phần mở rộng để ffmpeg chọn đúng muxer
+        return os.path.join(shard_dir, f"{key}.{uuid.uuid4().hex[:8]}.part{ext}")
+
+    def put(self, key, tmp_path, ext="", protect=()):
+        """Đưa file tạm vào cache, ghi chỉ mục rồi dọn bớt nếu vượt dung lượng"""
+        path = self.path_for(key, ext)
+        os.replace(tmp_path, path)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, rel_path, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, os.path.relpath(path, self.root), os.path.getsize(path), time.time())
+            )
+            conn.commit()
+        self.evict(protect=set(protect) | {key})
+        return path
+
+    def discard(self, tmp_path):
+        """Xoá file tạm khi ghi lỗi"""
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def sweep_partials(self, max_age=PARTIAL_MAX_AGE):
+        """Xoá file tạm (reserve) bị bỏ lại khi tiến trình ghi chết giữa chừng. Trả về số file đã xoá."""
+        removed = 0
+        cutoff = time.time() - max_age
+        if not os.path.isdir(self.root):
+            return 0
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, name)
+                try:
+                    if ".part" in name and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def total_bytes(self):
+        with self._lock:
+            row = self._connect().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return row[0]
+
+    def evict(self, protect=()):
+        """Xoá các entry lâu không dùng nhất cho tới khi tổng dung lượng <= max_bytes"""
+        if not self.max_bytes:
+            return 0
+        removed = 0
+        with self._lock:
+            conn = self._connect()
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            rows = conn.execute("SELECT key, rel_path, size FROM entries ORDER BY last_used ASC").fetchall()
+            for key, rel_path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if key in protect:
+                    continue
+                try:
+                    os.remove(os.path.join(self.root, rel_path))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    # File đang bị tiến trình khác mở (Windows) -> để lần sau
+                    continue
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+            conn.commit()
+        return removed
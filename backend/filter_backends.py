@@ -0,0 +1,275 @@
+"""
+Filter Backends - Sinh filter graph dựng hình (nền blur + video chính + logo) cho CPU / GPU
+
+Trước đây clip decode bằng -hwaccel cuda nhưng scale / boxblur / overlay chạy
+trên CPU: mọi frame bị tải từ GPU về RAM rồi mới xử lý. Backend quyết định
+frame nằm ở đâu trong lúc dựng hình:
+    cpu    mọi filter chạy trên RAM (như trước) - backend mặc định; với
+           blur_quality "full" (mặc định) graph sinh ra giống hệt bản cũ
+    cuda   decode NVDEC, scale_cuda / overlay_cuda trên GPU NVIDIA
+    vaapi  decode VAAPI, scale_vaapi / overlay_vaapi (Intel / AMD trên Linux)
+Backend GPU giữ frame trên GPU ở mọi bước có filter tương ứng; nền blur thu
+nhỏ trên GPU, chỉ tải frame nhỏ về RAM để crop + boxblur (không có boxblur
+trên GPU) rồi đưa lên lại. Frame chỉ về RAM 1 lần trước khi encode.
+
+Cả renderer "segments" (từng clip) và "stream" (render plan) dựng hình qua
+cùng các hàm của backend -> đổi backend không phải sửa renderer.
+
+Chọn backend theo config kênh "filter_backend": cpu (mặc định) / auto / cuda /
+vaapi. auto = theo encoder profile ("gpu_type" của kênh, auto = encoder tốt
+nhất của máy): nvidia -> cuda, intel / amd -> vaapi, còn lại -> cpu. Backend
+không chạy được trên máy này (thiếu hwaccel / filter) -> cpu.
+Backend GPU phải bật riêng cho từng kênh: clip mà NVDEC / VAAPI không decode
+được (4:2:2, 10-bit, VP9 trên card cũ...) bị ffmpeg trả về frame RAM và graph
+GPU lỗi cả lệnh - khác -hwaccel cuda không kèm output format của backend cpu
+(tự lùi về decode CPU).
+
+Sử dụng:
+    from filter_backends import resolve_filter_backend
+
+    backend = resolve_filter_backend(config_dict)
+    cmd = ["ffmpeg"] + backend.global_args() + backend.input_args() + ["-i", src]
+    cmd += ["-filter_complex", ";".join(backend.clip_graph(1920, 1080, 30, 20, False))]
+"""
+
+import os
+import sys
+
+from consts import DEFAULT_BLUR_QUALITY, DEFAULT_BG_MODE, DEFAULT_FILTER_BACKEND
+from encoder_helper import best_gpu_type, get_encoder_caps, has_hw_filters, hwaccel_args
+
+# Chất lượng nền blur = hệ số thu nhỏ trước khi blur: blur ở độ phân giải thấp
+# (bán kính giảm theo) rồi phóng lại, nhìn gần như nhau vì ảnh nền đã nhoè
+BLUR_QUALITY_SCALES = {"full": 1, "high": 2, "medium": 4, "low": 8}
+
+BG_MODE_DYNAMIC = "dynamic"      # tính nền cho mọi frame
+BG_MODE_HOLD = "hold"            # tính nền bg_fps lần/giây, giữ nguyên frame giữa 2 lần
+BG_MODE_CROSSFADE = "crossfade"  # như hold nhưng hoà dần giữa 2 frame nền (framerate)
+BG_MODES = (BG_MODE_DYNAMIC, BG_MODE_HOLD, BG_MODE_CROSSFADE)
+
+# encoder profile (gpu_type) -> backend khi filter_backend = "auto"
+FILTER_BACKEND_BY_GPU = {"nvidia": "cuda", "intel": "vaapi", "amd": "vaapi"}
+
+HW_DEVICE_NAME = "fv"  # tên thiết bị GPU dùng chung cho decode + filter trong 1 lệnh
+VAAPI_DEVICE = "/dev/dri/renderD128"
+
+CENTER_X = "(W-w)/2"
+CENTER_Y = "(H-h)/2"
+
+
+def _join(*filters):
+    return ",".join(f for f in filters if f)
+
+
+class FilterBackend:
+    """Backend CPU: decode như cũ (hwaccel_args), mọi filter chạy trên RAM"""
+
+    name = "cpu"
+    on_device = False
+    needs_filters = ()  # filter GPU phải có trong ffmpeg (encoder_helper.HW_FILTERS)
+
+    def available(self):
+        return True
+
+    def global_args(self):
+        """Tham số toàn cục, đặt 1 lần trước mọi input (khởi tạo thiết bị GPU)"""
+        return []
+
+    def input_args(self):
+        """Tham số đặt trước -i của video nguồn"""
+        return hwaccel_args()
+
+    # --- Các filter cơ bản: backend GPU đổi sang filter tương ứng ---
+
+    def scale(self, width, height, fit=None, divisible=None, fast=False):
+        opts = [str(width), str(height)]
+        if fit:
+            opts.append(f"force_original_aspect_ratio={fit}")
+        if divisible:
+            opts.append(f"force_divisible_by={divisible}")
+        if fast:
+            opts.append("flags=bilinear")
+        return "scale=" + ":".join(opts)
+
+    def overlay(self, x, y):
+        return f"overlay={x}:{y}"
+
+    def upload(self, alpha=False):
+        """Frame trên RAM -> bộ nhớ của backend ("" = đã ở đúng chỗ)"""
+        return ""
+
+    def download(self):
+        """Frame của backend -> RAM, trước filter chỉ có trên CPU / encoder"""
+        return ""
+
+    # --- Graph dựng hình, dùng chung cho mọi backend ---
+
+    def background(self, width, height, blur_radius, blur_power=1, background=None, fps=None):
+        """
+        Chuỗi filter nền: phủ kín width x height + boxblur.
+        background: background_options() của kênh (quality / mode / fps)
+        - quality="full": blur ở độ phân giải đầy đủ, các mức khác:
+          thu nhỏ -> blur -> phóng lại (nhanh hơn nhiều với bán kính lớn)
+        - mode hold/crossfade (cần fps đầu ra): chỉ lấy mẫu nền bg_fps frame/giây
+          để scale + blur, sau đó nhân lại đủ `fps` - video chính vẫn đủ mọi frame
+        Backend GPU: scale trên GPU, crop + boxblur (+ framerate) trên RAM.
+        """
+        background = background or {}
+        quality = background.get("quality", DEFAULT_BLUR_QUALITY)
+        factor = BLUR_QUALITY_SCALES.get(quality)
+        if factor is None:
+            print(f"⚠️ blur_quality không hợp lệ: {quality}, dùng '{DEFAULT_BLUR_QUALITY}'")
+            factor = BLUR_QUALITY_SCALES[DEFAULT_BLUR_QUALITY]
+        mode = background.get("mode", DEFAULT_BG_MODE)
+        if mode not in BG_MODES:
+            print(f"⚠️ bg_mode không hợp lệ: {mode}, dùng '{DEFAULT_BG_MODE}'")
+            mode = DEFAULT_BG_MODE
+        bg_fps = background.get("fps")
+        if not fps or not bg_fps or float(bg_fps) >= float(fps):
+            mode = BG_MODE_DYNAMIC
+
+        sample = f"fps={bg_fps}" if mode != BG_MODE_DYNAMIC else ""
+        # Hoà giữa các frame nền ở độ phân giải thấp (trước khi phóng lại) cho rẻ
+        crossfade = f"framerate=fps={fps}" if mode == BG_MODE_CROSSFADE else ""
+        hold = f"fps={fps}" if mode == BG_MODE_HOLD else ""
+
+        if factor == 1:
+            return _join(sample, self.scale(width, height, "increase"), self.download(),
+                         f"crop={width}:{height}", f"boxblur={blur_radius}:{blur_power}", crossfade,
+                         self.upload(), hold)
+
+        w = max(2, width // factor // 2 * 2)
+        h = max(2, height // factor // 2 * 2)
+        # boxblur giới hạn bán kính theo plane chroma (1/2 kích thước với yuv420p)
+        radius = min(int(round(float(blur_radius) / factor)), min(w, h) // 4)
+        blur = f"boxblur={radius}:{blur_power}" if radius > 0 else ""
+        return _join(sample, self.scale(w, h, "increase"), self.download(), f"crop={w}:{h}", blur,
+                     crossfade, self.upload(), self.scale(width, height, fast=True), hold)
+
+    def composite(self, src, width, height, fps, blur_radius, background=None,
+                  fg_width=-2, divisible=None, suffix=""):
+        """
+        Nền blur + video chính ở giữa. src: đầu chuỗi filter của video nguồn
+        (vd "[0:v]" hoặc "[3:v]fps=30,"). Trả về (chains, label) - frame của
+        label vẫn ở bộ nhớ của backend (cần download() trước filter CPU).
+        """
+        return [
+            f"{src}split=2[bg{suffix}][fg{suffix}]",
+            f"[bg{suffix}]{self.background(width, height, blur_radius, 1, background, fps)}[bg_blur{suffix}]",
+            f"[fg{suffix}]{self.scale(fg_width, height, 'decrease', divisible)}[fg_scaled{suffix}]",
+            f"[bg_blur{suffix}][fg_scaled{suffix}]{self.overlay(CENTER_X, CENTER_Y)}[composed{suffix}]",
+        ], f"[composed{suffix}]"
+
+    def clip_graph(self, width, height, fps, blur_amount, with_logo, background=None):
+        """Filter graph render 1 clip (input 0 = video, input 1 = logo) -> [outv] yuv420p trên RAM"""
+        chains, current = self.composite("[0:v]", width, height, fps, blur_amount, background)
+        if with_logo:
+            logo = "[1:v]"
+            upload = self.upload(alpha=True)
+            if upload:
+                chains.append(f"[1:v]{upload}[logo]")
+                logo = "[logo]"
+            chains.append(
+                f"{current}{logo}{self.overlay('(main_w-overlay_w)/2', '(main_h-overlay_h)/2')}[with_logo]"
+            )
+            current = "[with_logo]"
+        chains.append(f"{current}{_join(self.download(), f'fps={fps}', 'setsar=1', 'format=yuv420p')}[outv]")
+        return chains
+
+
+class CudaBackend(FilterBackend):
+    """NVDEC + scale_cuda / overlay_cuda, frame yuv420p trên GPU NVIDIA"""
+
+    name = "cuda"
+    on_device = True
+    needs_filters = ("scale_cuda", "overlay_cuda")
+    sw_format = "yuv420p"  # overlay_cuda cần nền và lớp trên cùng họ yuv420p (logo: yuva420p)
+
+    def available(self):
+        return "cuda" in get_encoder_caps()["hwaccels"] and has_hw_filters(*self.needs_filters)
+
+    def global_args(self):
+        return ["-init_hw_device", f"cuda={HW_DEVICE_NAME}", "-filter_hw_device", HW_DEVICE_NAME]
+
+    def input_args(self):
+        return ["-hwaccel", "cuda", "-hwaccel_device", HW_DEVICE_NAME, "-hwaccel_output_format", "cuda"]
+
+    def scale(self, width, height, fit=None, divisible=None, fast=False):
+        opts = [str(width), str(height)]
+        if fit:
+            opts.append(f"force_original_aspect_ratio={fit}")
+        if divisible:
+            opts.append(f"force_divisible_by={divisible}")
+        if fast:
+            opts.append("interp_algo=bilinear")
+        return "scale_cuda=" + ":".join(opts + [f"format={self.sw_format}"])
+
+    def overlay(self, x, y):
+        return f"overlay_cuda=x={x}:y={y}"
+
+    def upload(self, alpha=False):
+        return f"format={'yuva420p' if alpha else self.sw_format},hwupload"
+
+    def download(self):
+        return f"hwdownload,format={self.sw_format}"
+
+
+class VaapiBackend(CudaBackend):
+    """VAAPI decode + scale_vaapi / overlay_vaapi (Intel / AMD trên Linux), frame nv12"""
+
+    name = "vaapi"
+    needs_filters = ("scale_vaapi", "overlay_vaapi")
+    sw_format = "nv12"
+
+    def available(self):
+        return (sys.platform.startswith("linux") and os.path.exists(VAAPI_DEVICE)
+                and "vaapi" in get_encoder_caps()["hwaccels"] and has_hw_filters(*self.needs_filters))
+
+    def global_args(self):
+        return ["-init_hw_device", f"vaapi={HW_DEVICE_NAME}:{VAAPI_DEVICE}", "-filter_hw_device", HW_DEVICE_NAME]
+
+    def input_args(self):
+        return ["-hwaccel", "vaapi", "-hwaccel_device", HW_DEVICE_NAME, "-hwaccel_output_format", "vaapi"]
+
+    def scale(self, width, height, fit=None, divisible=None, fast=False):
+        opts = [str(width), str(height)]
+        if fit:
+            opts.append(f"force_original_aspect_ratio={fit}")
+        if divisible:
+            opts.append(f"force_divisible_by={divisible}")
+        if fast:
+            opts.append("mode=fast")
+        return "scale_vaapi=" + ":".join(opts + [f"format={self.sw_format}"])
+
+    def overlay(self, x, y):
+        return f"overlay_vaapi=x={x}:y={y}"
+
+    def upload(self, alpha=False):
+        # Surface VAAPI không có yuva420p: logo có alpha đưa lên dạng RGBA
+        return f"format={'rgba' if alpha else self.sw_format},hwupload"
+
+
+CPU_BACKEND = FilterBackend()
+FILTER_BACKENDS = {b.name: b for b in (CPU_BACKEND, CudaBackend(), VaapiBackend())}
+
+
+def resolve_filter_backend(config_dict=None):
+    """Backend filter của config kênh ("filter_backend", mặc định cpu, auto = theo gpu_type), không dùng được -> cpu"""
+    config_dict = config_dict or {}
+    name = str(config_dict.get("filter_backend") or DEFAULT_FILTER_BACKEND).lower()
+    auto = name == "auto"
+    if auto:
+        gpu_type = str(config_dict.get("gpu_type") or "auto").lower()
+        if gpu_type == "auto":
+            gpu_type = best_gpu_type()
+        name = FILTER_BACKEND_BY_GPU.get(gpu_type, CPU_BACKEND.name)
+
+    backend = FILTER_BACKENDS.get(name)
+    if backend is None:
+        print(f"⚠️ filter_backend không hợp lệ: {name}, dùng 'cpu'")
+        return CPU_BACKEND
+    if not backend.available():
+        if not auto:
+            print(f"⚠️ filter_backend '{name}' không chạy được trên máy này, dùng 'cpu'")
+        return CPU_BACKEND
+    return backend
@@ -1,8 +1,9 @@
 import json
-import cv2
-from PIL import Image
 import subprocess
+import sys
 from consts import *
+from media_index import probe_media, probe_media_many
+from thumbnail_engine import make_thumbnails
 import platform
 
 def read_all_folder_name(folder_path):
@@ -48,73 +49,36 @@ def get_video_info(file_path):
     - duration (giây)
     - thumbnail (đường dẫn)
     - width, height của video
+    Metadata đọc từ media index (không probe lại file đã biết).
     """
-    try:
-        video = cv2.VideoCapture(file_path)
-        if not video.isOpened():
-            return 0, None, 0, 0
-
-        # Lấy kích thước video
-        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-        # Lấy thời lượng
-        frame_count = video.get(cv2.CAP_PROP_FRAME_COUNT)
-        fps = video.get(cv2.CAP_PROP_FPS)
-        duration = frame_count / fps if fps > 0 else 0
+    return get_videos_info([file_path])[file_path]
 
-        # Tạo thumbnail từ frame đầu tiên
-        ret, frame = video.read()
-        thumb_path = None
-        if ret:
-            TEMP_DIR.mkdir(exist_ok=True)
 
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
-            img.thumbnail(THUMBNAIL_SIZE)
-
-            base_filename = os.path.basename(file_path)
-            thumb_filename = f"thumb_{base_filename}.png"
-            thumb_path = TEMP_DIR / thumb_filename
-            img.save(thumb_path)
+def get_videos_info(file_paths):
+    """
+    get_video_info cho nhiều file 1 lần: thumbnail tạo theo batch
+    (thumbnail_engine). Trả về {path: (duration, thumb_path, width, height)}
+    """
+    infos = probe_media_many(file_paths)
+    thumbs = make_thumbnails([p for p in file_paths if infos.get(p)])
+    result = {}
+    for path in file_paths:
+        info = infos.get(path)
+        if not info:
+            result[path] = (0, None, 0, 0)
+        else:
+            result[path] = (info["duration"], thumbs.get(path), info["width"], info["height"])
+    return result
 
-        video.release()
-        return duration, str(thumb_path), width, height
 
-    except Exception as e:
-        print(f"Lỗi khi xử lý video {file_path}: {e}")
-        return 0, None, 0, 0
 def get_pixel_aspect_ratio(file_path):
     """
     Trả về pixel aspect ratio (float)
     Mặc định = 1.0 nếu không xác định
     """
-    try:
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=sample_aspect_ratio",
-            "-of", "json",
-            file_path
-        ]
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        data = json.loads(result.stdout)
-        sar = data["streams"][0].get("sample_aspect_ratio", "1:1")
-
-        if sar and sar != "0:1":
-            num, den = sar.split(":")
-            return float(num) / float(den)
-
-    except Exception:
-        pass
-
+    info = probe_media(file_path)
+    if info and info["sar"]:
+        return info["sar"]
     return 1.0
 
 def open_file_cross_platform(path):
@@ -127,4 +91,30 @@ def open_file_cross_platform(path):
         else:  # Linux, Ubuntu, v.v.
             subprocess.Popen(["xdg-open", path])
     except Exception as e:
-        print(f"Lỗi khi mở file: {e}")
\ No newline at end of file
+        print(f"Lỗi khi mở file: {e}")
+
+
+def notify(kind, title, message):
+    """
+    Thông báo cho người dùng: luôn in ra console, và hiện messagebox
+    (kind = "info" / "warning" / "error") nếu app Tk đang chạy.
+    Chạy headless (không import tkinter) thì chỉ in.
+    """
+    print(f"{title}: {message}")
+    tk = sys.modules.get("tkinter")
+    root = getattr(tk, "_default_root", None) if tk else None
+    if not root:
+        return
+
+    from tkinter import messagebox
+    show = {"info": messagebox.showinfo,
+            "warning": messagebox.showwarning,
+            "error": messagebox.showerror}[kind]
+    # Tìm cửa sổ con đang mở để messagebox hiển thị phía trên
+    for widget in root.winfo_children():
+        if isinstance(widget, tk.Toplevel) and widget.winfo_exists():
+            widget.attributes('-topmost', True)
+            show(title, message, parent=widget)
+            widget.attributes('-topmost', False)
+            return
+    show(title, message)
@@ -11,7 +11,7 @@ from editor_ui import EditorWindow, load_json, get_used_videos_path
 from clip_selector import select_clips
 from render_history_window import ClipViewerApp
 from video_manager_ui import open_video_manager
-from helper import get_video_info
+from helper import get_videos_info
 
 # --- Quản lý đường dẫn ---
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -249,9 +249,11 @@ class ChannelSelectorApp(Tk):
         # Load logic
         used_videos = load_json(get_used_videos_path(selected_channel_name))
         selected = select_clips(selected_topic, target_time, used_videos)
+        # Probe + tạo thumbnail theo batch cho mọi clip (thumbnail_engine)
+        video_infos = get_videos_info([clip["path"] for clip in selected])
         for clip in selected:
             duration = clip["duration"]
-            thumb_duration, thumb_path, width, height = get_video_info(clip["path"])
+            thumb_duration, thumb_path, width, height = video_infos[clip["path"]]
             if thumb_duration > 0 and thumb_path:
                 editor.imported_clips.append({
                     "path": clip["path"],
@@ -0,0 +1,250 @@
+"""
+Media Index - Chỉ mục metadata video lưu trên đĩa (SQLite)
+
+Mỗi file chỉ cần probe (ffprobe) một lần. Kết quả được lưu trong
+Cache/media_index.sqlite3, khoá theo đường dẫn + kích thước + mtime:
+file bị sửa/ghi đè thì tự probe lại.
+
+Sử dụng:
+    from media_index import probe_media, probe_media_many
+
+    info = probe_media("clip.mp4")
+    # {"duration": 12.5, "fps": 30.0, "width": 1920, "height": 1080,
+    #  "sar": 1.0, "codec": "h264", "pix_fmt": "yuv420p", "profile": "High",
+    #  "has_audio": True}
+
+    # Probe song song nhiều file (chỉ các file chưa có trong index)
+    infos = probe_media_many(paths)
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from consts import MEDIA_INDEX_DB
+
+FFPROBE_EXEC = "ffprobe"
+
+# Tăng số này khi thay đổi cột/ý nghĩa dữ liệu -> index cũ sẽ được tạo lại
+SCHEMA_VERSION = 2
+
+# Số tiến trình ffprobe chạy song song khi probe nhiều file
+PROBE_WORKERS = 8
+
+MEDIA_FIELDS = ("duration", "fps", "width", "height", "sar", "codec", "pix_fmt", "profile", "has_audio")
+
+
+def _parse_ratio(value, default):
+    """'30000/1001' -> 29.97, '16:9' -> 1.777..., lỗi -> default"""
+    try:
+        for sep in ("/", ":"):
+            if sep in value:
+                num, den = value.split(sep)
+                num, den = float(num), float(den)
+                return num / den if num > 0 and den > 0 else default
+        return float(value)
+    except Exception:
+        return default
+
+
+def _probe_with_ffprobe(file_path):
+    cmd = [
+        FFPROBE_EXEC,
+        "-v", "error",
+        "-show_entries",
+        "stream=codec_type,codec_name,profile,pix_fmt,width,height,r_frame_rate,sample_aspect_ratio,duration:format=duration",
+        "-of", "json",
+        file_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout)
+
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        return None
+    format_info = data.get("format", {})
+
+    duration = _parse_ratio(str(video.get("duration") or format_info.get("duration") or 0), 0.0)
+    return {
+        "duration": duration,
+        "fps": _parse_ratio(video.get("r_frame_rate", "0/1"), 0.0),
+        "width": int(video.get("width", 0)),
+        "height": int(video.get("height", 0)),
+        "sar": _parse_ratio(video.get("sample_aspect_ratio", "1:1"), 1.0),
+        "codec": video.get("codec_name", ""),
+        "pix_fmt": video.get("pix_fmt", ""),
+        "profile": video.get("profile", ""),
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+def _probe_with_cv2(file_path):
+    """Dự phòng khi máy không có ffprobe (không biết SAR/codec/audio)"""
+    import cv2
+
+    video = cv2.VideoCapture(file_path)
+    try:
+        if not video.isOpened():
+            return None
+        fps = video.get(cv2.CAP_PROP_FPS)
+        frame_count = video.get(cv2.CAP_PROP_FRAME_COUNT)
+        return {
+            "duration": frame_count / fps if fps > 0 else 0.0,
+            "fps": fps,
+            "width": int(video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "sar": 1.0,
+            "codec": "",
+            "pix_fmt": "",
+            "profile": "",
+            "has_audio": False,
+        }
+    finally:
+        video.release()
+
+
+def probe_file(file_path):
+    """Probe trực tiếp (không qua index). Trả về dict hoặc None nếu lỗi."""
+    try:
+        return _probe_with_ffprobe(file_path)
+    except FileNotFoundError:
+        # Không có ffprobe trong PATH
+        try:
+            return _probe_with_cv2(file_path)
+        except Exception as e:
+            print(f"⚠️ Không thể probe video {file_path}: {e}")
+            return None
+    except Exception as e:
+        print(f"⚠️ Không thể probe video {file_path}: {e}")
+        return None
+
+
+class MediaIndex:
+    def __init__(self, db_path=MEDIA_INDEX_DB):
+        self.db_path = str(db_path)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS media")
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS media (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    duration REAL,
+                    fps REAL,
+                    width INTEGER,
+                    height INTEGER,
+                    sar REAL,
+                    codec TEXT,
+                    pix_fmt TEXT,
+                    profile TEXT,
+                    has_audio INTEGER
+                )
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _file_key(file_path):
+        """(đường dẫn tuyệt đối, size, mtime_ns) hoặc None nếu file không tồn tại"""
+        try:
+            abs_path = os.path.normcase(os.path.abspath(file_path))
+            st = os.stat(abs_path)
+            return abs_path, st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def _lookup(self, keys):
+        """Trả về {abs_path: info} cho các key còn hợp lệ trong index"""
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for abs_path, size, mtime_ns in keys:
+                row = conn.execute(
+                    f"SELECT size, mtime_ns, {', '.join(MEDIA_FIELDS)} FROM media WHERE path = ?",
+                    (abs_path,)
+                ).fetchone()
+                if row and row[0] == size and row[1] == mtime_ns:
+                    info = dict(zip(MEDIA_FIELDS, row[2:]))
+                    info["has_audio"] = bool(info["has_audio"])
+                    found[abs_path] = info
+        return found
+
+    def _store(self, entries):
+        """entries: list[(key, info)]"""
+        if not entries:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                f"INSERT OR REPLACE INTO media (path, size, mtime_ns, {', '.join(MEDIA_FIELDS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in MEDIA_FIELDS)})",
+                [key + tuple(info[f] for f in MEDIA_FIELDS) for key, info in entries]
+            )
+            conn.commit()
+
+    def get(self, file_path):
+        return self.get_many([file_path]).get(file_path)
+
+    def get_many(self, file_paths, max_workers=PROBE_WORKERS):
+        """
+        Lấy metadata cho nhiều file. File chưa có (hoặc đã thay đổi) được
+        probe song song rồi ghi vào index trong một transaction.
+
+        Returns:
+            dict {file_path: info | None}
+        """
+        keys = {}
+        for p in file_paths:
+            if p not in keys:
+                keys[p] = self._file_key(p)
+
+        valid_keys = [k for k in keys.values() if k is not None]
+        found = self._lookup(valid_keys)
+
+        missing = list({k for k in valid_keys if k[0] not in found})
+        if missing:
+            workers = max(1, min(max_workers, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                probed = list(pool.map(lambda k: probe_file(k[0]), missing))
+            new_entries = [(k, info) for k, info in zip(missing, probed) if info]
+            self._store(new_entries)
+            for k, info in new_entries:
+                found[k[0]] = info
+
+        return {p: (dict(found[k[0]]) if k and k[0] in found else None) for p, k in keys.items()}
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_media_index():
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = MediaIndex()
+        return _default_index
+
+
+def probe_media(file_path):
+    """Metadata của 1 file (qua index). None nếu không đọc được."""
+    return get_media_index().get(file_path)
+
+
+def probe_media_many(file_paths):
+    """Metadata của nhiều file (qua index, probe song song phần còn thiếu)."""
+    return get_media_index().get_many(file_paths)
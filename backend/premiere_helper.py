@@ -25,10 +25,11 @@ from xml.dom import minidom
 import uuid
 from datetime import datetime
 import urllib.parse
-import subprocess
 from xml_helper import add_audio_source_track, add_codec, add_rate
 from consts import CODEC_NAME
-from helper import get_pixel_aspect_ratio, get_video_info
+from helper import get_pixel_aspect_ratio
+from media_index import probe_media, probe_media_many
+from render_plan import compile_plan, frames_to_seconds, round_frames
 
 PPRO_TICKS_PER_SECOND = 254_016_000_000
 
@@ -36,7 +37,7 @@ def seconds_to_ticks(seconds: float) -> int:
     return int(seconds * PPRO_TICKS_PER_SECOND)
 
 def frames_to_ticks(frames: int, fps: float) -> int:
-    return int(frames / fps * PPRO_TICKS_PER_SECOND)
+    return int(frames_to_seconds(frames, fps) * PPRO_TICKS_PER_SECOND)
 
 
 def encode_path_for_premiere(path):
@@ -92,8 +93,8 @@ def encode_path_for_xml(path):
 
 
 def get_duration_frames(duration_seconds, fps):
-    """Chuyển đổi giây sang số frames"""
-    return int(duration_seconds * fps)
+    """Chuyển đổi giây sang số frames (làm tròn như render_plan, không cắt phần lẻ)"""
+    return round_frames(duration_seconds or 0, fps)
 
 
 def get_timecode(frames, fps):
@@ -445,20 +446,12 @@ def generate_premiere_xml(config_path, output_xml_path=None):
     sequence_uuid.text = str(uuid.uuid4())
     
 
-    # Duration - tính tổng duration
-    total_duration = 0
-    for clip in clips:
-        clip_duration = clip.get('duration', 0)
-        if not clip_duration:
-            video_layer = next((l for l in clip.get('layers', []) if l['type'] == 'video'), None)
-            if video_layer:
-                cut_from = video_layer.get('cutFrom', 0)
-                cut_to = video_layer.get('cutTo', 0)
-                clip_duration = cut_to - cut_from if cut_to else 0
-        total_duration += clip_duration
+    # Duration - timeline theo frame từ render plan (cùng cách tính với các renderer)
+    plan = compile_plan(config, fps)
+    total_duration = plan.duration
     
     duration_elem = ET.SubElement(sequence, 'duration')
-    duration_elem.text = str(get_duration_frames(total_duration, fps))
+    duration_elem.text = str(plan.total_frames)
     
     # Rate
     rate = ET.SubElement(sequence, 'rate')
@@ -630,9 +623,13 @@ def generate_premiere_xml(config_path, output_xml_path=None):
             label2.text = "Iris"
     logo_path = ""
     trans_path = ""
+    # Probe trước toàn bộ video (song song, qua media index)
+    probe_media_many([l['path'] for c in clips for l in c.get('layers', []) if l['type'] == 'video'])
     for clip_idx, clip in enumerate(clips):
         layers = clip.get('layers', [])
-        clip_duration = clip.get('duration', 0)
+        segment = plan.segments[clip_idx]
+        clip_duration = segment['duration']
+        current_frame = segment['start_frame']
         
         # Tìm main video/fill-color layer
         video_layer = next((l for l in layers if l['type'] == 'video'), None)
@@ -663,11 +660,12 @@ def generate_premiere_xml(config_path, output_xml_path=None):
         if video_layer:
             path = video_layer['path']
             blur = video_layer['blur']
-            thumb_duration, thumb_path, video_width, video_height = get_video_info(path)
+            media_info = probe_media(path) or {}
+            video_width = media_info.get("width", 0)
+            video_height = media_info.get("height", 0)
             pixel_aspect_ratio = get_pixel_aspect_ratio(path)
             cut_from = video_layer.get('cutFrom', 0)
             cut_to = video_layer.get('cutTo', 0)
-            clip_duration = cut_to - cut_from if cut_to else 0
             
             # Thêm vào media files
             if path not in media_files:
@@ -823,8 +821,6 @@ def generate_premiere_xml(config_path, output_xml_path=None):
             add_links(audio_track2_clipitem, source_clip_video_id, 1, source_clip_audio_id1, 1, source_clip_audio_id2, 2)
 
             create_log_and_color_element(source_clip)
-        elif fill_color:
-            clip_duration = clip.get('duration', 0.1)
         
         # Xử lý overlay layers (logo, transition)
         for layer in layers:
@@ -991,7 +987,6 @@ def generate_premiere_xml(config_path, output_xml_path=None):
                     add_marker(trans_item_track_a4)
                     create_log_and_color_element(trans_item_track_a4, False)
                     is_set_track_a4 = True
-        current_frame += get_duration_frames(clip_duration, fps)
     
     
     ET.SubElement(track_v1, 'enabled').text = 'TRUE'
@@ -1174,49 +1169,20 @@ if __name__ == "__main__":
 
 def probe_video_info(video_path):
     """
-    Lấy thông tin video bằng ffprobe: duration, width, height, fps
+    Lấy thông tin video từ media index: duration, width, height, fps
     """
-    try:
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=width,height,r_frame_rate,duration",
-            "-show_entries", "format=duration",
-            "-of", "json",
-            video_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        
-        # Lấy thông tin từ stream
-        stream = data.get("streams", [{}])[0] if data.get("streams") else {}
-        format_info = data.get("format", {})
-        
-        width = stream.get("width", 1920)
-        height = stream.get("height", 1080)
-        
-        # Parse fps từ r_frame_rate (ví dụ: "30/1" hoặc "30000/1001")
-        fps_str = stream.get("r_frame_rate", "30/1")
-        if "/" in fps_str:
-            num, den = map(float, fps_str.split("/"))
-            fps = num / den if den != 0 else 30
-        else:
-            fps = float(fps_str)
-        
-        # Lấy duration
-        duration = float(stream.get("duration", 0) or format_info.get("duration", 0))
-        
-        return {
-            "width": width,
-            "height": height,
-            "fps": fps,
-            "duration": duration
-        }
-    except Exception as e:
-        print(f"⚠️ Không thể probe video {video_path}: {e}")
+    info = probe_media(video_path)
+    if not info:
+        print(f"⚠️ Không thể probe video {video_path}")
         return {"width": 1920, "height": 1080, "fps": 30, "duration": 0}
 
+    return {
+        "width": info["width"] or 1920,
+        "height": info["height"] or 1080,
+        "fps": info["fps"] or 30,
+        "duration": info["duration"]
+    }
+
 
 def tc_to_frames(tc: str, fps: int) -> int:
     """HH:MM:SS:FF -> frames"""
@@ -0,0 +1,479 @@
+"""
+Process Manager - Quản lý mọi tiến trình ffmpeg của render_helper (asyncio)
+
+- 1 event loop asyncio chạy trong thread nền. run()/run_many() (render_helper
+  gọi qua run/run_parallel) gửi lệnh vào loop, giới hạn số lệnh song song
+  bằng Semaphore; ffmpeg vẫn chạy qua FfmpegJob (tiến trình, metrics).
+- Huỷ: cancel() kill mọi ffmpeg đang chạy, lệnh đang chờ/lệnh sau đó raise
+  RenderCancelled (các khối finally của render vẫn dọn file tạm).
+- run_pipe(): 2 lệnh ffmpeg nối bằng pipe (file dùng 1 lần như video concat
+  trước khi mux không cần ghi ra đĩa).
+- run_stream(): nhiều lệnh nguồn chạy song song, output của từng lệnh được
+  đệm trong hàng đợi có giới hạn rồi ghi lần lượt (đúng thứ tự) vào các
+  FIFO mà 1 lệnh đích đọc - bộ nhớ tối đa workers * STREAM_QUEUE_CHUNKS chunk.
+- Tạm dừng: pause() -> lệnh ffmpeg tiếp theo (ranh giới segment/giai đoạn)
+  chờ tới khi resume(); lệnh đang chạy vẫn chạy nốt.
+- Thoát: atexit + SIGTERM (install_signal_handlers) kill toàn bộ ffmpeg con.
+  Trên Linux ffmpeg được tạo với PR_SET_PDEATHSIG (ffmpeg_runner) nên cũng
+  chết theo khi interpreter bị kill -9.
+- File/thư mục tạm đăng ký qua scratch(): lỗi/huỷ -> xoá ngay; tiến trình
+  chết giữa chừng -> lần khởi động sau cleanup_stale_scratch() xoá (chỉ
+  các mục của tiến trình đã chết trên cùng máy).
+
+Sử dụng:
+    from process_manager import get_process_manager, scratch, RenderCancelled
+
+    manager = get_process_manager()
+    with scratch(temp_dir):
+        os.makedirs(temp_dir)
+        manager.run_many(cmds, workers=4)
+    # từ thread khác / lệnh "cancel" của worker:
+    manager.cancel()
+"""
+
+import asyncio
+import atexit
+import errno
+import json
+import os
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from consts import SCRATCH_REGISTRY_DIR
+from ffmpeg_runner import FfmpegJob
+
+PAUSE_POLL = 0.2  # giây, chu kỳ kiểm tra resume/cancel khi đang tạm dừng
+WAIT_THREADS = 64  # thread chờ ffmpeg kết thúc (mỗi lệnh đang chạy giữ 1 thread)
+STREAM_CHUNK = 256 * 1024  # byte mỗi lần đọc stdout của lệnh nguồn (run_stream)
+STREAM_QUEUE_CHUNKS = 32  # chunk tối đa đệm cho mỗi lệnh nguồn (~8 MB), đầy -> lệnh nguồn chờ
+FIFO_OPEN_POLL = 0.05  # giây, chờ lệnh đích mở FIFO tiếp theo
+
+
+class RenderCancelled(Exception):
+    """Render bị huỷ bằng cancel() (không phải lỗi ffmpeg)"""
+
+
+class ProcessManager:
+    def __init__(self):
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._jobs = set()
+        self._jobs_lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        atexit.register(self.kill_all)
+
+    # --- event loop nền ---
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(ThreadPoolExecutor(WAIT_THREADS, thread_name_prefix="ffmpeg-wait"))
+                threading.Thread(target=loop.run_forever, name="process-manager", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def _submit(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        try:
+            return future.result()
+        except BaseException:
+            # Ctrl+C / SystemExit ở thread gọi -> không để ffmpeg chạy tiếp
+            if not future.done():
+                future.cancel()
+                self.kill_all()
+            raise
+
+    # --- điều khiển ---
+    @property
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def is_paused(self):
+        return not self._resumed.is_set()
+
+    def cancel(self):
+        if not self._cancelled.is_set():
+            print("🛑 Đang huỷ render...")
+        self._cancelled.set()
+        self._resumed.set()
+        self.kill_all()
+
+    def pause(self):
+        if self._resumed.is_set() and not self._cancelled.is_set():
+            print("⏸️ Tạm dừng render (sau khi các lệnh đang chạy xong)")
+            self._resumed.clear()
+
+    def resume(self):
+        if not self._resumed.is_set():
+            print("▶️ Tiếp tục render")
+        self._resumed.set()
+
+    def reset(self):
+        """Cho phép render tiếp sau 1 lần cancel() (cùng tiến trình)"""
+        self._cancelled.clear()
+        self._resumed.set()
+
+    def checkpoint(self):
+        """Ranh giới giữa 2 giai đoạn: chờ nếu đang tạm dừng, raise nếu đã huỷ"""
+        while not self._resumed.wait(PAUSE_POLL):
+            pass
+        if self._cancelled.is_set():
+            raise RenderCancelled("Render đã bị huỷ")
+
+    async def _checkpoint(self):
+        while not self._resumed.is_set():
+            await asyncio.sleep(PAUSE_POLL)
+        if self._cancelled.is_set():
+            raise RenderCancelled("Render đã bị huỷ")
+
+    def kill_all(self):
+        with self._jobs_lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.kill()
+
+    # --- chạy lệnh ---
+    async def _run_job(self, cmd, duration=None, label=None, on_progress=None, quiet=False, group=None):
+        await self._checkpoint()
+        with self._jobs_lock:
+            if self._cancelled.is_set():
+                raise RenderCancelled("Render đã bị huỷ")
+            # Tạo tiến trình trên thread của loop (sống suốt tiến trình) -> PDEATHSIG không bắn nhầm
+            job = FfmpegJob(cmd, duration, label, on_progress, quiet).start()
+            self._jobs.add(job)
+        if group is not None:
+            group.add(job)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, job.wait)
+        except subprocess.CalledProcessError:
+            if self._cancelled.is_set():
+                raise RenderCancelled("Render đã bị huỷ") from None
+            raise
+        finally:
+            with self._jobs_lock:
+                self._jobs.discard(job)
+
+    async def _run_many(self, cmds, workers):
+        semaphore = asyncio.Semaphore(workers)
+        group = set()
+        quiet = workers > 1
+
+        async def _one(cmd):
+            async with semaphore:
+                return await self._run_job(cmd, quiet=quiet, group=group)
+
+        tasks = [asyncio.ensure_future(_one(cmd)) for cmd in cmds]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        error = next((t.exception() for t in tasks if t in done and t.exception() is not None), None)
+        if error is None:
+            return [t.result() for t in tasks]
+
+        # 1 lệnh lỗi -> huỷ các lệnh chưa chạy, kill các lệnh đang chạy
+        for task in pending:
+            task.cancel()
+        for job in group:
+            job.kill()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise error
+
+    async def _run_pipe(self, producer_cmd, consumer_cmd, duration=None, label=None):
+        await self._checkpoint()
+        with self._jobs_lock:
+            if self._cancelled.is_set():
+                raise RenderCancelled("Render đã bị huỷ")
+            producer = FfmpegJob(producer_cmd, duration, f"{label or 'pipe'} (nguồn)",
+                                 quiet=True, pipe_output=True).start()
+            self._jobs.add(producer)
+            try:
+                consumer = FfmpegJob(consumer_cmd, duration, label, stdin=producer.proc.stdout).start()
+            except BaseException:
+                producer.kill()
+                self._jobs.discard(producer)
+                raise
+            finally:
+                # Chỉ 2 tiến trình giữ đầu pipe -> 1 bên chết thì bên kia nhận EOF/EPIPE
+                producer.proc.stdout.close()
+            self._jobs.add(consumer)
+
+        loop = asyncio.get_running_loop()
+        jobs = (consumer, producer)
+        tasks = [loop.run_in_executor(None, job.wait) for job in jobs]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            if any(t.done() and t.exception() is not None for t in tasks):
+                for job in jobs:
+                    job.kill()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            with self._jobs_lock:
+                for job in jobs:
+                    self._jobs.discard(job)
+        # Lỗi của lệnh đọc (consumer) có ý nghĩa hơn EPIPE của lệnh ghi
+        error = next((r for r in results if isinstance(r, BaseException)), None)
+        if error is not None:
+            if self._cancelled.is_set() and isinstance(error, subprocess.CalledProcessError):
+                raise RenderCancelled("Render đã bị huỷ") from None
+            raise error
+        return results[0]
+
+    async def _run_stream(self, producer_cmds, consumer_cmd, fifos, workers, duration=None, label=None):
+        await self._checkpoint()
+        loop = asyncio.get_running_loop()
+        group = set()
+        stop = threading.Event()
+        for path in fifos:
+            os.mkfifo(path)
+        with self._jobs_lock:
+            if self._cancelled.is_set():
+                raise RenderCancelled("Render đã bị huỷ")
+            # Không để FfmpegJob tự đoán thời lượng: probe FIFO sẽ treo
+            consumer = FfmpegJob(consumer_cmd, duration or 0, label).start()
+            self._jobs.add(consumer)
+        group.add(consumer)
+        consumer_task = loop.run_in_executor(None, consumer.wait)
+
+        async def start(i):
+            await self._checkpoint()
+            with self._jobs_lock:
+                if self._cancelled.is_set():
+                    raise RenderCancelled("Render đã bị huỷ")
+                job = FfmpegJob(producer_cmds[i], label=f"{label or 'stream'} #{i + 1}",
+                                quiet=True, pipe_output=True).start()
+                self._jobs.add(job)
+            group.add(job)
+            chunks = queue.Queue(STREAM_QUEUE_CHUNKS)
+            reader = loop.run_in_executor(None, _pump_stream, job.proc.stdout, chunks, stop)
+            return reader, loop.run_in_executor(None, job.wait), chunks
+
+        running = {}
+        try:
+            for i in range(len(producer_cmds)):
+                # Giữ tối đa `workers` lệnh nguồn chạy trước (lệnh i đang được ghi ra)
+                for j in range(i, min(i + workers, len(producer_cmds))):
+                    if j not in running:
+                        running[j] = await start(j)
+                reader, waiter, chunks = running[i]
+                await loop.run_in_executor(None, _drain_stream, chunks, fifos[i], consumer.proc, stop)
+                await reader
+                await waiter
+                del running[i]
+            return await consumer_task
+        except BaseException as e:
+            stop.set()
+            for job in group:
+                job.kill()
+            pending = [consumer_task] + [t for entry in running.values() for t in entry[:2]]
+            await asyncio.gather(*pending, return_exceptions=True)
+            if isinstance(e, (subprocess.CalledProcessError, BrokenPipeError)):
+                if self._cancelled.is_set():
+                    raise RenderCancelled("Render đã bị huỷ") from None
+                if isinstance(e, BrokenPipeError) and isinstance(consumer_task.exception(),
+                                                                  subprocess.CalledProcessError):
+                    # Lệnh đích chết trước -> ghi FIFO bị EPIPE, báo lỗi gốc của lệnh đích
+                    raise consumer_task.exception() from None
+            raise
+        finally:
+            with self._jobs_lock:
+                for job in group:
+                    self._jobs.discard(job)
+
+    def run(self, cmd, duration=None, label=None, on_progress=None):
+        """Chạy 1 lệnh ffmpeg, trả về dict metrics (lỗi -> CalledProcessError, huỷ -> RenderCancelled)"""
+        return self._submit(self._run_job(cmd, duration, label, on_progress))
+
+    def run_many(self, cmds, workers=1):
+        """
+        Chạy nhiều lệnh độc lập, tối đa `workers` lệnh cùng lúc. Một lệnh lỗi
+        -> huỷ các lệnh chưa chạy, kill các lệnh đang chạy, raise lỗi đầu tiên.
+        """
+        if not cmds:
+            return []
+        return self._submit(self._run_many(list(cmds), max(1, int(workers or 1))))
+
+    def run_pipe(self, producer_cmd, consumer_cmd, duration=None, label=None):
+        """
+        Chạy 2 lệnh nối bằng pipe: stdout của producer_cmd (ghi ra pipe:1)
+        -> stdin của consumer_cmd (đọc từ pipe:0), không có file trung gian.
+        1 lệnh lỗi -> kill lệnh còn lại. Trả về metrics của consumer_cmd.
+        """
+        return self._submit(self._run_pipe(list(producer_cmd), list(consumer_cmd), duration, label))
+
+    def run_stream(self, producer_cmds, consumer_cmd, fifos, workers=1, duration=None, label=None):
+        """
+        Chuyển output của từng lệnh nguồn (ghi ra pipe:1) vào FIFO tương ứng
+        trong `fifos` (tạo mới, chỉ có trên POSIX), lần lượt theo thứ tự;
+        consumer_cmd đọc các FIFO đó (vd: concat demuxer), không qua file.
+        Tối đa `workers` lệnh nguồn chạy cùng lúc; lệnh nào chạy trước thì
+        output được đệm trong hàng đợi có giới hạn (đầy -> lệnh đó chờ).
+        1 lệnh lỗi -> kill toàn bộ. Trả về metrics của consumer_cmd.
+        """
+        if len(fifos) != len(producer_cmds):
+            raise ValueError("Số FIFO phải bằng số lệnh nguồn")
+        return self._submit(self._run_stream(list(producer_cmds), list(consumer_cmd), list(fifos),
+                                             max(1, int(workers or 1)), duration, label))
+
+    def install_signal_handlers(self):
+        """SIGTERM/SIGHUP -> huỷ render (kill ffmpeg con) rồi thoát. Chỉ gọi từ main thread."""
+        def _handler(signum, frame):
+            self.cancel()
+            raise SystemExit(128 + signum)
+
+        for name in ("SIGTERM", "SIGHUP", "SIGBREAK"):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), _handler)
+
+
+def _pump_stream(stream, chunks, stop):
+    """Đọc stdout của 1 lệnh nguồn vào hàng đợi (None = hết dữ liệu)"""
+    try:
+        while not stop.is_set():
+            data = stream.read(STREAM_CHUNK)
+            while not stop.is_set():
+                try:
+                    chunks.put(data or None, timeout=PAUSE_POLL)
+                    break
+                except queue.Full:
+                    pass
+            if not data:
+                return
+    finally:
+        stream.close()
+
+
+def _open_fifo_writer(path, proc, stop):
+    """Mở FIFO để ghi khi lệnh đích đã mở đầu đọc (không treo nếu lệnh đích đã chết)"""
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+        if stop.is_set() or proc.poll() is not None:
+            raise BrokenPipeError(f"Lệnh đích không đọc FIFO: {path}")
+        time.sleep(FIFO_OPEN_POLL)
+    os.set_blocking(fd, True)
+    return os.fdopen(fd, "wb")
+
+
+def _drain_stream(chunks, fifo, proc, stop):
+    """Ghi hết hàng đợi của 1 lệnh nguồn vào FIFO mà lệnh đích `proc` đang đọc"""
+    with _open_fifo_writer(fifo, proc, stop) as sink:
+        while not stop.is_set():
+            try:
+                data = chunks.get(timeout=PAUSE_POLL)
+            except queue.Empty:
+                continue
+            if data is None:
+                return
+            sink.write(data)
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_process_manager():
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = ProcessManager()
+        return _default_manager
+
+
+# ==========================================
+# FILE TẠM (dọn lại sau khi crash)
+# ==========================================
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) trên Windows sẽ kết thúc tiến trình -> dùng OpenProcess
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def scratch(path, keep=False):
+    """
+    Đăng ký 1 file/thư mục tạm trong khối with. Lỗi/huỷ -> xoá khi ra khỏi
+    khối; tiến trình chết giữa chừng -> cleanup_stale_scratch() xoá ở lần
+    khởi động sau. keep=True: thành công thì giữ lại (vd: file MP4 đầu ra
+    đang ghi dở chỉ xoá khi render không xong).
+    """
+    os.makedirs(SCRATCH_REGISTRY_DIR, exist_ok=True)
+    entry = os.path.join(SCRATCH_REGISTRY_DIR, f"{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+    with open(entry, "w", encoding="utf-8") as f:
+        json.dump({"path": os.path.abspath(path), "pid": os.getpid(),
+                   "host": socket.gethostname(), "created": time.time()}, f, ensure_ascii=False)
+    ok = False
+    try:
+        yield path
+        ok = True
+    finally:
+        if not (ok and keep):
+            _remove_path(path)
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+
+def cleanup_stale_scratch():
+    """Xoá file/thư mục tạm của các lần render bị chết giữa chừng. Trả về số mục đã xoá."""
+    try:
+        names = os.listdir(SCRATCH_REGISTRY_DIR)
+    except OSError:
+        return 0
+    host = socket.gethostname()
+    removed = 0
+    for name in names:
+        entry = os.path.join(SCRATCH_REGISTRY_DIR, name)
+        try:
+            with open(entry, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if info.get("host") != host or _pid_alive(int(info.get("pid", 0))):
+            continue
+        _remove_path(info.get("path", ""))
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+        print(f"🧹 Dọn file tạm của render bị gián đoạn: {info.get('path')}")
+        removed += 1
+    return removed
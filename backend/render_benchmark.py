@@ -0,0 +1,192 @@
+"""
+Render Benchmark - So sánh tốc độ các renderer trên cùng 1 file spec
+
+Chạy trong thư mục backend:
+    python -m render_benchmark render --channel Kenh1 --spec ../Temp/Kenh1/spec.json
+    python -m render_benchmark render --channel Kenh1 --spec spec.json --renderers segments stream --repeat 3
+    # Ép renderer "segments" đi đường batch (mặc định chỉ batch khi >= 10 clip)
+    python -m render_benchmark render --channel Kenh1 --spec spec.json --batch-size 2
+    # Segment qua pipe thay vì file MP4 trong cache (segment_handoff)
+    python -m render_benchmark render --channel Kenh1 --spec spec.json --renderers segments --handoff pipe
+
+    # Chỉ đo filter nền blur (fps) theo từng mức blur_quality x bg_mode
+    python -m render_benchmark blur ../Main_clips/animal/clip.mp4 --blur 0.25
+    python -m render_benchmark blur clip.mp4 --qualities medium --bg-modes dynamic hold crossfade --bg-fps 2
+
+- Mỗi lần chạy render ra thư mục tạm (không đụng Output/), đọc số liệu từ
+  báo cáo <video>.report.json (render_report) rồi xoá video.
+- Mặc định segment cache để trống cho mỗi lần chạy (--warm-cache để dùng cache
+  thật), nếu không renderer "segments" chỉ còn là bước concat.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import render_helper
+from ffmpeg_runner import run_ffmpeg
+from file_cache import FileCache
+from render_config import load_channel_config
+
+RENDERERS = {
+    "graph": lambda spec, channel_config, workers: render_helper.generate_ffmpeg_command(spec),
+    "segments": lambda spec, channel_config, workers: render_helper.build_and_render_from_config(
+        spec, channel_config, workers=workers),
+    "stream": lambda spec, channel_config, workers: render_helper.render_single_pass(spec, channel_config),
+}
+
+
+def run_once(renderer, spec_path, channel_config, work_dir, workers=None, warm_cache=False):
+    """Render 1 lần, trả về dict số liệu (wall, cpu, realtime_factor, ...)"""
+    with open(spec_path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    out_path = os.path.join(work_dir, f"bench_{renderer}.mp4")
+    spec["outPath"] = out_path
+    bench_spec = os.path.join(work_dir, f"bench_{renderer}.json")
+    with open(bench_spec, "w", encoding="utf-8") as f:
+        json.dump(spec, f, ensure_ascii=False)
+
+    original_cache = render_helper.SEGMENT_CACHE
+    if not warm_cache:
+        render_helper.SEGMENT_CACHE = FileCache(os.path.join(work_dir, "segments"),
+                                                max_bytes=render_helper.SEGMENT_CACHE_MAX_BYTES)
+    started = time.time()
+    try:
+        RENDERERS[renderer](bench_spec, channel_config, workers)
+    finally:
+        render_helper.SEGMENT_CACHE = original_cache
+    wall = time.time() - started
+
+    report_path = f"{os.path.splitext(out_path)[0]}.report.json"
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    result = {
+        "renderer": renderer,
+        "path": report["meta"].get("path", "-"),
+        "wall": round(wall, 3),
+        "cpu": report["cpu"],
+        "realtime_factor": report["realtime_factor"],
+        "output_bytes": report["output_bytes"],
+        "bytes_written": sum(s["bytes_written"] for s in report["stages"]),
+        "ffmpeg_steps": sum(s["ffmpeg_steps"] for s in report["stages"]),
+    }
+    for p in (out_path, report_path, bench_spec):
+        if os.path.exists(p):
+            os.remove(p)
+    shutil.rmtree(os.path.join(work_dir, "segments"), ignore_errors=True)
+    return result
+
+
+def print_table(results):
+    header = f"{'renderer':<10} {'path':<12} {'wall(s)':>8} {'cpu(s)':>8} {'realtime':>9} {'đĩa ghi(MB)':>12} {'lệnh':>5}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        rtf = f"{r['realtime_factor']:.2f}x" if r["realtime_factor"] else "?"
+        print(f"{r['renderer']:<10} {r['path']:<12} {r['wall']:>8.2f} {r['cpu']:>8.2f} {rtf:>9} "
+              f"{r['bytes_written'] / 1024 ** 2:>12.1f} {r['ffmpeg_steps']:>5}")
+
+
+def benchmark_blur(video_path, blur_amount, qualities, modes=("dynamic",), bg_fps=2, seconds=10.0,
+                   width=1920, height=1080, fps=30):
+    """
+    Đo fps của riêng phần nền blur + video chính (không encode, output -f null)
+    cho từng cặp blur_quality x bg_mode. Trả về list dict, "speedup" so với
+    nền "full" + "dynamic" (cách cũ).
+    """
+    results = []
+    for quality in qualities:
+        for mode in modes:
+            background = {"quality": quality, "mode": mode, "fps": bg_fps}
+            bg = render_helper.blur_background_filter(width, height, blur_amount, 1, background, fps)
+            graph = (f"[0:v]fps={fps},split=2[bg][fg];[bg]{bg}[bgb];"
+                     f"[fg]scale={width}:{height}:force_original_aspect_ratio=decrease[fgs];"
+                     f"[bgb][fgs]overlay=(W-w)/2:(H-h)/2,format=yuv420p[outv]")
+            cmd = ["ffmpeg", "-y", "-t", f"{seconds:.3f}", "-i", video_path,
+                   "-filter_complex", graph, "-map", "[outv]", "-f", "null", "-"]
+            print(f"⏱️ blur {quality} / {mode}...")
+            metrics = run_ffmpeg(cmd, label=f"blur {quality} {mode}")
+            results.append({"quality": quality, "mode": mode, "filter": bg, "wall": metrics["wall"],
+                            "fps": metrics["avg_fps"], "frames": metrics["frames"]})
+
+    base = next((r["fps"] for r in results
+                 if r["quality"] == "full" and r["mode"] == "dynamic" and r["fps"]), None)
+    for r in results:
+        r["speedup"] = round(r["fps"] / base, 2) if base and r["fps"] else None
+    return results
+
+
+def _print_blur_table(results):
+    print(f"{'quality':<8} {'mode':<10} {'fps':>8} {'speedup':>8}  filter")
+    for r in results:
+        speedup = f"{r['speedup']:.2f}x" if r["speedup"] else "-"
+        print(f"{r['quality']:<8} {r['mode']:<10} {r['fps'] or 0:>8.1f} {speedup:>8}  {r['filter']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo tốc độ render")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_render = sub.add_parser("render", help="So sánh các renderer trên cùng 1 spec")
+    p_render.add_argument("--channel", required=True, help="Tên kênh trong Channels/ (fps, blur, ...)")
+    p_render.add_argument("--spec", required=True, help="File spec kiểu editly (build_editly_config)")
+    p_render.add_argument("--renderers", nargs="+", choices=sorted(RENDERERS), default=["segments", "stream"])
+    p_render.add_argument("--repeat", type=int, default=1)
+    p_render.add_argument("--workers", type=int, default=None, help="Số job song song cho renderer 'segments'")
+    p_render.add_argument("--batch-size", type=int, default=None,
+                          help="Ghi đè MAX_CLIPS_PER_BATCH (số clip >= giá trị này -> đường batch)")
+    p_render.add_argument("--handoff", choices=[render_helper.SEGMENT_HANDOFF_FILE, render_helper.SEGMENT_HANDOFF_PIPE],
+                          default=None, help="Ghi đè segment_handoff của kênh cho renderer 'segments'")
+    p_render.add_argument("--warm-cache", action="store_true", help="Dùng segment cache thật (không render lại clip đã có)")
+    p_render.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+
+    p_blur = sub.add_parser("blur", help="Đo fps filter nền blur theo từng mức blur_quality")
+    p_blur.add_argument("video", help="Video mẫu")
+    p_blur.add_argument("--blur", type=float, default=0.25, help="Giá trị blur như config kênh (bán kính = blur * 100)")
+    p_blur.add_argument("--qualities", nargs="+", choices=list(render_helper.BLUR_QUALITY_SCALES),
+                        default=list(render_helper.BLUR_QUALITY_SCALES))
+    p_blur.add_argument("--bg-modes", nargs="+", choices=list(render_helper.BG_MODES), default=["dynamic"])
+    p_blur.add_argument("--bg-fps", type=float, default=2, help="Số frame nền/giây cho hold/crossfade")
+    p_blur.add_argument("--seconds", type=float, default=10.0, help="Số giây video đưa vào đo")
+    p_blur.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "blur":
+        results = benchmark_blur(args.video, args.blur * 100, args.qualities, args.bg_modes,
+                                 args.bg_fps, args.seconds)
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False, indent=2))
+        else:
+            _print_blur_table(results)
+        return 0
+
+    channel_config = load_channel_config(args.channel)
+    if args.batch_size:
+        render_helper.MAX_CLIPS_PER_BATCH = args.batch_size
+    if args.handoff:
+        channel_config["segment_handoff"] = args.handoff
+
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="render_bench_")
+    try:
+        for i in range(args.repeat):
+            for renderer in args.renderers:
+                print(f"⏱️ [{i + 1}/{args.repeat}] {renderer}...")
+                results.append(run_once(renderer, args.spec, channel_config, work_dir,
+                                        args.workers, args.warm_cache))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_table(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
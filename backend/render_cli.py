@@ -0,0 +1,246 @@
+"""
+Render CLI - Render video không cần giao diện (server headless, cron)
+
+Chạy trong thư mục backend:
+    # Chọn clip theo topic + thời lượng mục tiêu (giây), dựng config rồi render
+    python -m render_cli --channel Kenh1 --topic animal --duration 600
+
+    # Render lại từ 1 file spec kiểu editly có sẵn
+    python -m render_cli --channel Kenh1 --spec ../Temp/Kenh1/Kenh1_2025-01-01_10-00-00.json
+
+    # Chỉ dựng + in render plan và ước lượng thời gian render, không render
+    python -m render_cli --channel Kenh1 --topic animal --duration 600 --renderer segments --dry-run
+
+Không import tkinter. stdout chỉ chứa tiến trình dạng JSON lines, mỗi dòng 1 sự kiện:
+    {"event": "stage", "stage": "select_clips", "time": ...}
+    {"event": "progress", "label": "render", "percent": 42.5, "eta": 31.2, "fps": 88.0, "speed": 2.9, ...}
+    {"event": "done", "output": "...mp4", "elapsed": 123.4, "time": ...}
+--dry-run thay bước render bằng 1 sự kiện "plan" (plan.to_dict() + "estimate"),
+bản mô tả dễ đọc đi ra stderr; "done" có output = null.
+Log của app và của ffmpeg đi ra stderr. Exit code 0 = thành công, 1 = lỗi, 3 = bị huỷ.
+
+--control-stdin: đọc lệnh điều khiển từ stdin, mỗi dòng 1 lệnh (render_queue
+worker dùng để chuyển tiếp yêu cầu từ editor):
+    pause   -> tạm dừng ở ranh giới segment tiếp theo
+    resume  -> chạy tiếp
+    cancel  -> kill ffmpeg, dọn file tạm, thoát với mã 3
+SIGTERM cũng huỷ render như "cancel" (không để lại ffmpeg mồ côi).
+Tiến trình đọc đã chết (stdin hết dữ liệu khi có --control-stdin, ghi stdout
+lỗi BrokenPipe) -> cũng huỷ render: worker render_queue chết thì job được
+đưa lại hàng đợi, render tiếp ở đây sẽ ghi đè lên lần render mới.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+from consts import OUT_DIR
+from filter_backends import FILTER_BACKENDS
+from clip_selector import select_clips, save_used_videos
+from render_config import build_editly_config, load_channel_config, load_json, get_used_videos_path
+from render_helper import (generate_ffmpeg_command, build_and_render_from_config, render_single_pass,
+                           cleanup_stale_render_files, resolve_segment_handoff, segments_render_path,
+                           stream_render_path)
+from render_plan import load_plan, estimate_render_time
+from ffmpeg_runner import add_progress_listener, remove_progress_listener
+from process_manager import get_process_manager, RenderCancelled
+
+RENDERER_GRAPH = "graph"        # 1 lệnh ffmpeg với filter graph đầy đủ (như EditorWindow)
+RENDERER_SEGMENTS = "segments"  # render từng clip song song rồi concat
+RENDERER_STREAM = "stream"      # 1 lệnh ffmpeg, mỗi clip 1 input đã cắt sẵn, không file tạm
+
+PROGRESS_INTERVAL = 1.0  # giây, tối thiểu giữa 2 sự kiện progress của cùng 1 lệnh ffmpeg
+
+EXIT_CANCELLED = 3
+CONTROL_COMMANDS = ("pause", "resume", "cancel")
+
+
+class JsonLinesReporter:
+    """Ghi mỗi sự kiện thành 1 dòng JSON (an toàn khi gọi từ nhiều thread)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def progress_listener(self):
+        """Listener cho ffmpeg_runner: sự kiện "progress" (giới hạn tần suất theo từng lệnh)"""
+        last_sent = {}
+
+        def _on_progress(progress):
+            now = time.time()
+            label = progress["label"]
+            if progress["done"] or now - last_sent.get(label, 0) >= PROGRESS_INTERVAL:
+                last_sent[label] = now
+                self.emit("progress", **progress)
+
+        return _on_progress
+
+    def emit(self, event, **fields):
+        line = json.dumps({"event": event, "time": round(time.time(), 3), **fields},
+                          ensure_ascii=False, default=str)
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self.stream.write(line + "\n")
+                self.stream.flush()
+            except (OSError, ValueError):
+                # Không còn ai đọc tiến trình (worker chết) -> huỷ render
+                self.closed = True
+                with contextlib.redirect_stdout(sys.stderr):
+                    print("⚠️ stdout đã đóng, huỷ render")
+                    get_process_manager().cancel()
+
+
+def _control_loop(stream, reporter):
+    """
+    Đọc lệnh pause/resume/cancel từ stdin (thread nền) và chuyển cho process
+    manager. stdin hết dữ liệu = worker đã chết -> huỷ render.
+    """
+    manager = get_process_manager()
+    try:
+        for line in stream:
+            command = line.strip().lower()
+            if command not in CONTROL_COMMANDS:
+                continue
+            getattr(manager, command)()
+            reporter.emit("control", action=command)
+            if command == "cancel":
+                return
+    except (OSError, ValueError):
+        pass
+    print("⚠️ stdin đã đóng, huỷ render", file=sys.stderr)
+    manager.cancel()
+
+
+def dry_run(spec_path, channel_config, renderer, reporter):
+    """Dựng render plan theo fps + nhánh mà renderer sẽ dùng, in ra và ước lượng thời gian"""
+    if renderer == RENDERER_GRAPH:
+        plan, path = load_plan(spec_path), None  # graph render theo fps của spec
+    else:
+        plan = load_plan(spec_path, channel_config.get("fps"))
+        if renderer == RENDERER_SEGMENTS:
+            path = segments_render_path(len(plan.segments), resolve_segment_handoff(channel_config))
+        else:
+            path = stream_render_path(plan, channel_config)
+    estimate = estimate_render_time(plan, renderer, path)
+
+    print("\n".join(plan.describe()))
+    if estimate:
+        print(f"⏱️ Ước lượng render: ~{estimate['seconds']:.0f}s "
+              f"(x{estimate['realtime_factor']} realtime, {estimate['runs']} lần render {estimate['basis']})")
+    else:
+        print("⏱️ Chưa có lịch sử render để ước lượng thời gian")
+    reporter.emit("plan", renderer=renderer, path=path, estimate=estimate, **plan.to_dict())
+
+
+def run_job(args, reporter):
+    """Chọn clip -> dựng config -> render (hoặc chỉ in plan nếu --dry-run). Trả về đường dẫn video đầu ra."""
+    channel_config = load_channel_config(args.channel)
+    if args.farm_dir:
+        channel_config["farm_dir"] = args.farm_dir
+    if args.filter_backend:
+        channel_config["filter_backend"] = args.filter_backend
+    selected = []
+
+    if args.spec:
+        spec_path = args.spec
+    else:
+        reporter.emit("stage", stage="select_clips", topic=args.topic, target=args.duration)
+        used_videos = load_json(get_used_videos_path(args.channel))
+        selected = select_clips(args.topic, args.duration, used_videos)
+        if not selected:
+            raise RuntimeError(f"Không chọn được clip nào cho topic '{args.topic}'")
+        reporter.emit("clips_selected", count=len(selected),
+                      duration=round(sum(c["duration"] for c in selected), 3))
+
+        reporter.emit("stage", stage="build_config")
+        out_dir = args.out_dir or str(OUT_DIR / args.channel)
+        os.makedirs(out_dir, exist_ok=True)
+        spec_path = build_editly_config(args.channel, config=channel_config,
+                                        selected_clips=selected, output_path=out_dir)
+        reporter.emit("spec", path=spec_path)
+
+    if args.dry_run:
+        reporter.emit("stage", stage="plan", renderer=args.renderer)
+        dry_run(spec_path, channel_config, args.renderer, reporter)
+        if selected and not args.keep_spec:
+            os.remove(spec_path)
+        return None
+
+    reporter.emit("stage", stage="render", renderer=args.renderer)
+    if args.renderer == RENDERER_SEGMENTS:
+        out_path = build_and_render_from_config(spec_path, channel_config, workers=args.workers)
+    elif args.renderer == RENDERER_STREAM:
+        out_path = render_single_pass(spec_path, channel_config)
+    else:
+        out_path = generate_ffmpeg_command(spec_path)
+
+    if selected:
+        save_used_videos(selected, get_used_videos_path(args.channel))
+        if not args.keep_spec:
+            os.remove(spec_path)
+    return out_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render video headless, tiến trình in ra stdout dạng JSON lines")
+    parser.add_argument("--channel", required=True, help="Tên kênh trong Channels/")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--topic", help="Topic trong Main_clips/ để chọn clip ngẫu nhiên")
+    source.add_argument("--spec", help="File spec kiểu editly có sẵn (bỏ qua bước chọn clip)")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Thời lượng mục tiêu (giây), bắt buộc khi dùng --topic")
+    parser.add_argument("--renderer", choices=[RENDERER_GRAPH, RENDERER_SEGMENTS, RENDERER_STREAM], default=RENDERER_GRAPH)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Số job ffmpeg song song cho renderer 'segments'")
+    parser.add_argument("--farm-dir", default=None,
+                        help="Thư mục render farm dùng chung cho renderer 'segments' (xem render_farm)")
+    parser.add_argument("--filter-backend", choices=["auto"] + list(FILTER_BACKENDS), default=None,
+                        help="Dựng hình trên CPU / GPU (mặc định theo config kênh, xem filter_backends)")
+    parser.add_argument("--out-dir", default=None, help="Thư mục xuất video (mặc định Output/<kênh>)")
+    parser.add_argument("--keep-spec", action="store_true", help="Giữ lại file spec đã dựng")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Chỉ in render plan + ước lượng thời gian, không render, không ghi used videos")
+    parser.add_argument("--control-stdin", action="store_true",
+                        help="Nhận lệnh pause/resume/cancel từ stdin (mỗi dòng 1 lệnh)")
+    args = parser.parse_args(argv)
+    if args.topic and args.duration is None:
+        parser.error("--duration là bắt buộc khi dùng --topic")
+
+    reporter = JsonLinesReporter(sys.stdout)
+    reporter.emit("start", channel=args.channel, topic=args.topic, spec=args.spec, renderer=args.renderer)
+    started = time.time()
+
+    listener = reporter.progress_listener()
+    add_progress_listener(listener)
+    get_process_manager().install_signal_handlers()
+
+    # Mọi print() của app chuyển sang stderr để stdout chỉ còn JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        cleanup_stale_render_files()
+        if args.control_stdin:
+            threading.Thread(target=_control_loop, args=(sys.stdin, reporter), daemon=True).start()
+        try:
+            out_path = run_job(args, reporter)
+        except RenderCancelled:
+            reporter.emit("cancelled", elapsed=round(time.time() - started, 3))
+            return EXIT_CANCELLED
+        except Exception as e:
+            reporter.emit("error", message=str(e), type=type(e).__name__,
+                          elapsed=round(time.time() - started, 3))
+            return 1
+        finally:
+            remove_progress_listener(listener)
+
+    reporter.emit("done", output=out_path, elapsed=round(time.time() - started, 3))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""
+Render Config - Dựng cấu hình render (spec kiểu editly) từ cấu hình kênh
+
+Không phụ thuộc Tk: dùng chung cho EditorWindow và chế độ headless
+(render_cli). editor_ui re-export lại các hàm này để code cũ không phải đổi.
+"""
+
+import json
+import os
+
+from consts import *
+from helper import load_channel_path
+from media_index import probe_media
+from encoder_helper import best_gpu_type, is_gpu_type_available
+from render_plan import seconds_to_frames
+
+
+def probe_duration_sec(video_path):
+    """Lấy thời lượng clip (giây) từ media index"""
+    info = probe_media(video_path)
+    if not info:
+        print(f"❌ Lỗi khi probe video {video_path}")
+        return 0.0
+    return info["duration"]
+def tc_to_frames(tc: str, fps: int) -> int:
+    """HH:MM:SS:FF -> frames"""
+    hh, mm, ss, ff = map(int, tc.split(":"))
+    return (hh * 3600 + mm * 60 + ss) * fps + ff
+
+def frames_to_seconds(frames: int, fps: int) -> float:
+    return frames / float(fps)
+
+def tc_to_seconds(tc: str, fps: int) -> float:
+    return frames_to_seconds(tc_to_frames(tc, fps), fps)
+
+
+def background_options(config: dict) -> dict:
+    """
+    Tuỳ chọn nền contain-blur từ config.json của kênh:
+    - blur_quality: full / high / medium / low (độ phân giải lúc blur).
+      Mặc định full = blur ở độ phân giải đầy đủ như trước; high / medium /
+      low nhanh hơn nhưng nền trông khác và segment cache của kênh render lại
+    - bg_mode: dynamic = tính nền mỗi frame; hold = chỉ tính bg_fps frame/giây
+      rồi giữ nguyên; crossfade = như hold nhưng hoà dần giữa 2 frame nền
+    - bg_fps: số frame nền/giây cho hold/crossfade
+    """
+    try:
+        bg_fps = float(config.get("bg_fps", DEFAULT_BG_FPS))
+    except (TypeError, ValueError):
+        bg_fps = DEFAULT_BG_FPS
+    return {
+        "quality": config.get("blur_quality", DEFAULT_BLUR_QUALITY),
+        "mode": config.get("bg_mode", DEFAULT_BG_MODE),
+        "fps": bg_fps if bg_fps > 0 else DEFAULT_BG_FPS,
+    }
+
+
+def build_editly_config(channel_name: str, config: dict, selected_clips: list, output_path: str) -> dict:
+    print(config, selected_clips, output_path)
+    import os, json, datetime
+    from typing import Optional
+
+    width, height = 1920, 1080
+    fps = int(config.get("fps", 30))
+    gap_tc = config.get("gap", "00:00:00:00")
+    pre_tc = config.get("preoverlap", "00:00:00:00")
+    logo_file = config.get("logo", "logo.png")
+    trans_file = config.get("transition", "transition.mov")
+    blur_conf_str = config.get("blur", 1)
+    try:
+        blur_conf = float(blur_conf_str)
+    except:
+        blur_conf = 0.0
+
+    channel_dir = os.path.join(CHANNELS_DIR, channel_name)
+    logo_path = os.path.join(channel_dir, logo_file)
+    if not os.path.exists(logo_path):
+        raise FileNotFoundError(f"Không thấy logo: {logo_path} (yêu cầu logo.png trong thư mục kênh)")
+
+    # Transition
+    trans_frames = 0
+    trans_duration_s = 0.0
+    trans_path = None
+    if trans_file:
+        trans_path = os.path.join(channel_dir, trans_file)
+        if os.path.exists(trans_path):
+            trans_duration_s = probe_duration_sec(trans_path)
+            trans_frames = seconds_to_frames(trans_duration_s, fps)
+        else:
+            raise FileNotFoundError(f"Đã khai báo transition nhưng thiếu file: {trans_path}")
+
+    # Timeline tính bằng số nguyên frame: mọi thời điểm/độ dài ghi vào spec là
+    # frame / fps, cộng dồn bằng số nguyên -> 100 clip hay 1000 clip cũng không lệch
+    gap_f = tc_to_frames(gap_tc, fps) if gap_tc else 0
+    pre_f = tc_to_frames(pre_tc, fps) if pre_tc else 0
+
+    clips_json = []
+    audio_tracks = []
+
+    def main_clip_layer(full_path: str, cut_from: float = 0.0, cut_to: Optional[float] = None):
+        """
+        Tạo layer cho 1 clip:
+        Thứ tự layers (từ dưới lên trên):
+        1. Video chính (nền)
+        2. Logo (luôn hiển thị)
+        3. Transition sẽ được append sau (cao nhất)
+        """
+        v_layer = {
+            "type": "video",
+            "path": full_path,
+            "resizeMode": "contain-blur",
+            "width": 1.0
+        }
+        if blur_conf > 0:
+            v_layer["blur"] = blur_conf
+            v_layer["background"] = background_options(config)
+        if cut_from and cut_from > 0:
+            v_layer["cutFrom"] = cut_from
+        if cut_to and cut_to > 0:
+            v_layer["cutTo"] = cut_to
+
+        logo_layer = {
+            "type": "image-overlay",
+            "path": logo_path,
+            "position": "center",
+            "width": 1.0
+        }
+
+        # Thứ tự: video nền trước, logo sau (transition sẽ append sau cùng)
+        return {"layers": [v_layer, logo_layer]}
+
+    def black_gap_clip(duration_s: float):
+        return {
+            "duration": duration_s,
+            "layers": [
+                {"type": "fill-color", "color": "#000000"},
+                {"type": "image-overlay", "path": logo_path, "position": "center", "width": 1.0}
+            ]
+        }
+
+    if not selected_clips:
+        raise RuntimeError("Không chọn được clip nào!")
+
+    # --- MỚI: xử lý dễ hiểu, theo thứ tự timeline ---
+    # Độ dài từng clip làm tròn theo frame 1 lần (như render_plan)
+    clip_frames = [seconds_to_frames(c["duration"], fps) for c in selected_clips]
+    timeline_f = 0  # frame bắt đầu của clip A đang xét trên timeline
+
+    # Thêm clip đầu tiên (chưa có transition trước nó)
+    first = selected_clips[0]
+    first_full = first["path"] if os.path.isabs(first["path"]) else os.path.join(MAIN_CLIPS_DIR, first["path"])
+    first_clip_obj = main_clip_layer(first_full, 0.0, frames_to_seconds(clip_frames[0], fps))
+    clips_json.append(first_clip_obj)
+
+    # Duyệt qua từng transition giữa clip i (A) và clip i+1 (B)
+    for i in range(len(selected_clips) - 1):
+        B = selected_clips[i + 1]
+
+        # Thông tin clip A (đã tồn tại là clips_json[-1])
+        clipA_frames = clip_frames[i]
+
+        # Thông tin clip B
+        clipB_path = B["path"] if os.path.isabs(B["path"]) else os.path.join(MAIN_CLIPS_DIR, B["path"])
+        clipB_frames = clip_frames[i + 1]
+
+        # --- 1) Thêm layer transition phần "pre" vào clip A (đè cuối clip A) ---
+        if trans_frames > 0:
+            trans_pre_start_in_A = clipA_frames - pre_f
+            # append layer vào clip A (đã push trước đó)
+            clips_json[-1]["layers"].append({
+                "type": "video",
+                "path": trans_path,
+                "start": frames_to_seconds(trans_pre_start_in_A, fps),
+                "stop": frames_to_seconds(trans_pre_start_in_A + trans_frames, fps),
+                "cutFrom": 0.0,
+                "cutTo": frames_to_seconds(trans_frames, fps),
+                "resizeMode": "contain",
+                "mixVolume": 1
+            })
+
+            # Thêm audio track cho toàn bộ transition (bắt đầu tại thời điểm transition bắt đầu trên timeline)
+            audio_tracks.append({
+                "path": trans_path,
+                "mixVolume": 1,
+                "cutFrom": 0.0,
+                "cutTo": frames_to_seconds(trans_frames, fps),
+                "start": frames_to_seconds(timeline_f + trans_pre_start_in_A, fps)
+            })
+        timeline_f += clipA_frames
+
+        # --- 2) Gap đen (nếu có) ---
+        if gap_f > 0:
+            gap_clip = black_gap_clip(frames_to_seconds(gap_f, fps))
+            # if trans_frames > 0:
+            #     # transition phần giữa (sau pre_s)
+            #     gap_clip["layers"].append({
+            #         "type": "video",
+            #         "path": trans_path,
+            #         "start": 0.0,  # chạy từ đầu đoạn gap trên transition file (cutted bằng cutFrom)
+            #         "stop": gap_s,
+            #         "cutFrom": min(pre_s, trans_duration_s),
+            #         "cutTo": min(pre_s + gap_s, trans_duration_s),
+            #         "resizeMode": "contain",
+            #         "mixVolume": 1
+            #     })
+            clips_json.append(gap_clip)
+            timeline_f += gap_f
+
+        # --- 3) Clip B với phần "post" transition đè lên đầu clip B ---
+        clipB_obj = main_clip_layer(clipB_path, 0.0, frames_to_seconds(clipB_frames, fps))
+        # if trans_frames > 0:
+        #     post_s = max(0.0, trans_duration_s - pre_s - gap_s)
+        #     # phần đầu của clip B bị đè bởi phần còn lại của transition
+        #     clipB_obj["layers"].append({
+        #         "type": "video",
+        #         "path": trans_path,
+        #         "start": 0.0,
+        #         "stop": min(post_s, clipB_dur),
+        #         "cutFrom": min(pre_s + gap_s, trans_duration_s),
+        #         "cutTo": trans_duration_s,
+        #         "resizeMode": "contain",
+        #         "mixVolume": 1
+        #     })
+        #     # lưu ý: audio track đã thêm ở phần A (vì mình chèn 1 audioTracks cho toàn bộ transition),
+        #     # không cần thêm thêm audioTracks ở đây để tránh trùng.
+
+        clips_json.append(clipB_obj)
+
+    # ============================================================
+    # CẤU HÌNH GPU ENCODING - TỐI ƯU TỐC ĐỘ MÀ KHÔNG MẤT CHẤT LƯỢNG
+    # ============================================================
+
+    # Tự động detect GPU và chọn encoder phù hợp
+    # Ưu tiên: NVIDIA (h264_nvenc) > AMD (h264_amf) > Intel (h264_qsv) > CPU (libx264)
+
+    ffmpeg_params = []
+
+    # Các tùy chọn tối ưu cho GPU encoding
+    gpu_configs = {
+        # NVIDIA GPU (tốt nhất, hỗ trợ rộng rãi)
+        "nvidia": {
+            "codec": "h264_nvenc",
+            "params": [
+                "-preset", "p7",  # preset chất lượng cao nhất (p1-p7, p7 = slow/high quality)
+                "-tune", "hq",  # tune cho high quality
+                "-rc", "vbr",  # variable bitrate (tốt hơn cbr cho chất lượng)
+                "-cq", "19",  # constant quality (18-23, càng thấp càng tốt, 19 = rất tốt)
+                "-b:v", "20M",  # bitrate tham khảo cho VBR
+                "-maxrate", "25M",  # max bitrate
+                "-bufsize", "50M",  # buffer size
+                "-profile:v", "high",  # H.264 profile cao
+                "-rc-lookahead", "32",  # lookahead frames (tối ưu chất lượng)
+                "-spatial_aq", "1",  # spatial adaptive quantization
+                "-temporal_aq", "1",  # temporal adaptive quantization
+                "-bf", "3",  # B-frames
+                "-g", str(fps * 2),  # GOP size (2 giây)
+            ]
+        },
+
+        # AMD GPU
+        "amd": {
+            "codec": "h264_amf",
+            "params": [
+                "-quality", "quality",  # quality mode thay vì speed
+                "-rc", "vbr_latency",  # VBR cho chất lượng tốt
+                "-qp_i", "18",  # QP cho I-frames
+                "-qp_p", "20",  # QP cho P-frames
+                "-qp_b", "22",  # QP cho B-frames
+                "-b:v", "20M",
+                "-maxrate", "25M",
+                "-bufsize", "50M",
+                "-profile:v", "high",
+                "-bf", "3",
+                "-g", str(fps * 2),
+            ]
+        },
+
+        # Intel GPU (Quick Sync)
+        "intel": {
+            "codec": "h264_qsv",
+            "params": [
+                "-preset", "veryslow",  # preset chất lượng cao
+                "-global_quality", "18",  # quality (15-23, thấp hơn = tốt hơn)
+                "-look_ahead", "1",  # enable lookahead
+                "-look_ahead_depth", "40",  # lookahead depth
+                "-b:v", "20M",
+                "-maxrate", "25M",
+                "-bufsize", "50M",
+                "-profile:v", "high",
+                "-bf", "3",
+                "-g", str(fps * 2),
+            ]
+        },
+
+        # CPU fallback (nếu không có GPU hoặc GPU không hỗ trợ)
+        "cpu": {
+            "codec": "libx264",
+            "params": [
+                "-preset", "slow",  # slow preset cho chất lượng tốt
+                "-crf", "18",  # constant rate factor (15-23, 18 = rất tốt)
+                "-profile:v", "high",
+                "-level", "4.2",
+                "-bf", "3",
+                "-g", str(fps * 2),
+                "-movflags", "+faststart",  # web optimization
+                "-pix_fmt", "yuv420p",  # compatibility
+            ]
+        }
+    }
+
+    # Lấy cấu hình từ config hoặc tự động detect
+    gpu_type = config.get("gpu_type", "auto").lower()
+
+    if gpu_type == "auto":
+        # Encoder nhanh nhất đã chạy thử thành công trên máy này
+        gpu_type = best_gpu_type()
+        print(f"🔍 Tự động chọn GPU encoder: {gpu_type}")
+    elif gpu_type in gpu_configs and not is_gpu_type_available(gpu_type):
+        print(f"⚠️ Encoder '{gpu_type}' không chạy được trên máy này, chuyển sang CPU (libx264)")
+        gpu_type = "cpu"
+
+    # Chọn cấu hình phù hợp, fallback về CPU nếu không có
+    selected_config = gpu_configs.get(gpu_type, gpu_configs["cpu"])
+
+    ffmpeg_params.extend(["-c:v", selected_config["codec"]])
+    ffmpeg_params.extend(selected_config["params"])
+
+    # Audio encoding (giữ chất lượng cao)
+    ffmpeg_params.extend([
+        "-c:a", "aac",
+        "-b:a", "320k",  # audio bitrate cao
+        "-ar", "48000",  # sample rate
+        "-ac", "2",  # stereo
+    ])
+
+    # Các tùy chọn chung tối ưu tốc độ
+    ffmpeg_params.extend([
+        "-threads", "0",  # auto-detect số threads
+        "-movflags", "+faststart",  # tối ưu streaming
+    ])
+
+    print(f"🎬 GPU Encoding: {selected_config['codec']}")
+    print(f"⚡ FFmpeg params: {' '.join(ffmpeg_params)}")
+
+    # Build spec
+    output_file_name = f"{channel_name}_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.mp4"
+    spec = {
+        "outPath": os.path.join(output_path, output_file_name),
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "keepSourceAudio": True,
+        "defaults": {"transition": None},
+        "clips": clips_json,
+        "audioTracks": audio_tracks,
+        "ffmpegOptions": {
+            "outputArgs": ffmpeg_params
+        }
+    }
+
+    # Lưu file JSON
+    os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else output_path, exist_ok=True)
+    temp_dir_for_channel = os.path.join(TEMP_DIR, channel_name)
+    os.makedirs(temp_dir_for_channel, exist_ok=True)
+    config_filename = f"{channel_name}_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
+    config_path = os.path.join(temp_dir_for_channel, config_filename)
+
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Đã lưu cấu hình editly: {config_path}")
+
+    # Gọi render
+    # start_render(config_path, selected_clips, channel_name, config)
+    # return spec
+    return config_path
+
+
+def load_channel_config(channel_name):
+    """Đọc config.json trong thư mục kênh"""
+    print(f"🔍 Đang tải cấu hình cho kênh: {channel_name}")
+    channel_path = load_channel_path(channel_name)
+
+    config_path = os.path.join(channel_path, "config.json")
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"Kênh '{channel_name}' thiếu file config.json.")
+
+    # Đọc config
+    config = load_json(config_path)
+
+    # Kiểm tra các file quan trọng (logo + transition)
+    logo_path = os.path.join(channel_path, config.get("logo", ""))
+    trans_path = os.path.join(channel_path, config.get("transition", ""))
+
+    missing = []
+    if not os.path.exists(logo_path):
+        missing.append("logo.png")
+    if not os.path.exists(trans_path):
+        missing.append("transition.mov")
+
+    if missing:
+        print(f"⚠️  Thiếu file trong kênh {channel_name}: {', '.join(missing)}")
+
+    # In thông tin cấu hình ra màn hình
+    print(f"\n📂 Cấu hình kênh: {channel_name}")
+    for k, v in config.items():
+        print(f"  {k}: {v}")
+
+    return config
+def load_json(file_path, default=None):
+    """Đọc JSON an toàn"""
+    if not os.path.exists(file_path):
+        return default
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except:
+        return default
+
+def get_used_videos_path(channel_name):
+    channel_path = load_channel_path(channel_name)
+    return os.path.join(channel_path, "used_videos.json")
+def load_used_videos(channel_name):
+    used_video_path = get_used_videos_path(channel_name)
+    if not os.path.exists(used_video_path):
+        return []
+    try:
+        with open(used_video_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            # Đảm bảo trả về list string
+            if isinstance(data, list):
+                return data
+            return []
+    except Exception:
+        return []
@@ -0,0 +1,471 @@
+"""
+Render Farm - Chia phần render từng segment cho nhiều máy qua thư mục dùng chung
+
+Renderer "segments" có 2 loại việc độc lập: render từng clip (nền blur +
+logo) và chuẩn hoá transition/logo. Khi config kênh có "farm_dir" (hoặc biến
+môi trường FUNNYVIDEO_FARM_DIR), các việc này được ghi thành task trong thư
+mục dùng chung (NFS/SMB), worker trên các máy Linux khác lấy task về chạy;
+máy điều phối (render_cli / editor) vẫn tự nối + mux video cuối cùng.
+
+Cấu trúc <farm_dir>:
+    queued/<key>.json    task chờ chạy: lệnh ffmpeg (output = "{out}"), số lần đã thử
+    running/<key>.json   task đã có worker nhận; mtime = heartbeat của worker
+    done/<key><ext>      kết quả, key = key của segment/asset cache
+    failed/<key>.json    task lỗi quá max_attempts lần (kèm lỗi cuối)
+    workers/<id>         heartbeat của từng worker (mtime)
+
+- Nhận task = os.rename queued -> running: atomic, chỉ 1 worker thắng.
+- Kết quả ghi vào file .part rồi os.replace -> không ai đọc phải file ghi dở;
+  key giống nhau = output giống nhau, nên task đã có trong done/ không chạy
+  lại (gửi lại cùng 1 job, 2 máy điều phối cùng cần 1 clip...).
+- Task lỗi được đưa lại hàng đợi sau RETRY_DELAY * số lần đã thử, tối đa
+  max_attempts lần. Worker chết (không heartbeat quá STALE_AFTER giây) ->
+  task đang chạy được máy khác đưa lại hàng đợi.
+- Mọi máy phải thấy file nguồn (Main_clips, transition, logo) ở cùng đường
+  dẫn và có cùng encoder (lệnh ffmpeg do máy điều phối dựng sẵn). Asset đã
+  chuẩn hoá dùng làm input của task (logo) nằm trong done/, không nằm trong
+  cache cục bộ của máy điều phối (publish).
+
+Sử dụng:
+    python -m render_farm worker --farm-dir /mnt/farm --concurrency 2
+    python -m render_farm status --farm-dir /mnt/farm
+    python -m render_farm prune --farm-dir /mnt/farm --older-than 24
+
+    from render_farm import resolve_farm
+    farm = resolve_farm(config_dict)
+    outputs = farm.run_tasks([(key, cmd, ".mp4")], local_workers=2)  # key -> file trong done/
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from process_manager import get_process_manager, RenderCancelled
+
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_DELAY = 10        # giây, nhân với số lần đã thử
+HEARTBEAT_INTERVAL = 5  # giây
+STALE_AFTER = 60        # task/worker không heartbeat quá lâu -> coi như worker đã chết
+POLL_INTERVAL = 1
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+WORKERS = "workers"
+
+
+class FarmTaskError(RuntimeError):
+    """Task lỗi quá max_attempts lần trên farm"""
+
+
+def resolve_farm(config_dict=None):
+    """
+    RenderFarm theo config kênh "farm_dir" > biến môi trường FUNNYVIDEO_FARM_DIR,
+    không có -> None. "farm_local_workers": số task máy điều phối tự chạy
+    (mặc định = số job render song song, 0 = chỉ chờ worker khác).
+    """
+    config_dict = config_dict or {}
+    for value in (config_dict.get("farm_dir"), os.environ.get("FUNNYVIDEO_FARM_DIR")):
+        if value:
+            return RenderFarm(os.path.expanduser(str(value)),
+                              config_dict.get("farm_max_attempts", DEFAULT_MAX_ATTEMPTS),
+                              config_dict.get("farm_local_workers"))
+    return None
+
+
+def _write_json(path, data):
+    """Ghi JSON qua file tạm + os.replace (máy khác không đọc phải file ghi dở)"""
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class RenderFarm:
+    def __init__(self, root, max_attempts=DEFAULT_MAX_ATTEMPTS, local_workers=None):
+        self.root = os.path.abspath(str(root))
+        self.max_attempts = max_attempts
+        self.local_workers = local_workers
+        for name in (QUEUED, RUNNING, DONE, FAILED, WORKERS):
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+
+    def _path(self, state, name):
+        return os.path.join(self.root, state, name)
+
+    def result_path(self, key, ext=""):
+        return self._path(DONE, key + ext)
+
+    # --- máy điều phối ---
+    def submit(self, key, cmd, ext="", label=None):
+        """
+        Thêm task (cmd: lệnh ffmpeg, output là "{out}"). Đã có kết quả / đang
+        chờ / đang chạy -> bỏ qua. Task từng failed được thử lại từ đầu.
+        Trả về True nếu vừa thêm task mới.
+        """
+        if os.path.exists(self.result_path(key, ext)):
+            return False
+        queued = self._path(QUEUED, key + ".json")
+        if os.path.exists(queued) or os.path.exists(self._path(RUNNING, key + ".json")):
+            return False
+        _remove(self._path(FAILED, key + ".json"))
+        _write_json(queued, {
+            "key": key, "cmd": list(cmd), "ext": ext, "label": label or key[:12],
+            "attempts": 0, "max_attempts": self.max_attempts, "not_before": 0,
+            "submitted_by": socket.gethostname(), "submitted_at": time.time(),
+        })
+        return True
+
+    def publish(self, key, src_path, ext=""):
+        """
+        Đưa file đã có sẵn ở máy này (vd asset cache) vào done/ để máy khác
+        dùng làm input của task. Trả về đường dẫn trong thư mục farm.
+        """
+        result = self.result_path(key, ext)
+        if not os.path.exists(result):
+            tmp = self._path(DONE, f"{key}.{uuid.uuid4().hex[:8]}.part{ext}")
+            try:
+                shutil.copyfile(src_path, tmp)
+                os.replace(tmp, result)
+            except BaseException:
+                _remove(tmp)
+                raise
+        return result
+
+    def withdraw(self, keys):
+        """Gỡ các task còn đang chờ (máy điều phối bị huỷ/lỗi); task đang chạy vẫn chạy nốt"""
+        for key in keys:
+            _remove(self._path(QUEUED, key + ".json"))
+
+    def run_tasks(self, tasks, local_workers=0, label="farm"):
+        """
+        Gửi tasks [(key, cmd, ext)] lên farm rồi chờ tới khi xong hết.
+        local_workers > 0: máy điều phối cũng nhận task chạy như 1 worker
+        ("farm_local_workers" của config kênh, nếu có, được ưu tiên).
+        Trả về {key: file kết quả}. Task lỗi quá max_attempts -> FarmTaskError,
+        huỷ render -> RenderCancelled (gỡ các task chưa chạy).
+        """
+        if not tasks:
+            return {}
+        manager = get_process_manager()
+        if self.local_workers is not None:
+            local_workers = self.local_workers
+        exts = {key: ext for key, _, ext in tasks}
+        for key, cmd, ext in tasks:
+            self.submit(key, cmd, ext)
+        print(f"🖧 Farm {self.root}: {len(exts)} task, {len(self.alive_workers())} worker đang chạy")
+
+        worker = worker_thread = None
+        if local_workers:
+            worker = FarmWorker(self, local_workers, only=exts)
+            worker_thread = threading.Thread(target=worker.run, daemon=True)
+            worker_thread.start()
+
+        results = {}
+        reported = -1
+        try:
+            while True:
+                manager.checkpoint()
+                self.requeue_stale()
+                for key, ext in exts.items():
+                    if key in results:
+                        continue
+                    if os.path.exists(self.result_path(key, ext)):
+                        results[key] = self.result_path(key, ext)
+                        continue
+                    failed = _read_json(self._path(FAILED, key + ".json"))
+                    if failed:
+                        raise FarmTaskError(f"Task {failed.get('label')} lỗi sau {failed.get('attempts')} "
+                                            f"lần thử: {failed.get('error')}")
+                if len(results) != reported:
+                    reported = len(results)
+                    print(f"🖧 {label}: {reported}/{len(exts)} task xong")
+                if len(results) == len(exts):
+                    return results
+                if worker and worker.error:
+                    raise worker.error
+                time.sleep(POLL_INTERVAL)
+        except BaseException:
+            self.withdraw([key for key in exts if key not in results])
+            raise
+        finally:
+            if worker:
+                worker.stop()
+                worker_thread.join()
+
+    # --- worker ---
+    def claim(self, worker_id, only=None):
+        """Nhận 1 task đến hạn (os.rename queued -> running), không có -> None. only: chỉ nhận các key này"""
+        now = time.time()
+        try:
+            names = sorted(os.listdir(self._path(QUEUED, "")))
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if not name.endswith(".json") or (only is not None and name[:-5] not in only):
+                continue
+            task = _read_json(self._path(QUEUED, name))
+            if task is None or task.get("not_before", 0) > now:
+                continue
+            running = self._path(RUNNING, name)
+            try:
+                os.rename(self._path(QUEUED, name), running)
+            except FileNotFoundError:
+                continue  # worker khác vừa nhận
+            task["worker"] = worker_id
+            task["attempts"] = task.get("attempts", 0) + 1
+            _write_json(running, task)
+            return task
+        return None
+
+    def heartbeat(self, worker_id, keys=()):
+        now = time.time()
+        worker_file = self._path(WORKERS, worker_id)
+        with open(worker_file, "a"):
+            os.utime(worker_file, (now, now))
+        for key in keys:
+            try:
+                os.utime(self._path(RUNNING, key + ".json"), (now, now))
+            except FileNotFoundError:
+                pass
+
+    def unregister_worker(self, worker_id):
+        _remove(self._path(WORKERS, worker_id))
+
+    def alive_workers(self):
+        cutoff = time.time() - STALE_AFTER
+        alive = []
+        for name in os.listdir(self._path(WORKERS, "")):
+            try:
+                if os.path.getmtime(self._path(WORKERS, name)) >= cutoff:
+                    alive.append(name)
+            except FileNotFoundError:
+                pass
+        return alive
+
+    def finish(self, task, tmp_path):
+        os.replace(tmp_path, self.result_path(task["key"], task["ext"]))
+        _remove(self._path(RUNNING, task["key"] + ".json"))
+
+    def fail(self, task, error):
+        """Lỗi -> xếp lại hàng đợi (chờ RETRY_DELAY * số lần đã thử) hoặc failed nếu hết lượt"""
+        running = self._path(RUNNING, task["key"] + ".json")
+        task = dict(task, error=str(error)[-2000:])
+        if task["attempts"] >= task.get("max_attempts", self.max_attempts):
+            _write_json(self._path(FAILED, task["key"] + ".json"), task)
+            status = FAILED
+        else:
+            task["not_before"] = time.time() + RETRY_DELAY * task["attempts"]
+            _write_json(self._path(QUEUED, task["key"] + ".json"), task)
+            status = QUEUED
+        _remove(running)
+        return status
+
+    def release(self, task):
+        """Trả task về hàng đợi mà không tính 1 lần thử (worker dừng / bị huỷ)"""
+        task = dict(task, attempts=task["attempts"] - 1, not_before=0)
+        _write_json(self._path(QUEUED, task["key"] + ".json"), task)
+        _remove(self._path(RUNNING, task["key"] + ".json"))
+
+    def requeue_stale(self):
+        """Task đang chạy mà worker không heartbeat quá STALE_AFTER giây -> đưa lại hàng đợi"""
+        cutoff = time.time() - STALE_AFTER
+        requeued = 0
+        for name in os.listdir(self._path(RUNNING, "")):
+            path = self._path(RUNNING, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            task = _read_json(path)
+            if task is None:
+                continue
+            # Đổi tên trước để 2 máy không cùng đưa lại 1 task
+            stale = f"{path}.{uuid.uuid4().hex[:8]}.stale"
+            try:
+                os.rename(path, stale)
+            except FileNotFoundError:
+                continue
+            if os.path.exists(self.result_path(task["key"], task["ext"])):
+                _remove(stale)
+                continue
+            self.fail(dict(task), f"worker {task.get('worker')} không phản hồi")
+            _remove(stale)
+            requeued += 1
+        return requeued
+
+    def status(self):
+        counts = {}
+        for state in (QUEUED, RUNNING, DONE, FAILED):
+            names = os.listdir(self._path(state, ""))
+            counts[state] = sum(1 for n in names if ".part" not in n and not n.endswith((".tmp", ".stale")))
+        counts[WORKERS] = len(self.alive_workers())
+        return counts
+
+    def prune(self, older_than):
+        """Xoá kết quả / task failed cũ hơn older_than giây (và file .part bị bỏ lại). Trả về số file."""
+        cutoff = time.time() - older_than
+        removed = 0
+        for state in (DONE, FAILED, WORKERS):
+            for name in os.listdir(self._path(state, "")):
+                path = self._path(state, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+class FarmWorker:
+    """
+    Nhận task từ farm và chạy tối đa `concurrency` lệnh ffmpeg cùng lúc (qua
+    process manager: huỷ/SIGTERM kill ffmpeg, task được trả lại hàng đợi).
+    idle_exit: số giây rảnh liên tục thì tự thoát (None = chạy tới khi stop()).
+    only: chỉ nhận các key này (máy điều phối chạy task của chính nó).
+    """
+
+    def __init__(self, farm, concurrency=1, idle_exit=None, only=None):
+        self.farm = farm
+        self.only = set(only) if only is not None else None
+        self.concurrency = max(1, int(concurrency or 1))
+        self.idle_exit = idle_exit
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.error = None
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            with self._active_lock:
+                keys = list(self._active)
+            try:
+                self.farm.heartbeat(self.worker_id, keys)
+            except OSError as e:
+                print(f"⚠️ Không ghi được heartbeat farm: {e}")
+
+    def _run_task(self, task):
+        key = task["key"]
+        tmp_out = os.path.join(self.farm.root, DONE, f"{key}.{uuid.uuid4().hex[:8]}.part{task['ext']}")
+        cmd = [tmp_out if arg == "{out}" else arg for arg in task["cmd"]]
+        print(f"🎬 Farm task {task['label']} (lần {task['attempts']}/{task['max_attempts']})")
+        try:
+            get_process_manager().run(cmd, label=task["label"])
+            self.farm.finish(task, tmp_out)
+        except RenderCancelled:
+            _remove(tmp_out)
+            self.farm.release(task)
+        except subprocess.CalledProcessError as e:
+            _remove(tmp_out)
+            status = self.farm.fail(task, f"ffmpeg thoát với mã {e.returncode} trên {socket.gethostname()}")
+            print(f"❌ Farm task {task['label']} lỗi -> {status}")
+        except BaseException as e:
+            _remove(tmp_out)
+            self.farm.release(task)
+            self.error = e
+        finally:
+            with self._active_lock:
+                self._active.discard(key)
+
+    def run(self):
+        print(f"👷 Farm worker {self.worker_id} chạy tối đa {self.concurrency} task cùng lúc")
+        self.farm.heartbeat(self.worker_id)
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+        threads = []
+        idle_since = time.time()
+        try:
+            while not self._stop.is_set() and not self.error:
+                threads = [t for t in threads if t.is_alive()]
+                while len(threads) < self.concurrency:
+                    self.farm.requeue_stale()
+                    task = self.farm.claim(self.worker_id, self.only)
+                    if task is None:
+                        break
+                    with self._active_lock:
+                        self._active.add(task["key"])
+                    t = threading.Thread(target=self._run_task, args=(task,), daemon=True)
+                    t.start()
+                    threads.append(t)
+
+                if threads:
+                    idle_since = time.time()
+                elif self.idle_exit is not None and time.time() - idle_since >= self.idle_exit:
+                    print("💤 Farm không còn task, worker dừng")
+                    break
+                self._stop.wait(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            print("🛑 Đang dừng farm worker, trả các task đang chạy về hàng đợi...")
+            get_process_manager().cancel()
+        finally:
+            for t in threads:
+                t.join()
+            self._stop.set()
+            self.farm.unregister_worker(self.worker_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render farm qua thư mục dùng chung")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_worker = sub.add_parser("worker", help="Nhận và chạy task render segment")
+    p_worker.add_argument("--concurrency", type=int, default=None,
+                          help="Số lệnh ffmpeg chạy cùng lúc (mặc định: FUNNYVIDEO_RENDER_WORKERS hoặc số core)")
+    p_worker.add_argument("--idle-exit", type=float, default=None,
+                          help="Tự thoát sau N giây không có task (mặc định: chạy mãi)")
+
+    sub.add_parser("status", help="Số task theo trạng thái + số worker đang chạy")
+
+    p_prune = sub.add_parser("prune", help="Xoá kết quả / task lỗi cũ")
+    p_prune.add_argument("--older-than", type=float, default=24, help="Giờ (mặc định 24)")
+
+    for p in (p_worker, sub.choices["status"], p_prune):
+        p.add_argument("--farm-dir", default=None, help="Thư mục dùng chung (mặc định: FUNNYVIDEO_FARM_DIR)")
+
+    args = parser.parse_args(argv)
+    farm = resolve_farm({"farm_dir": args.farm_dir})
+    if farm is None:
+        parser.error("cần --farm-dir hoặc biến môi trường FUNNYVIDEO_FARM_DIR")
+
+    if args.command == "worker":
+        from render_helper import resolve_render_workers
+        manager = get_process_manager()
+        manager.install_signal_handlers()
+        FarmWorker(farm, resolve_render_workers(args.concurrency), args.idle_exit).run()
+    elif args.command == "status":
+        counts = farm.status()
+        print("  ".join(f"{name}: {count}" for name, count in counts.items()))
+    elif args.command == "prune":
+        print(f"🧹 Đã xoá {farm.prune(args.older_than * 3600)} file")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
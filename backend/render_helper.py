@@ -1,21 +1,33 @@
 import json
-import shlex
+import shutil
 import subprocess
 import os
 import uuid
-from tkinter import ttk, messagebox
-import tkinter as tk
-
-import json
-import subprocess
-import os
-import sys
+from collections import Counter
+from consts import ASSET_CACHE_DIR, ASSET_CACHE_MAX_BYTES, SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES
+from file_cache import FileCache, file_digest, file_fingerprint, make_key
+from media_index import probe_media_many
+from encoder_helper import video_encoder_args, best_encoder
+from helper import notify
+from process_manager import get_process_manager, scratch, cleanup_stale_scratch
+from render_report import RenderReport, report_stage
+from render_config import background_options
+from audio_timeline import AUDIO_RATE, AudioAlignmentError, AudioTimeline, seconds_to_samples
+from scratch_space import scratch_path, check_output_space, estimate_scratch_bytes
+from render_plan import compile_plan, frames_to_seconds, round_frames
+from render_farm import resolve_farm
+from filter_backends import BLUR_QUALITY_SCALES, BG_MODES, CPU_BACKEND, resolve_filter_backend
+from thumbnail_engine import THUMB_CACHE
 
 # ==========================================
 # CẤU HÌNH
 # ==========================================
 FFMPEG_EXEC = "ffmpeg"
 
+# Transition/logo đã chuẩn hoá, dùng chung cho mọi job render
+ASSET_CACHE = FileCache(ASSET_CACHE_DIR, max_bytes=ASSET_CACHE_MAX_BYTES)
+SEGMENT_CACHE = FileCache(SEGMENT_CACHE_DIR, max_bytes=SEGMENT_CACHE_MAX_BYTES)
+
 
 def get_input_index(file_path, input_map, inputs_list):
     if file_path not in input_map:
@@ -24,9 +36,20 @@ def get_input_index(file_path, input_map, inputs_list):
     return input_map[file_path]
 
 
-def generate_ffmpeg_command(config_path):
-    with open(config_path, 'r', encoding='utf-8') as f:
-        json_data = json.load(f)
+def _transition_key(layer):
+    """Các layer transition cùng file + đoạn cắt dùng chung 1 chuỗi decode/scale"""
+    return layer['path'], layer.get('cutFrom', 0), layer.get('cutTo')
+
+
+def build_graph_cmd(json_data, filter_file):
+    """
+    Dựng lệnh ffmpeg của renderer "graph" (1 filter graph cho cả spec, renderer
+    mặc định của editor): từng clip (nền + logo) ghép bằng concat, transition
+    overlay lên timeline đã ghép theo thời điểm tuyệt đối của plan - giống
+    build_single_pass_cmd, transition nằm vắt qua ranh giới 2 clip.
+    Ghi filter graph vào filter_file. Trả về (cmd, duration) - duration là
+    thời lượng timeline (giây).
+    """
     width = json_data.get('width', 1920)
     height = json_data.get('height', 1080)
     fps = json_data.get('fps', 25)
@@ -36,35 +59,56 @@ def generate_ffmpeg_command(config_path):
     inputs_list = []
     filter_chains = []
     concat_segments = []
+    transitions = []
 
     # ==========================================
-    # TÍNH TOÁN TIMELINE TÍCH LŨY
+    # TIMELINE: vị trí/độ dài từng clip theo frame (render_plan)
     # ==========================================
-    cumulative_time = 0.0
-    clip_start_times = []
+    plan = compile_plan(json_data, fps)
+    cumulative_time = plan.duration
 
+    # ==========================================
+    # INPUT DÙNG CHUNG (LOGO / TRANSITION)
+    # ==========================================
+    # Logo và transition giống nhau ở mọi clip -> decode + xử lý 1 lần rồi
+    # split ra cho từng clip, thay vì N chuỗi loop/trim/scale cho cùng 1 file
+    logo_uses = Counter()
+    transition_uses = Counter()
     for clip in json_data['clips']:
-        clip_start_times.append(cumulative_time)
-
-        # Tính duration của clip
-        clip_duration = clip.get('duration')
-        if not clip_duration:
-            # Tìm main video layer để lấy duration
-            main_video = next((l for l in clip.get('layers', []) if l['type'] == 'video'), None)
-            if main_video:
-                cut_from = main_video.get('cutFrom', 0)
-                cut_to = main_video.get('cutTo')
-                clip_duration = cut_to - cut_from if cut_to else 0
-
-        cumulative_time += clip_duration if clip_duration else 0
+        layers = clip.get('layers', [])
+        main_video = next((l for l in layers if l['type'] == 'video'), None)
+        for layer in layers:
+            if layer['type'] == 'image-overlay':
+                logo_uses[layer['path']] += 1
+            elif layer['type'] == 'video' and layer is not main_video:
+                transition_uses[_transition_key(layer)] += 1
+
+    shared_pads = {}
+    for n, (path, count) in enumerate(logo_uses.items()):
+        # Logo đã scale sẵn về canvas (asset cache). Chỉ có 1 frame: overlay tự
+        # lặp lại frame cuối (eof_action=repeat) nên không cần loop
+        idx = get_input_index(prepare_logo(path, width, height, fit="canvas"), input_map, inputs_list)
+        pads = [f"logo_src_{n}_{k}" for k in range(count)]
+        filter_chains.append(f"[{idx}:v]format=rgba,split={count}" + "".join(f"[{p}]" for p in pads))
+        shared_pads[("logo", path)] = pads
+
+    for n, (key, count) in enumerate(transition_uses.items()):
+        path, cut_from, cut_to = key
+        idx = get_input_index(path, input_map, inputs_list)
+        trim_part = f"[{idx}:v]trim=start={cut_from}"
+        if cut_to:
+            trim_part += f":end={cut_to}"
+        pads = [f"trans_src_{n}_{k}" for k in range(count)]
+        filter_chains.append(f"{trim_part},setpts=PTS-STARTPTS,scale={width}:{height},split={count}"
+                             + "".join(f"[{p}]" for p in pads))
+        shared_pads[("transition", key)] = pads
 
     # ==========================================
     # XỬ LÝ VIDEO CLIPS
     # ==========================================
     for i, clip in enumerate(json_data['clips']):
-        clip_duration = clip.get('duration')
+        segment = plan.segments[i]
         layers = clip.get('layers', [])
-        clip_start_time = clip_start_times[i]
 
         out_v = f"v_clip_{i}_out"
         out_a = f"a_clip_{i}_out"
@@ -93,27 +137,25 @@ def generate_ffmpeg_command(config_path):
         if main_video_layer:
             path = main_video_layer['path']
             idx = get_input_index(path, input_map, inputs_list)
-            cut_to = main_video_layer.get('cutTo')
-            cut_from = main_video_layer.get('cutFrom', 0)
-            segment_duration = cut_to - cut_from if cut_to else None
+            cut_from = segment['cut_from']
+            segment_duration = segment['duration']
+            # Cắt theo độ dài đã làm tròn frame của plan -> hình và tiếng dài bằng nhau
+            cut_to = cut_from + segment_duration
 
-            trim_cmd = f"[{idx}:v]trim=start={cut_from}"
-            if cut_to:
-                trim_cmd += f":end={cut_to}"
+            trim_cmd = f"[{idx}:v]trim=start={cut_from}:end={cut_to:.6f}"
             trim_cmd += f",setpts=PTS-STARTPTS[v_tmp_{i}_raw]"
             filter_chains.append(trim_cmd)
 
             if json_data.get('keepSourceAudio', True):
-                atrim_cmd = f"[{idx}:a]atrim=start={cut_from}"
-                if cut_to:
-                    atrim_cmd += f":end={cut_to}"
+                atrim_cmd = f"[{idx}:a]atrim=start={cut_from}:end={cut_to:.6f}"
                 atrim_cmd += f",asetpts=PTS-STARTPTS[{out_a}]"
                 filter_chains.append(atrim_cmd)
                 has_audio = True
 
             if main_video_layer.get('resizeMode') == 'contain-blur':
+                background = main_video_layer.get('background')
                 bg_chain = (f"[v_tmp_{i}_raw]split=2[bg_{i}][fg_{i}];"
-                            f"[bg_{i}]scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},boxblur=20:10[bg_blur_{i}];"
+                            f"[bg_{i}]{blur_background_filter(width, height, 20, 10, background, fps)}[bg_blur_{i}];"
                             f"[fg_{i}]scale={width}:{height}:force_original_aspect_ratio=decrease[fg_scaled_{i}];"
                             f"[bg_blur_{i}][fg_scaled_{i}]overlay=(W-w)/2:(H-h)/2[v_base_{i}]")
                 filter_chains.append(bg_chain)
@@ -125,7 +167,7 @@ def generate_ffmpeg_command(config_path):
 
         elif fill_color_layer:
             color = fill_color_layer.get('color', '#000000')
-            dur = clip_duration if clip_duration else 0.1
+            dur = segment['duration']
             segment_duration = dur
 
             color_cmd = f"color=c={color}:s={width}x{height}:d={dur}[v_base_{i}]"
@@ -138,53 +180,17 @@ def generate_ffmpeg_command(config_path):
 
         # --- 3. OVERLAY LOGOS TRƯỚC (logo ở giữa, sẽ bị transition che khi có transition) ---
         for logo_idx, layer in enumerate(logo_layers):
-            path = layer['path']
-            idx = get_input_index(path, input_map, inputs_list)
-            layer_pad = f"logo_{i}_{logo_idx}"
-
-            # Thêm loop để logo không bị hết, scale về kích thước canvas
-            cmd = f"[{idx}:v]loop=loop=-1:size=1:start=0,scale={width}:{height}:force_original_aspect_ratio=decrease[{layer_pad}]"
-            filter_chains.append(cmd)
+            layer_pad = shared_pads[("logo", layer['path'])].pop(0)
 
             # Logo luôn hiển thị, không cần enable condition phức tạp
             # Transition sẽ tự động che logo khi xuất hiện
             next_pad = f"v_clip_{i}_logo_{logo_idx}"
-            overlay_cmd = f"{current_v_pad}[{layer_pad}]overlay=(W-w)/2:(H-h)/2:shortest=1[{next_pad}]"
+            overlay_cmd = f"{current_v_pad}[{layer_pad}]overlay=(W-w)/2:(H-h)/2:eof_action=repeat[{next_pad}]"
             filter_chains.append(overlay_cmd)
             current_v_pad = f"[{next_pad}]"
 
-        # --- 4. OVERLAY TRANSITIONS SAU CÙNG (đè lên logo, che logo khi có transition) ---
-        overlay_idx = 0
-        for layer in transition_layers:
-            path = layer['path']
-            idx = get_input_index(path, input_map, inputs_list)
-            layer_pad = f"layer_{i}_{overlay_idx}"
-
-            cut_from = layer.get('cutFrom', 0)
-            cut_to = layer.get('cutTo')
-            start_time = layer.get('start', 0)
-            stop_time = layer.get('stop')
-
-            trim_part = f"[{idx}:v]trim=start={cut_from}"
-            if cut_to:
-                trim_part += f":end={cut_to}"
-            trim_part += f",setpts=PTS-STARTPTS[{layer_pad}_raw]"
-            filter_chains.append(trim_part)
-
-            scale_trans = f"[{layer_pad}_raw]scale={width}:{height}[{layer_pad}]"
-            filter_chains.append(scale_trans)
-
-            # Shift PTS để transition xuất hiện đúng thời điểm
-            fps_fix = f"[{layer_pad}]setpts=PTS+{start_time}/TB[{layer_pad}_shifted]"
-            filter_chains.append(fps_fix)
-
-            # Enable transition video trong khoảng thời gian của nó
-            enable_expr = f"enable='between(t,{start_time},{stop_time})'"
-            next_pad = f"v_clip_{i}_trans_{overlay_idx}"
-            overlay_cmd = f"{current_v_pad}[{layer_pad}_shifted]overlay=0:0:{enable_expr}[{next_pad}]"
-            filter_chains.append(overlay_cmd)
-            current_v_pad = f"[{next_pad}]"
-            overlay_idx += 1
+        # --- 4. TRANSITION: overlay sau concat (bước 6), vắt qua ranh giới clip ---
+        transitions.extend(zip(transition_layers, segment['overlays']))
 
         # --- 5. KẾT THÚC CLIP ---
         if not has_audio:
@@ -200,31 +206,46 @@ def generate_ffmpeg_command(config_path):
     # CONCAT & MIX
     # ==========================================
     n_clips = len(json_data['clips'])
-    concat_cmd = "".join(concat_segments) + f"concat=n={n_clips}:v=1:a=1[main_video][main_audio_raw]"
+    concat_cmd = "".join(concat_segments) + f"concat=n={n_clips}:v=1:a=1[concat_video][main_audio_raw]"
     filter_chains.append(concat_cmd)
 
-    audio_tracks = json_data.get('audioTracks', [])
+    # --- 6. OVERLAY TRANSITIONS SAU CÙNG (đè lên logo, che logo khi có transition) ---
+    # Thời điểm tuyệt đối theo frame của plan (không dùng giây ghi trong spec),
+    # trùng khung với audioTracks bên dưới
+    current_v_pad = "[concat_video]"
+    for k, (layer, overlay) in enumerate(transitions):
+        # Transition đã trim + scale 1 lần ở phần input dùng chung
+        src_pad = shared_pads[("transition", _transition_key(layer))].pop(0)
+        start_time = round(overlay['start'], 6)
+        stop_time = round(start_time + overlay['duration'], 6)
+
+        # Shift PTS để transition xuất hiện đúng thời điểm
+        filter_chains.append(f"[{src_pad}]setpts=PTS+{start_time}/TB[trans_{k}_shifted]")
+
+        # Enable transition video trong khoảng thời gian của nó
+        enable_expr = f"enable='between(t,{start_time},{stop_time})'"
+        next_pad = f"v_trans_{k}"
+        filter_chains.append(f"{current_v_pad}[trans_{k}_shifted]overlay=0:0:{enable_expr}[{next_pad}]")
+        current_v_pad = f"[{next_pad}]"
+    filter_chains.append(f"{current_v_pad}null[main_video]")
+
+    # audioTracks theo plan: vị trí/độ dài theo frame, khớp đúng frame với transition
     mix_inputs = ["[main_audio_raw]"]
 
-    for k, track in enumerate(audio_tracks):
-        path = track['path']
-        idx = get_input_index(path, input_map, inputs_list)
-        start = track.get('start', 0)
-        cut_from = track.get('cutFrom', 0)
-        cut_to = track.get('cutTo')
-        mix_vol = track.get('mixVolume', 1)
+    for k, track in enumerate(plan.audio_tracks):
+        if track['frames'] <= 0 or track['start_frame'] >= plan.total_frames:
+            continue
+        idx = get_input_index(track['path'], input_map, inputs_list)
 
         track_pad = f"track_{k}"
         delayed_pad = f"track_{k}_delayed"
 
-        cmd = f"[{idx}:a]atrim=start={cut_from}"
-        if cut_to:
-            cmd += f":end={cut_to}"
-        cmd += f",asetpts=PTS-STARTPTS,volume={mix_vol}[{track_pad}]"
+        cmd = (f"[{idx}:a]atrim=start={track['cut_from']}:duration={track['duration']},"
+               f"asetpts=PTS-STARTPTS,volume={track['volume']}[{track_pad}]")
         filter_chains.append(cmd)
 
-        delay_ms = int(start * 1000)
-        delay_cmd = f"[{track_pad}]adelay={delay_ms}|{delay_ms}[{delayed_pad}]"
+        delay_ms = int(round(track['start'] * 1000))
+        delay_cmd = f"[{track_pad}]adelay={delay_ms}:all=1[{delayed_pad}]"
         filter_chains.append(delay_cmd)
         mix_inputs.append(f"[{delayed_pad}]")
 
@@ -233,19 +254,12 @@ def generate_ffmpeg_command(config_path):
             mix_inputs) + f"amix=inputs={len(mix_inputs)}:duration=first:dropout_transition=0[final_audio]"
         filter_chains.append(mix_cmd)
     else:
-        filter_chains.append(f"[main_audio_raw]acopy[final_audio]")
+        filter_chains.append("[main_audio_raw]acopy[final_audio]")
 
-    # ==========================================
-    # EXECUTE
-    # ==========================================
     # Ghi filter_complex vào file để tránh command quá dài trên Windows
-    temp_dir = os.path.dirname(out_path) or "."
-    filter_file = os.path.join(temp_dir, f"ffmpeg_filter_{uuid.uuid4().hex[:8]}.txt")
-    
-    filter_content = ";".join(filter_chains)
     with open(filter_file, "w", encoding="utf-8") as f:
-        f.write(filter_content)
-    
+        f.write(";".join(filter_chains))
+
     cmd_args = [FFMPEG_EXEC, "-y"]
     for inp in inputs_list:
         cmd_args.extend(["-i", inp])
@@ -253,107 +267,395 @@ def generate_ffmpeg_command(config_path):
     # Sử dụng -filter_complex_script thay vì -filter_complex để tránh lỗi command quá dài
     cmd_args.extend(["-filter_complex_script", filter_file])
     cmd_args.extend(["-map", "[main_video]", "-map", "[final_audio]"])
+    # Encoder nhanh nhất chạy được trên máy (NVENC/AMF/QSV, không có thì libx264)
+    cmd_args.extend(video_encoder_args(quality=23))
     cmd_args.extend([
-        "-c:v", "h264_nvenc",
-        "-preset", "p6",
-        "-tune", "hq",
-        "-rc", "vbr",
-        "-cq", "23",
-        "-b:v", "0",
         "-c:a", "aac",
         "-b:a", "192k",
         "-r", str(fps),
         out_path
     ])
+    return cmd_args, cumulative_time
+
+
+def generate_ffmpeg_command(config_path):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        json_data = json.load(f)
+    out_path = json_data.get('outPath', 'output.mp4')
+    filter_file = scratch_path("ffmpeg_filter_", ".txt")
 
     try:
-        subprocess.run(cmd_args, check=True)
-        # Xóa file filter tạm
-        if os.path.exists(filter_file):
-            os.remove(filter_file)
-        # Tìm root window để messagebox hiển thị phía trên
-        root = tk._default_root
-        if root:
-            for widget in root.winfo_children():
-                if isinstance(widget, tk.Toplevel) and widget.winfo_exists():
-                    widget.attributes('-topmost', True)
-                    messagebox.showinfo("Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}",
-                                        parent=widget)
-                    widget.attributes('-topmost', False)
-                    break
-            else:
-                messagebox.showinfo("Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}")
-        else:
-            messagebox.showinfo("Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}")
+        # File filter tạm luôn bị xoá; video đầu ra chỉ giữ lại khi render xong
+        # (huỷ/lỗi -> xoá, crash -> dọn ở lần khởi động sau)
+        with scratch(filter_file):
+            cmd_args, cumulative_time = build_graph_cmd(json_data, filter_file)
+            check_output_space(out_path, cumulative_time)
+            # Thời lượng timeline đã tính trong plan -> % hoàn thành + ETA chính xác
+            with scratch(out_path, keep=True), RenderReport(
+                    out_path, renderer="graph",
+                    meta={"clips": len(json_data['clips']), "duration": cumulative_time}):
+                with report_stage("render"):
+                    run(cmd_args, duration=cumulative_time, label="render")
     except subprocess.CalledProcessError as e:
-        # Xóa file filter tạm
-        if os.path.exists(filter_file):
-            os.remove(filter_file)
-        # Tìm root window để messagebox hiển thị phía trên
-        root = tk._default_root
-        if root:
-            for widget in root.winfo_children():
-                if isinstance(widget, tk.Toplevel) and widget.winfo_exists():
-                    widget.attributes('-topmost', True)
-                    messagebox.showerror("Lỗi render",
-                                         f"FFmpeg render thất bại!\n\nMã lỗi: {e.returncode}\n\nVui lòng kiểm tra console để xem chi tiết lỗi.",
-                                         parent=widget)
-                    widget.attributes('-topmost', False)
-                    break
-            else:
-                messagebox.showerror("Lỗi render",
-                                     f"FFmpeg render thất bại!\n\nMã lỗi: {e.returncode}\n\nVui lòng kiểm tra console để xem chi tiết lỗi.")
-        else:
-            messagebox.showerror("Lỗi render",
-                                 f"FFmpeg render thất bại!\n\nMã lỗi: {e.returncode}\n\nVui lòng kiểm tra console để xem chi tiết lỗi.")
+        notify("error", "Lỗi render",
+               f"FFmpeg render thất bại!\n\nMã lỗi: {e.returncode}\n\nVui lòng kiểm tra console để xem chi tiết lỗi.")
         raise
 
+    notify("info", "Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}")
+    return out_path
+
+
+def run(cmd, duration=None, label=None):
+    """
+    Chạy 1 lệnh ffmpeg qua process manager (tiến trình, ETA, metrics,
+    huỷ/tạm dừng). Huỷ -> RenderCancelled.
+    """
+    return get_process_manager().run(cmd, duration=duration, label=label)
+
+
+def cleanup_stale_render_files():
+    """Gọi lúc khởi động: dọn file tạm của các lần render bị chết giữa chừng"""
+    removed = cleanup_stale_scratch()
+    for cache in (ASSET_CACHE, SEGMENT_CACHE, THUMB_CACHE):
+        removed += cache.sweep_partials()
+    return removed
+
+
+def resolve_render_workers(workers=None, config_dict=None):
+    """
+    Số job ffmpeg per-clip chạy song song.
+    Ưu tiên: tham số > config kênh "render_workers" > biến môi trường
+    FUNNYVIDEO_RENDER_WORKERS > số core CPU.
+    """
+    for value in (workers,
+                  (config_dict or {}).get("render_workers"),
+                  os.environ.get("FUNNYVIDEO_RENDER_WORKERS")):
+        try:
+            if value is not None and int(value) > 0:
+                return int(value)
+        except (TypeError, ValueError):
+            pass
+    return os.cpu_count() or 1
+
+
+def run_parallel(cmds, workers=None):
+    """
+    Chạy nhiều lệnh ffmpeg độc lập, tối đa `workers` tiến trình cùng lúc.
+    - Mỗi lệnh ghi ra file riêng nên thứ tự output luôn cố định theo danh sách.
+    - Một lệnh lỗi -> huỷ các lệnh chưa chạy, kill các lệnh đang chạy,
+      rồi raise CalledProcessError của lệnh lỗi đầu tiên.
+    - Đang tạm dừng -> lệnh chưa chạy chờ tới khi tiếp tục (ranh giới segment).
+    """
+    workers = min(resolve_render_workers(workers), len(cmds))
+    get_process_manager().run_many(cmds, workers)
+
+
+def blur_background_filter(width, height, blur_radius, blur_power=1, background=None, fps=None):
+    """Chuỗi filter nền blur chạy trên CPU (filter_backends.FilterBackend.background)"""
+    return CPU_BACKEND.background(width, height, blur_radius, blur_power, background, fps)
+
+
+def _clip_filter_complex(width, height, fps, blur_amount, with_logo, background=None, filter_backend=None):
+    return (filter_backend or CPU_BACKEND).clip_graph(width, height, fps, blur_amount, with_logo, background)
+
+
+# Mọi segment trung gian (clip, transition) encode cùng 1 bộ tham số để nối
+# được bằng concat demuxer + "-c copy" thay vì encode lại cả video cuối
+SEGMENT_TIMESCALE = 90000
+
+CONCAT_MODE_COPY = "copy"
+CONCAT_MODE_REENCODE = "reencode"
+DEFAULT_CONCAT_MODE = CONCAT_MODE_COPY
+
+# Cách chuyển segment sang bước nối (config kênh "segment_handoff"):
+# file = MP4 trong segment cache rồi concat; pipe = từng segment ghi NUT qua
+# FIFO thẳng vào lệnh nối, không ghi segment ra đĩa (chỉ POSIX)
+SEGMENT_HANDOFF_FILE = "file"
+SEGMENT_HANDOFF_PIPE = "pipe"
+DEFAULT_SEGMENT_HANDOFF = SEGMENT_HANDOFF_FILE
+STREAM_SEGMENT_FORMAT = "nut"
+CONCAT_INPUT_ARGS = ["-f", "concat", "-safe", "0"]
+
+
+# Segment render trên render farm: máy khác chưa chắc có GPU như máy điều phối
+SEGMENT_FARM_ENCODER = "libx264"
+
+
+def _fixed_gop_args(encoder, gop):
+    """GOP cố định + đóng, không chèn keyframe theo cảnh - theo từng encoder"""
+    if encoder == "h264_nvenc":
+        return ["-g", gop, "-strict_gop", "1", "-no-scenecut", "1", "-forced-idr", "1"]
+    if encoder == "h264_qsv":
+        return ["-g", gop, "-idr_interval", "0", "-flags", "+cgop"]
+    if encoder == "h264_amf":
+        return ["-g", gop, "-gops_per_idr", "1", "-header_insertion_mode", "idr"]
+    return ["-g", gop, "-keyint_min", gop, "-sc_threshold", "0", "-flags", "+cgop"]
+
+
+def segment_video_args(fps, encoder=None):
+    """
+    Tham số video chung cho segment: encoder nhanh nhất chạy được trên máy
+    (video_encoder_args, `encoder` = chỉ định), cùng profile/pix_fmt, GOP cố
+    định và đóng (mỗi segment bắt đầu bằng keyframe), cùng timescale trong MP4
+    """
+    encoder = encoder or best_encoder()
+    gop = str(max(1, int(round(float(fps) * 2))))
+    return (video_encoder_args(quality=18, encoder=encoder)
+            + ["-profile:v", "high", "-pix_fmt", "yuv420p"]
+            + _fixed_gop_args(encoder, gop)
+            + ["-video_track_timescale", str(SEGMENT_TIMESCALE)])
+
+
+SEGMENT_AUDIO_ARGS = ["-c:a", "aac", "-b:a", "320k", "-ar", "48000", "-ac", "2"]
 
-def run(cmd):
-    print("⚙️ Run:", " ".join(shlex.quote(c) for c in cmd))
-    subprocess.run(cmd, check=True)
+
+def build_clip_cmd(video_path, out_path, width, height, fps, blur_amount,
+                   keep_audio, logo_path, threads=None, cut_from=None, cut_to=None,
+                   decode_args=None, background=None, frames=None, filter_backend=None, encoder=None):
+    """
+    Lệnh ffmpeg render 1 clip: nền blur + video chính ở giữa (+ logo)
+    cut_from/cut_to: đoạn cắt (giây) theo cutFrom/cutTo của layer
+    decode_args: tham số hwaccel cho input, None = theo filter_backend
+    background: tuỳ chọn nền blur (render_config.background_options)
+    frames: ra đúng số frame này (thiếu -> lặp frame cuối), dùng khi thời
+    lượng segment phải biết trước (segment_handoff "pipe")
+    filter_backend: filter_backends (cpu / cuda / vaapi), None = cpu
+    encoder: encoder của segment (segment_video_args), None = tốt nhất trên máy
+    """
+    filter_backend = filter_backend or CPU_BACKEND
+    is_transition_clip = "Transition.mov" in video_path
+    with_logo = bool(not is_transition_clip and logo_path and os.path.exists(logo_path))
+
+    inputs = []
+    if cut_from:
+        inputs += ["-ss", f"{float(cut_from):.3f}"]
+    if cut_to is not None:
+        inputs += ["-t", f"{max(0.0, float(cut_to) - float(cut_from or 0)):.3f}"]
+    inputs += ["-i", video_path]
+    if with_logo:
+        inputs += ["-i", logo_path]
+    filter_complex = _clip_filter_complex(width, height, fps, blur_amount, with_logo, background, filter_backend)
+    out_label = "[outv]"
+    if frames:
+        filter_complex.append("[outv]tpad=stop=-1:stop_mode=clone[outv_full]")
+        out_label = "[outv_full]"
+
+    if decode_args is None:
+        decode_args = filter_backend.input_args()
+    cmd = ["ffmpeg", "-y"] + filter_backend.global_args() + list(decode_args) + inputs
+    cmd += ["-filter_complex", ";".join(filter_complex)]
+    cmd += ["-map", out_label]
+
+    if keep_audio:
+        cmd += ["-map", "0:a?"]
+
+    cmd += segment_video_args(fps, encoder)
+    if frames:
+        cmd += ["-frames:v", str(int(frames))]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    if keep_audio:
+        cmd += SEGMENT_AUDIO_ARGS
+
+    cmd += [out_path]
+    return cmd
+
+
+def build_transition_cmd(transition_file, out_path, width, height, fps, threads=None, pix_fmt="yuv420p",
+                         encoder=None):
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", transition_file,
+        "-vf",
+        f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},fps={fps},setsar=1,format={pix_fmt}",
+    ] + segment_video_args(fps, encoder)
+    if threads:
+        cmd += ["-threads", str(threads)]
+    cmd += ["-an", out_path]
+    return cmd
+
+
+def _prepare_asset(src_path, kind, ext, params, build_cmd, farm=None, shared=False):
+    """
+    Chuẩn hoá 1 asset (transition/logo) qua asset cache.
+    Key = hash nội dung file nguồn + tham số chuẩn hoá, nên cùng 1 asset chỉ
+    encode 1 lần cho mọi clip, mọi batch và cả các lần render sau.
+    farm: chạy lệnh chuẩn hoá trên render farm (render_farm) thay vì máy này
+    shared: asset là input của lệnh chạy trên farm -> trả về bản trong thư
+    mục farm (mọi máy cùng thấy) thay vì asset cache cục bộ của máy này
+    """
+    key = make_key({"kind": kind, "src": file_digest(src_path), **params})
+    cached = ASSET_CACHE.get(key, ext)
+    if cached:
+        print(f"♻️ Dùng lại {kind} đã chuẩn hoá: {cached}")
+        return farm.publish(key, cached, ext) if farm and shared else cached
+
+    tmp_out = ASSET_CACHE.reserve(key, ext)
+    try:
+        if farm:
+            result = farm.run_tasks([(key, build_cmd("{out}"), ext)], local_workers=1, label=kind)[key]
+            shutil.copyfile(result, tmp_out)
+        else:
+            run(build_cmd(tmp_out), label=f"{kind} {os.path.basename(src_path)}")
+    except BaseException:
+        ASSET_CACHE.discard(tmp_out)
+        raise
+    cached = ASSET_CACHE.put(key, tmp_out, ext)
+    return result if farm and shared else cached
+
+
+def prepare_transition(transition_file, width, height, fps, pix_fmt="yuv420p", farm=None):
+    """Transition đã scale/crop/fps/format sẵn, ghép thẳng được vào chuỗi concat"""
+    encoder = SEGMENT_FARM_ENCODER if farm else None
+    params = {
+        "width": width, "height": height, "fps": fps, "pix_fmt": pix_fmt,
+        "args": build_transition_cmd("{src}", "{out}", width, height, fps, pix_fmt=pix_fmt, encoder=encoder),
+    }
+    return _prepare_asset(
+        transition_file, "transition", ".mp4", params,
+        lambda out: build_transition_cmd(transition_file, out, width, height, fps, pix_fmt=pix_fmt,
+                                         encoder=encoder),
+        farm
+    )
+
+
+def prepare_logo(logo_path, width, height, fit="native", farm=None):
+    """
+    Logo RGBA đã chuẩn hoá cho canvas width x height.
+    fit="native": giữ kích thước gốc (chỉ thu nhỏ nếu lớn hơn canvas)
+    fit="canvas": scale vừa khít canvas (giữ tỉ lệ)
+    farm: logo là input của các clip render trên farm -> trả về đường dẫn
+    trong thư mục farm thay vì Cache/assets của máy điều phối
+    """
+    if fit == "canvas":
+        vf = f"scale={width}:{height}:force_original_aspect_ratio=decrease,format=rgba"
+    else:
+        vf = f"scale='min(iw,{width})':'min(ih,{height})':force_original_aspect_ratio=decrease,format=rgba"
+    params = {"width": width, "height": height, "pix_fmt": "rgba", "vf": vf}
+    return _prepare_asset(
+        logo_path, "logo", ".png", params,
+        lambda out: ["ffmpeg", "-y", "-i", logo_path, "-vf", vf, "-frames:v", "1", out],
+        farm, shared=True
+    )
+
+
+def _encoder_threads(workers):
+    """Chia đều core cho các job song song để không oversubscribe CPU"""
+    if workers <= 1:
+        return None
+    return max(1, (os.cpu_count() or 1) // workers)
 
 
 # Số clip tối đa trong một batch để tránh command quá dài
 MAX_CLIPS_PER_BATCH = 10
 
+# Số phiên encode GPU (NVENC) tối đa chạy cùng lúc - card consumer thường giới hạn
+MAX_ENCODER_SESSIONS = 3
+
+
+def _segment_signature(info):
+    """Các thuộc tính phải trùng nhau thì mới nối được bằng -c copy"""
+    return (
+        info.get("codec"), info.get("profile"), info.get("pix_fmt"),
+        info.get("width"), info.get("height"),
+        round(info.get("fps") or 0, 3), round(info.get("sar") or 1, 3),
+    )
+
+
+def _ensure_copy_compatible(video_files, temp_dir):
+    """
+    Kiểm tra (qua media index) các segment có cùng codec/profile/pix_fmt/
+    kích thước/fps không. Segment lệch chuẩn (chuẩn = cấu hình chiếm đa số)
+    được encode lại theo segment_video_args, còn lại giữ nguyên.
+    """
+    infos = probe_media_many(video_files)
+    signatures = {f: _segment_signature(infos[f]) for f in video_files if infos.get(f)}
+    if not signatures:
+        return list(video_files)
+
+    reference = Counter(signatures.values()).most_common(1)[0][0]
+    codec, _, _, width, height, fps, _ = reference
+    if codec != "h264":
+        # Chuẩn đa số không phải segment của mình -> encode lại toàn bộ
+        fps = fps or 30
+        width, height = width or 1920, height or 1080
+
+    result = []
+    fix_cmds = []
+    threads = _encoder_threads(len(video_files))
+    for f in video_files:
+        if codec == "h264" and signatures.get(f) == reference:
+            result.append(f)
+            continue
+        fixed = os.path.join(temp_dir, f"compat_{uuid.uuid4().hex[:8]}.mp4")
+        print(f"⚠️ Segment không tương thích, encode lại: {f}")
+        cmd = [
+            "ffmpeg", "-y", "-i", f,
+            "-vf",
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,fps={fps},setsar=1,format=yuv420p",
+            "-an",
+        ] + segment_video_args(fps)
+        if threads:
+            cmd += ["-threads", str(threads)]
+        fix_cmds.append(cmd + [fixed])
+        result.append(fixed)
+    if fix_cmds:
+        run_parallel(fix_cmds)
+    return result
+
+
+def _concat_video_cmd(video_files, output_path, temp_dir, mode=DEFAULT_CONCAT_MODE, output_args=()):
+    """
+    Lệnh concat demuxer (chỉ lấy hình) + file list đã ghi trong temp_dir.
+    output_args: vd ["-f", "nut"] khi output_path là pipe:1
+    Trả về (cmd, list_file).
+    """
+    if mode == CONCAT_MODE_COPY:
+        video_files = _ensure_copy_compatible(video_files, temp_dir)
+
+    list_file = os.path.join(temp_dir, f"concat_list_{uuid.uuid4().hex[:8]}.txt")
+    _write_concat_list(list_file, video_files)
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", list_file,
+        "-map", "0:v",
+    ]
+    cmd += _concat_video_args(mode)
+    cmd += ["-an"] + list(output_args) + [output_path]
+    return cmd, list_file
+
+
+def _concat_video_args(mode=DEFAULT_CONCAT_MODE):
+    if mode == CONCAT_MODE_COPY:
+        # Bỏ NAL SEI (type 6) của x264 ở đầu mỗi segment - nguyên nhân cảnh báo
+        # "Late SEI is not implemented" từng phải re-encode để né
+        return ["-c:v", "copy", "-bsf:v", "filter_units=remove_types=6"]
+    return video_encoder_args(quality=18)
+
 
-def concat_videos_simple(video_files, output_path, temp_dir=None):
+def concat_videos_simple(video_files, output_path, temp_dir=None, mode=DEFAULT_CONCAT_MODE):
     """
-    Concat các video files bằng phương pháp concat demuxer (nhanh, không re-encode)
+    Concat các video files bằng concat demuxer (chỉ lấy hình, audio xử lý riêng).
+    mode="copy": nối bằng -c copy (segment lệch chuẩn được encode lại trước)
+    mode="reencode": encode lại toàn bộ bằng encoder nhanh nhất của máy
     """
     if not video_files:
         return None
     
     if len(video_files) == 1:
         # Chỉ có 1 file, copy trực tiếp
-        import shutil
         shutil.copy(video_files[0], output_path)
         return output_path
     
     # Tạo file list cho concat demuxer
     if temp_dir is None:
         temp_dir = os.path.dirname(output_path) or "."
-    
-    list_file = os.path.join(temp_dir, f"concat_list_{uuid.uuid4().hex[:8]}.txt")
-    
-    with open(list_file, "w", encoding="utf-8") as f:
-        for vf in video_files:
-            # Escape đường dẫn cho ffmpeg concat
-            escaped_path = vf.replace("\\", "/").replace("'", "'\\''")
-            f.write(f"file '{escaped_path}'\n")
-    
-    # Re-encode để tránh lỗi "Late SEI is not implemented" khi concat
-    cmd = [
-        "ffmpeg", "-y",
-        "-f", "concat",
-        "-safe", "0",
-        "-i", list_file,
-        "-c:v", "h264_nvenc", "-preset", "p6",
-        "-c:a", "aac", "-b:a", "320k",
-        output_path
-    ]
-    
+
+    cmd, list_file = _concat_video_cmd(video_files, output_path, temp_dir, mode)
     try:
         run(cmd)
     finally:
@@ -363,110 +665,176 @@ def concat_videos_simple(video_files, output_path, temp_dir=None):
     return output_path
 
 
-def render_batch_clips(batch_clips, batch_idx, width, height, fps, blur_amount, 
-                       keep_audio, logo_path, transition_file, temp_dir):
+def segment_cache_key(video_path, cut_from, cut_to, width, height, fps, blur_amount,
+                      keep_audio, logo_path, background=None, filter_backend=None, frames=None,
+                      encoder=None):
+    """
+    Key của 1 clip đã render trong segment cache: file nguồn (đường dẫn + size
+    + mtime), đoạn cắt, số frame, blur, logo, kích thước/fps và toàn bộ tham
+    số encode (lấy từ chính lệnh build_clip_cmd nên đổi encoder là key đổi
+    theo; filter_backend GPU scale/overlay khác CPU đôi chút -> graph khác, key khác)
     """
-    Render một batch các clips thành một file video tạm
+    with_logo = bool(logo_path and os.path.exists(logo_path))
+    return make_key({
+        "kind": "clip",
+        "src": file_fingerprint(video_path),
+        "cut": [cut_from, cut_to],
+        "logo": file_digest(logo_path) if with_logo else None,
+        # hwaccel chỉ đổi cách decode, không đổi kết quả -> không đưa vào key
+        "args": build_clip_cmd(video_path, "{out}", width, height, fps, blur_amount,
+                               keep_audio, logo_path, cut_from=cut_from, cut_to=cut_to,
+                               decode_args=[], background=background, frames=frames,
+                               filter_backend=filter_backend, encoder=encoder),
+    })
+
+
+def _segment_cut(seg):
+    """Đoạn cắt (giây) của segment plan: cut_from + đúng độ dài theo frame của plan"""
+    return seg["cut_from"], round(seg["cut_from"] + seg["duration"], 6)
+
+
+def _media_frames(path, fps):
+    """Số frame của file đã render (segment / transition đã chuẩn hoá), theo thời lượng probe"""
+    info = probe_media_many([path]).get(path)
+    if not info:
+        raise RuntimeError(f"Không đọc được thời lượng segment: {path}")
+    return max(1, round_frames(info["duration"], fps))
+
+
+def _plan_batch_clips(batch_segments, name_prefix, width, height, fps, blur_amount,
+                      logo_path, transition_segment, temp_dir, threads=None, background=None, farm=None,
+                      filter_backend=None):
     """
+    Lên danh sách lệnh ffmpeg cho các clip, chưa chạy.
+    batch_segments: segment của plan (render_plan), mỗi clip render đúng số
+    frame của plan; segment không có hình (fill) không render ở renderer này.
+    Clip đã có trong segment cache (cùng nguồn/đoạn cắt/tham số) thì dùng lại,
+    không sinh lệnh - sắp xếp lại thứ tự clip chỉ còn tốn bước concat.
+    Segment chỉ có hình, audio dựng riêng từ file nguồn (audio_timeline).
+    transition_segment: transition đã chuẩn hoá (prepare_transition), được
+    chèn giữa các clip mà không phải encode lại.
+    Trả về (cmds, clip_files, trans_files, final_sequence, sequence_sources, pending)
+    sequence_sources: segment plan ứng với từng file của final_sequence (None = transition)
+    pending: list[(key, tmp_path)] cần _run_clip_jobs đưa vào cache sau khi chạy
+    farm: lệnh sẽ chạy trên máy khác -> decode bằng CPU (hwaccel tuỳ từng máy),
+    encode bằng SEGMENT_FARM_ENCODER
+    filter_backend: dựng hình trên CPU / GPU (filter_backends)
+    """
+    cmds = []
     clip_files = []
-    
-    for idx, clip_cfg in enumerate(batch_clips):
-        video_layer = next((x for x in clip_cfg["layers"] if x["type"] == "video"), None)
-        if not video_layer:
+    clip_sources = []
+    pending = []
+    planned = {}
+    reused = 0
+    encoder = SEGMENT_FARM_ENCODER if farm else None
+
+    for seg in batch_segments:
+        if seg["kind"] != "video":
             continue
 
-        video_path = video_layer["path"]
-        tmp_out = os.path.join(temp_dir, f"tmp_clip_b{batch_idx}_{idx}_{uuid.uuid4().hex[:6]}.mp4")
-
-        is_transition_clip = "Transition.mov" in video_path
-
-        inputs = ["-i", video_path]
-        filter_complex = []
-
-        if not is_transition_clip and logo_path and os.path.exists(logo_path):
-            inputs += ["-i", logo_path]
-
-            filter_complex.append("[0:v]split=2[bg][fg]")
-            filter_complex.append(
-                f"[bg]scale={width}:{height}:force_original_aspect_ratio=increase,"
-                f"crop={width}:{height},"
-                f"boxblur={blur_amount}:1[bg_blur]"
-            )
-            filter_complex.append(
-                f"[fg]scale=-2:{height}:force_original_aspect_ratio=decrease[fg_scaled]"
-            )
-            filter_complex.append(
-                f"[bg_blur][fg_scaled]overlay=(W-w)/2:(H-h)/2[composed]"
-            )
-            filter_complex.append(
-                f"[composed][1:v]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2[with_logo]"
-            )
-            filter_complex.append(
-                f"[with_logo]fps={fps},setsar=1,format=yuv420p[outv]"
-            )
-        else:
-            filter_complex.append("[0:v]split=2[bg][fg]")
-            filter_complex.append(
-                f"[bg]scale={width}:{height}:force_original_aspect_ratio=increase,"
-                f"crop={width}:{height},"
-                f"boxblur={blur_amount}:1[bg_blur]"
-            )
-            filter_complex.append(
-                f"[fg]scale=-2:{height}:force_original_aspect_ratio=decrease[fg_scaled]"
-            )
-            filter_complex.append(
-                f"[bg_blur][fg_scaled]overlay=(W-w)/2:(H-h)/2[composed]"
-            )
-            filter_complex.append(
-                f"[composed]fps={fps},setsar=1,format=yuv420p[outv]"
-            )
-
-        cmd = ["ffmpeg", "-y", "-hwaccel", "cuda"] + inputs
-        cmd += ["-filter_complex", ";".join(filter_complex)]
-        cmd += ["-map", "[outv]"]
-
-        if keep_audio:
-            cmd += ["-map", "0:a?"]
-
-        cmd += ["-c:v", "libx264", "-preset", "medium", "-crf", "18"]
-        if keep_audio:
-            cmd += ["-c:a", "aac", "-b:a", "320k"]
-
-        cmd += [tmp_out]
-        run(cmd)
-        clip_files.append(tmp_out)
-    
-    # Render transitions cho batch này
+        video_path = seg["path"]
+        cut_from, cut_to = _segment_cut(seg)
+        clip_sources.append(seg)
+        key = segment_cache_key(video_path, cut_from, cut_to, width, height, fps, blur_amount,
+                                False, logo_path, background, filter_backend, seg["frames"], encoder)
+        if key in planned:
+            # Cùng 1 clip xuất hiện nhiều lần -> chỉ render 1 lần
+            clip_files.append(planned[key])
+            continue
+        cached = SEGMENT_CACHE.get(key, ".mp4")
+        if cached:
+            planned[key] = cached
+            clip_files.append(cached)
+            reused += 1
+            continue
+
+        tmp_out = SEGMENT_CACHE.reserve(key, ".mp4")
+        cmds.append(build_clip_cmd(video_path, tmp_out, width, height, fps, blur_amount,
+                                   False, logo_path, threads, cut_from, cut_to,
+                                   decode_args=[] if farm else None, background=background,
+                                   frames=seg["frames"], filter_backend=filter_backend, encoder=encoder))
+        pending.append((key, tmp_out))
+        planned[key] = SEGMENT_CACHE.path_for(key, ".mp4")
+        clip_files.append(planned[key])
+
+    if reused:
+        print(f"♻️ Dùng lại {reused}/{len(clip_files)} clip {name_prefix}đã render từ cache")
+
+    # Transitions giữa các clip (cùng 1 file đã chuẩn hoá)
     trans_files = []
-    if transition_file:
-        for idx in range(len(clip_files) - 1):
-            trans_tmp = os.path.join(temp_dir, f"tmp_trans_b{batch_idx}_{idx}_{uuid.uuid4().hex[:6]}.mp4")
+    if transition_segment:
+        trans_files = [transition_segment] * max(0, len(clip_files) - 1)
 
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", transition_file,
-                "-vf",
-                f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},fps={fps},setsar=1,format=yuv420p",
-                "-c:v", "libx264",
-                "-preset", "medium",
-                "-crf", "18",
-                "-an",
-                trans_tmp
-            ]
-            run(cmd)
-            trans_files.append(trans_tmp)
-    
-    # Tạo sequence cho batch
     final_sequence = []
+    sequence_sources = []
     for i, clip_file in enumerate(clip_files):
         final_sequence.append(clip_file)
+        sequence_sources.append(clip_sources[i])
         if i < len(trans_files):
             final_sequence.append(trans_files[i])
-    
-    return clip_files, trans_files, final_sequence
+            sequence_sources.append(None)
+
+    return cmds, clip_files, trans_files, final_sequence, sequence_sources, pending
+
+
+def _run_clip_jobs(cmds, pending, workers, in_use=(), farm=None):
+    """
+    Chạy các lệnh render clip rồi đưa kết quả vào segment cache.
+    in_use: đường dẫn segment của job hiện tại, không bị LRU xoá khi dọn cache.
+    farm: gửi lệnh lên render farm (task key = key segment cache), máy này
+    chạy cùng tối đa `workers` task rồi chép kết quả về cache.
+    Lỗi -> xoá các file tạm, không để lại entry hỏng.
+    """
+    try:
+        if farm:
+            tasks = [(key, ["{out}" if arg == tmp_path else arg for arg in cmd], ".mp4")
+                     for cmd, (key, tmp_path) in zip(cmds, pending)]
+            outputs = farm.run_tasks(tasks, local_workers=workers, label="render_clips")
+            for key, tmp_path in pending:
+                shutil.copyfile(outputs[key], tmp_path)
+        else:
+            run_parallel(cmds, workers)
+    except BaseException:
+        # Kể cả huỷ/SIGTERM (SystemExit) - không để lại file .part trong cache
+        for _, tmp_path in pending:
+            SEGMENT_CACHE.discard(tmp_path)
+        raise
+
+    protect = {os.path.splitext(os.path.basename(p))[0] for p in in_use}
+    for key, tmp_path in pending:
+        SEGMENT_CACHE.put(key, tmp_path, ".mp4", protect=protect)
+
+
+def _write_concat_list(list_file, files, durations=None):
+    """durations: thời lượng từng file (giây) - bắt buộc khi file là FIFO, demuxer không tự biết"""
+    with open(list_file, "w", encoding="utf-8") as f:
+        for i, vf in enumerate(files):
+            escaped_path = vf.replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{escaped_path}'\n")
+            if durations:
+                f.write(f"duration {durations[i]:.6f}\n")
+
+
+def resolve_segment_handoff(config_dict):
+    """segment_handoff của config kênh (đã kiểm tra, "pipe" không có FIFO -> "file")"""
+    handoff = config_dict.get("segment_handoff", DEFAULT_SEGMENT_HANDOFF)
+    if handoff not in (SEGMENT_HANDOFF_FILE, SEGMENT_HANDOFF_PIPE):
+        print(f"⚠️ segment_handoff không hợp lệ: {handoff}, dùng '{DEFAULT_SEGMENT_HANDOFF}'")
+        handoff = DEFAULT_SEGMENT_HANDOFF
+    if handoff == SEGMENT_HANDOFF_PIPE and not hasattr(os, "mkfifo"):
+        print("⚠️ segment_handoff 'pipe' cần FIFO (không có trên Windows), dùng 'file'")
+        handoff = SEGMENT_HANDOFF_FILE
+    return handoff
+
 
+def segments_render_path(n_clips, handoff):
+    """Nhánh của renderer "segments" (meta "path" trong render report): pipe / batch / direct"""
+    if handoff == SEGMENT_HANDOFF_PIPE:
+        return "pipe"
+    return "batch" if n_clips >= MAX_CLIPS_PER_BATCH else "direct"
 
-def build_and_render_from_config(video_config_path, config_dict):
+
+def build_and_render_from_config(video_config_path, config_dict, workers=None):
     with open(video_config_path, "r", encoding="utf-8") as f:
         config = json.load(f)
 
@@ -475,351 +843,798 @@ def build_and_render_from_config(video_config_path, config_dict):
     height = 1080
     fps = config_dict.get("fps")
     blur_amount = config_dict.get("blur") * 100
+    background = background_options(config_dict)
     keep_audio = config.get("keepSourceAudio", True)
     ffmpeg_opts = config.get("ffmpegOptions", {}).get("outputArgs", [])
-    clips = config["clips"]
+    # Timeline theo frame (render_plan): độ dài từng clip, số frame segment và
+    # vị trí audioTracks đều lấy từ plan - giống plan mà --dry-run in ra
+    plan = compile_plan(config, fps)
+    segments = plan.segments
+    workers = resolve_render_workers(workers, config_dict)
+    concat_mode = config_dict.get("concat_mode", DEFAULT_CONCAT_MODE)
+    if concat_mode not in (CONCAT_MODE_COPY, CONCAT_MODE_REENCODE):
+        print(f"⚠️ concat_mode không hợp lệ: {concat_mode}, dùng '{DEFAULT_CONCAT_MODE}'")
+        concat_mode = DEFAULT_CONCAT_MODE
+    handoff = resolve_segment_handoff(config_dict)
+    farm = resolve_farm(config_dict)
+    if farm and handoff == SEGMENT_HANDOFF_PIPE:
+        print("⚠️ segment_handoff 'pipe' không chạy được trên render farm, dùng 'file'")
+        handoff = SEGMENT_HANDOFF_FILE
+    # Lệnh trên farm chạy ở máy khác (GPU tuỳ máy) -> dựng hình bằng CPU
+    filter_backend = CPU_BACKEND if farm else resolve_filter_backend(config_dict)
+    if not farm and best_encoder() != "libx264" and workers > MAX_ENCODER_SESSIONS:
+        # Segment encode bằng GPU: card consumer giới hạn số phiên encode cùng lúc
+        print(f"⚡ Encoder {best_encoder()}: tối đa {MAX_ENCODER_SESSIONS} clip render cùng lúc")
+        workers = MAX_ENCODER_SESSIONS
 
     transition_file = None
     if config.get("defaults") and config["defaults"].get("transition"):
         transition_file = config["defaults"]["transition"]
+    # File gốc (còn audio) - bản đã chuẩn hoá chỉ có hình
+    transition_audio = transition_file
+
+    # Logo của clip đầu tiên (mọi clip dùng chung logo kênh)
+    logo_path = segments[0]["logo"] if segments else None
+
+    # Kiểm tra chỗ trống trước khi render: thư mục đầu ra + scratch cho file tạm
+    check_output_space(out_path, plan.duration)
+    scratch_need = estimate_scratch_bytes(
+        plan.duration, concat_mode == CONCAT_MODE_REENCODE and handoff == SEGMENT_HANDOFF_FILE)
+    temp_dir = scratch_path("ffmpeg_render_", need_bytes=scratch_need, config=config_dict)
+
+    # Báo cáo thời gian từng giai đoạn: <video>.report.json + Logs/render_reports.jsonl
+    use_batches = len(segments) >= MAX_CLIPS_PER_BATCH
+    path = segments_render_path(len(segments), handoff)
+    report = RenderReport(out_path, renderer="segments", meta={
+        "clips": len(segments), "path": path,
+        "workers": workers, "concat_mode": concat_mode, "background": background,
+        "scratch": os.path.dirname(temp_dir), "farm": farm.root if farm else None,
+        "filter_backend": filter_backend.name,
+    })
+    with report:
+        # Chuẩn hoá transition + logo 1 lần cho cả job (lấy từ asset cache nếu đã có)
+        with report_stage("prepare_assets"):
+            if transition_file:
+                transition_file = prepare_transition(transition_file, width, height, fps, farm=farm)
+            if logo_path and os.path.exists(logo_path):
+                logo_path = prepare_logo(logo_path, width, height, farm=farm)
+
+        # Thư mục tạm trên scratch (xoá khi xong/lỗi/huỷ, crash -> dọn ở lần
+        # khởi động sau); video đầu ra chỉ giữ lại khi render xong
+        # Audio lệch hình quá 1 frame -> video bị xoá, report ghi lỗi + báo cáo audio
+        with scratch(temp_dir), scratch(out_path, keep=True):
+            os.makedirs(temp_dir, exist_ok=True)
+
+            try:
+                # === SEGMENT QUA PIPE: render + nối + mux trong 1 bước, không file trung gian ===
+                if handoff == SEGMENT_HANDOFF_PIPE:
+                    print(f"📦 {len(segments)} clips, chuyển segment qua pipe...")
+                    report.meta["audio"] = _render_streamed(
+                        plan, width, height, fps, blur_amount, logo_path, transition_file,
+                        transition_audio, out_path, temp_dir, workers, concat_mode, background, keep_audio,
+                        filter_backend)
+                else:
+                    _render_segment_files(plan, width, height, fps, blur_amount, logo_path,
+                                          transition_file, transition_audio, out_path, temp_dir, workers,
+                                          concat_mode, background, keep_audio, use_batches, report, farm,
+                                          filter_backend)
+            except AudioAlignmentError as e:
+                report.meta["audio"] = e.report
+                notify("error", "Lỗi render", str(e))
+                raise
+
+        out_info = probe_media_many([out_path]).get(out_path)
+        report.meta["duration"] = out_info["duration"] if out_info else None
 
-    # Lấy logo path từ config nếu có
-    logo_path = None
-    if clips and clips[0].get("layers"):
-        overlay_layer = next((x for x in clips[0]["layers"] if x["type"] == "image-overlay"), None)
-        if overlay_layer:
-            logo_path = overlay_layer["path"]
+    print("✅ DONE:", out_path)
+    notify("info", "Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}")
+    return out_path
 
-    # Tạo thư mục tạm
-    temp_dir = os.path.join(os.path.dirname(out_path) or ".", f"ffmpeg_render_{uuid.uuid4().hex[:8]}")
-    os.makedirs(temp_dir, exist_ok=True)
 
-    try:
-        # === KIỂM TRA SỐ LƯỢNG CLIPS ĐỂ QUYẾT ĐỊNH RENDER THEO BATCH HAY KHÔNG ===
-        if len(clips) >= MAX_CLIPS_PER_BATCH:
-            print(f"📦 Số lượng clips ({len(clips)}) >= {MAX_CLIPS_PER_BATCH}, render theo batch...")
-            _render_with_batches(clips, out_path, width, height, fps, blur_amount, 
-                                keep_audio, logo_path, transition_file, temp_dir)
-        else:
-            print(f"📦 Số lượng clips ({len(clips)}) < {MAX_CLIPS_PER_BATCH}, render trực tiếp...")
-            _render_direct(clips, out_path, width, height, fps, blur_amount,
-                          keep_audio, logo_path, transition_file, temp_dir)
-    finally:
-        # Cleanup temp directory
-        import shutil
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir, ignore_errors=True)
+def _render_segment_files(plan, width, height, fps, blur_amount, logo_path, transition_file,
+                          transition_audio, out_path, temp_dir, workers, concat_mode, background,
+                          keep_audio, use_batches, report, farm=None, filter_backend=None):
+    """
+    segment_handoff "file": segment MP4 trong segment cache, nối bằng concat demuxer
+    farm: render clip trên render farm, máy này chỉ nối + mux
+    """
+    # === KIỂM TRA SỐ LƯỢNG CLIPS ĐỂ QUYẾT ĐỊNH RENDER THEO BATCH HAY KHÔNG ===
+    segments = plan.segments
+    if use_batches:
+        print(f"📦 Số lượng clips ({len(segments)}) >= {MAX_CLIPS_PER_BATCH}, render theo batch...")
+        concat_files, sequence, sources = _render_with_batches(
+            segments, width, height, fps, blur_amount, logo_path, transition_file,
+            temp_dir, workers, concat_mode, background, farm, filter_backend)
+    else:
+        print(f"📦 Số lượng clips ({len(segments)}) < {MAX_CLIPS_PER_BATCH}, render trực tiếp...")
+        concat_files, sequence, sources = _render_direct(
+            segments, width, height, fps, blur_amount, logo_path, transition_file,
+            temp_dir, workers, concat_mode, background, farm, filter_backend)
 
-    print("✅ DONE:", out_path)
-    # Tìm root window để messagebox hiển thị phía trên
-    root = tk._default_root
-    if root:
-        for widget in root.winfo_children():
-            if isinstance(widget, tk.Toplevel) and widget.winfo_exists():
-                widget.attributes('-topmost', True)
-                messagebox.showinfo("Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}", parent=widget)
-                widget.attributes('-topmost', False)
-                break
-        else:
-            messagebox.showinfo("Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}")
+    # === AUDIO: dựng cả timeline ở dạng PCM, encode AAC 1 lần khi mux ===
+    # Hình concat đi thẳng qua pipe vào lệnh mux, không ghi video tạm
+    if keep_audio:
+        report.meta["audio"] = _render_segments_audio(
+            plan, concat_files, sequence, sources, transition_audio,
+            out_path, temp_dir, fps, workers, concat_mode)
     else:
-        messagebox.showinfo("Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}")
-    return out_path
+        with report_stage("concat_video"):
+            concat_videos_simple(concat_files, out_path, temp_dir, concat_mode)
 
 
-def _render_with_batches(clips, out_path, width, height, fps, blur_amount,
-                         keep_audio, logo_path, transition_file, temp_dir):
+def _render_with_batches(segments, width, height, fps, blur_amount, logo_path, transition_file,
+                         temp_dir, workers=1, concat_mode=DEFAULT_CONCAT_MODE, background=None, farm=None,
+                         filter_backend=None):
     """
-    Render với số lượng clips lớn bằng cách chia thành các batch nhỏ
+    Render với số lượng clips lớn bằng cách chia thành các batch nhỏ (chỉ hình)
+    segments: segment của plan (render_plan)
+    transition_file: transition đã chuẩn hoá (prepare_transition)
+    concat_mode="copy": hình được nối 1 lần duy nhất từ mọi segment (không
+    cần file video trung gian cho từng batch)
+    Trả về (concat_files, sequence, sources): concat_files là danh sách file
+    hình cần nối ở bước cuối (build_and_render_from_config nối + mux), sequence/
+    sources là toàn bộ segment theo thứ tự trên timeline, dùng để dựng audio.
     """
     # Chia clips thành các batch
     batches = []
-    for i in range(0, len(clips), MAX_CLIPS_PER_BATCH):
-        batches.append(clips[i:i + MAX_CLIPS_PER_BATCH])
-    
+    for i in range(0, len(segments), MAX_CLIPS_PER_BATCH):
+        batches.append(segments[i:i + MAX_CLIPS_PER_BATCH])
+
     print(f"📦 Chia thành {len(batches)} batch(es)")
-    
+
+    # === RENDER TẤT CẢ CLIP CỦA MỌI BATCH TRONG CÙNG 1 POOL ===
+    threads = _encoder_threads(workers)
+    clip_cmds = []
+    clip_pending = []
     all_clip_files = []
-    all_trans_files = []
-    batch_video_files = []
-    batch_audio_files = []
-    
-    for batch_idx, batch_clips in enumerate(batches):
-        print(f"🎬 Đang render batch {batch_idx + 1}/{len(batches)} ({len(batch_clips)} clips)...")
-        
-        clip_files, trans_files, sequence = render_batch_clips(
-            batch_clips, batch_idx, width, height, fps, blur_amount,
-            keep_audio, logo_path, transition_file, temp_dir
+    batch_plans = []
+    for batch_idx, batch_segments in enumerate(batches):
+        cmds, clip_files, trans_files, sequence, sources, pending = _plan_batch_clips(
+            batch_segments, f"b{batch_idx}_", width, height, fps, blur_amount,
+            logo_path, transition_file, temp_dir, threads, background, farm, filter_backend
         )
-        
+        clip_cmds.extend(cmds)
+        clip_pending.extend(pending)
         all_clip_files.extend(clip_files)
-        all_trans_files.extend(trans_files)
-        
+        batch_plans.append((sequence, sources))
+
+    # Transition giữa các batch (dùng lại file đã chuẩn hoá)
+    inter_trans_files = []
+    if transition_file:
+        inter_trans_files = [transition_file] * (len(batches) - 1)
+
+    print(f"🎬 Đang render {len(clip_cmds)} clip ({min(workers, len(clip_cmds))} job song song)...")
+    with report_stage("render_clips"):
+        _run_clip_jobs(clip_cmds, clip_pending, workers, all_clip_files, farm)
+
+    # === CONCAT TỪNG BATCH (song song, giới hạn theo số phiên encoder GPU) ===
+    batch_video_files = []
+    concat_cmds = []
+    timeline_sequence = []
+    timeline_sources = []
+
+    for batch_idx, (sequence, sources) in enumerate(batch_plans):
         # Concat batch thành video tạm sử dụng concat demuxer để tránh command quá dài
         batch_video = os.path.join(temp_dir, f"batch_{batch_idx}_video.mp4")
-        
-        if len(sequence) > 1:
+
+        if concat_mode == CONCAT_MODE_COPY:
+            # Nối thẳng các segment ở bước cuối, không tạo video batch
+            batch_video_files.append(sequence)
+        elif len(sequence) > 1:
             # Sử dụng concat demuxer thay vì filter để tránh command quá dài
             concat_list_file = os.path.join(temp_dir, f"batch_{batch_idx}_list.txt")
-            with open(concat_list_file, "w", encoding="utf-8") as f:
-                for vf in sequence:
-                    escaped_path = vf.replace("\\", "/").replace("'", "'\\''")
-                    f.write(f"file '{escaped_path}'\n")
-            
-            cmd = [
+            _write_concat_list(concat_list_file, sequence)
+
+            concat_cmds.append([
                 "ffmpeg", "-y",
                 "-f", "concat",
                 "-safe", "0",
                 "-i", concat_list_file,
-                "-c:v", "h264_nvenc", "-preset", "p6",
+            ] + video_encoder_args(quality=18) + [
                 "-an",
                 batch_video
-            ]
-            run(cmd)
+            ])
         else:
             # Chỉ có 1 file, copy trực tiếp
-            import shutil
             shutil.copy(sequence[0], batch_video)
-        
-        batch_video_files.append(batch_video)
-        
-        # Render audio cho batch nếu cần
-        if keep_audio and clip_files:
-            batch_audio = os.path.join(temp_dir, f"batch_{batch_idx}_audio.aac")
-            
-            if len(clip_files) > 1:
-                # Sử dụng concat demuxer cho audio để tránh command quá dài
-                audio_list_file = os.path.join(temp_dir, f"batch_{batch_idx}_audio_list.txt")
-                with open(audio_list_file, "w", encoding="utf-8") as f:
-                    for cf in clip_files:
-                        escaped_path = cf.replace("\\", "/").replace("'", "'\\''")
-                        f.write(f"file '{escaped_path}'\n")
-                
-                audio_cmd = [
-                    "ffmpeg", "-y",
-                    "-f", "concat",
-                    "-safe", "0",
-                    "-i", audio_list_file,
-                    "-vn",
-                    "-c:a", "aac", "-b:a", "320k",
-                    batch_audio
-                ]
-                run(audio_cmd)
-            else:
-                # Chỉ có 1 file, extract audio
-                audio_cmd = ["ffmpeg", "-y", "-i", clip_files[0], "-vn", "-c:a", "aac", "-b:a", "320k", batch_audio]
-                run(audio_cmd)
-            
-            batch_audio_files.append(batch_audio)
-    
+
+        if concat_mode != CONCAT_MODE_COPY:
+            batch_video_files.append([batch_video])
+
+        timeline_sequence.extend(sequence)
+        timeline_sources.extend(sources)
+        if batch_idx < len(inter_trans_files):
+            timeline_sequence.append(inter_trans_files[batch_idx])
+            timeline_sources.append(None)
+
+    with report_stage("concat_batches"):
+        run_parallel(concat_cmds, min(workers, MAX_ENCODER_SESSIONS))
+
     # === CONCAT TẤT CẢ CÁC BATCH LẠI ===
     print("🔗 Đang concat tất cả các batch...")
-    
+
     # Thêm transition giữa các batch nếu có
     final_batch_sequence = []
     for i, batch_video in enumerate(batch_video_files):
-        final_batch_sequence.append(batch_video)
-        
-        # Thêm transition giữa các batch
-        if transition_file and i < len(batch_video_files) - 1:
-            inter_trans = os.path.join(temp_dir, f"inter_batch_trans_{i}_{uuid.uuid4().hex[:6]}.mp4")
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", transition_file,
-                "-vf",
-                f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},fps={fps},setsar=1,format=yuv420p",
-                "-c:v", "libx264",
-                "-preset", "medium",
-                "-crf", "18",
-                "-an",
-                inter_trans
-            ]
-            run(cmd)
-            final_batch_sequence.append(inter_trans)
-    
-    # Concat video cuối cùng sử dụng concat demuxer để tránh command quá dài
-    final_video_only = os.path.join(temp_dir, "final_video_only.mp4")
-    concat_videos_simple(final_batch_sequence, final_video_only, temp_dir)
-    
-    # Merge với audio nếu có
-    if keep_audio and batch_audio_files:
-        # Concat tất cả audio files
-        final_audio = os.path.join(temp_dir, "final_audio.aac")
-        
-        if len(batch_audio_files) > 1:
-            # Sử dụng concat demuxer cho audio, re-encode để tránh lỗi
-            audio_list_file = os.path.join(temp_dir, "audio_list.txt")
-            with open(audio_list_file, "w", encoding="utf-8") as f:
-                for af in batch_audio_files:
-                    escaped_path = af.replace("\\", "/").replace("'", "'\\''")
-                    f.write(f"file '{escaped_path}'\n")
-            
-            audio_concat_cmd = [
-                "ffmpeg", "-y",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", audio_list_file,
-                "-c:a", "aac", "-b:a", "320k",
-                final_audio
-            ]
-            run(audio_concat_cmd)
+        final_batch_sequence.extend(batch_video)
+        if i < len(inter_trans_files):
+            final_batch_sequence.append(inter_trans_files[i])
+
+    return final_batch_sequence, timeline_sequence, timeline_sources
+
+
+def _render_direct(segments, width, height, fps, blur_amount, logo_path, transition_file,
+                   temp_dir, workers=1, concat_mode=DEFAULT_CONCAT_MODE, background=None, farm=None,
+                   filter_backend=None):
+    """
+    Render trực tiếp cho số lượng clips nhỏ (phương pháp cũ, chỉ hình)
+    transition_file: transition đã chuẩn hoá (prepare_transition)
+    Trả về (concat_files, sequence, sources) như _render_with_batches
+    """
+    cmds, clip_files, trans_files, final_sequence, sources, pending = _plan_batch_clips(
+        segments, "", width, height, fps, blur_amount,
+        logo_path, transition_file, temp_dir, _encoder_threads(workers), background, farm, filter_backend
+    )
+    with report_stage("render_clips"):
+        _run_clip_jobs(cmds, pending, workers, clip_files, farm)
+
+    return final_sequence, final_sequence, sources
+
+
+def _stream_copy_cmd(path):
+    return ["ffmpeg", "-y", "-i", path, "-map", "0:v", "-c:v", "copy", "-an",
+            "-f", STREAM_SEGMENT_FORMAT, "pipe:1"]
+
+
+def _plan_stream_segments(segments, width, height, fps, blur_amount, logo_path, transition_segment,
+                          threads=None, background=None, filter_backend=None):
+    """
+    Lệnh cho từng segment trên timeline (segment_handoff "pipe"), mỗi lệnh ghi
+    NUT ra stdout. Clip đã có trong segment cache và transition thì chỉ copy;
+    clip còn lại render đúng số frame của plan (build_clip_cmd frames=...) -
+    concat list và audio timeline cần biết trước thời lượng từ đầu.
+    Clip mới render KHÔNG được đưa vào segment cache (không ghi ra đĩa).
+    Trả về (cmds, frames, sources) - sources như sequence_sources của _plan_batch_clips.
+    """
+    sources = []
+    for seg in segments:
+        if seg["kind"] != "video":
+            continue
+        if sources and transition_segment:
+            sources.append(None)
+        sources.append(seg)
+
+    transition_frames = _media_frames(transition_segment, fps) if transition_segment else 0
+    cmds, frames = [], []
+    reused = 0
+    for seg in sources:
+        if seg is None:
+            cmds.append(_stream_copy_cmd(transition_segment))
+            frames.append(transition_frames)
+            continue
+        cut_from, cut_to = _segment_cut(seg)
+        key = segment_cache_key(seg["path"], cut_from, cut_to, width, height, fps, blur_amount,
+                                False, logo_path, background, filter_backend, seg["frames"])
+        cached = SEGMENT_CACHE.get(key, ".mp4")
+        if cached:
+            # Segment trong cache có đúng số frame của plan (số frame nằm trong key)
+            cmds.append(_stream_copy_cmd(cached))
+            reused += 1
         else:
-            import shutil
-            shutil.copy(batch_audio_files[0], final_audio)
-        
-        # Merge video + audio
-        final_cmd = [
-            "ffmpeg", "-y",
-            "-i", final_video_only,
-            "-i", final_audio,
-            "-c:v", "copy",
-            "-c:a", "copy",
-            out_path
-        ]
-        run(final_cmd)
-    else:
-        import shutil
-        shutil.copy(final_video_only, out_path)
+            cmd = build_clip_cmd(seg["path"], "pipe:1", width, height, fps, blur_amount, False, logo_path,
+                                 threads, cut_from, cut_to, background=background, frames=seg["frames"],
+                                 filter_backend=filter_backend)
+            cmds.append(cmd[:-1] + ["-f", STREAM_SEGMENT_FORMAT, cmd[-1]])
+        frames.append(seg["frames"])
 
+    if reused:
+        print(f"♻️ Dùng lại {reused} clip đã render từ cache")
+    return cmds, frames, sources
 
-def _render_direct(clips, out_path, width, height, fps, blur_amount,
-                   keep_audio, logo_path, transition_file, temp_dir):
+
+def _render_streamed(plan, width, height, fps, blur_amount, logo_path, transition_file,
+                     transition_audio, out_path, temp_dir, workers=1, concat_mode=DEFAULT_CONCAT_MODE,
+                     background=None, keep_audio=True, filter_backend=None):
     """
-    Render trực tiếp cho số lượng clips nhỏ (phương pháp cũ)
+    segment_handoff "pipe": mọi segment (cả video dài, không chia batch) được
+    render song song và chuyển qua FIFO theo thứ tự vào 1 lệnh concat + mux
+    duy nhất - không có file MP4 trung gian, đĩa chỉ chứa PCM audio + video
+    đầu ra. Bộ nhớ đệm giới hạn theo process_manager.STREAM_QUEUE_CHUNKS.
+    Trả về báo cáo audio (None nếu không giữ audio).
     """
-    clip_files = []
-    for idx, clip_cfg in enumerate(clips):
-        video_layer = next((x for x in clip_cfg["layers"] if x["type"] == "video"), None)
-        if not video_layer:
+    cmds, frames, sources = _plan_stream_segments(
+        plan.segments, width, height, fps, blur_amount, logo_path, transition_file,
+        _encoder_threads(workers), background, filter_backend)
+    durations = [float(frames_to_seconds(n, fps)) for n in frames]
+    fifos = [os.path.join(temp_dir, f"segment_{i:05d}.fifo") for i in range(len(cmds))]
+    list_file = os.path.join(temp_dir, "stream_list.txt")
+    _write_concat_list(list_file, fifos, durations)
+
+    timeline = None
+    if keep_audio:
+        timeline = build_segments_audio_timeline(plan, sources, frames, transition_audio)
+        print(f"🔊 Dựng audio: {len(timeline.segments)} đoạn, {len(timeline.tracks)} audioTracks")
+        with report_stage("extract_audio"):
+            run_parallel(timeline.plan_extract(temp_dir), workers)
+        with report_stage("assemble_audio"):
+            layers = timeline.assemble(temp_dir)
+        consumer = timeline.mux_cmd(layers, list_file, out_path, SEGMENT_AUDIO_ARGS,
+                                    CONCAT_INPUT_ARGS, _concat_video_args(concat_mode))
+    else:
+        consumer = (["ffmpeg", "-y"] + CONCAT_INPUT_ARGS + ["-i", list_file, "-map", "0:v"]
+                    + _concat_video_args(concat_mode) + ["-an", out_path])
+
+    print(f"🎬 Đang render {len(cmds)} segment qua pipe ({min(workers, len(cmds))} job song song)...")
+    with report_stage("stream_segments"):
+        get_process_manager().run_stream(cmds, consumer, fifos, workers,
+                                         duration=sum(durations), label="stream segments")
+    if timeline is None:
+        return None
+    out_info = probe_media_many([out_path]).get(out_path)
+    timeline.check_alignment(out_info["duration"] if out_info else None, fps)
+    return timeline.report
+
+
+def _sequence_frames(sequence, sources, fps):
+    """Số frame từng file của sequence: clip theo plan, transition (file đã chuẩn hoá) theo probe"""
+    transition_frames = {}
+    frames = []
+    for path, seg in zip(sequence, sources):
+        if seg is not None:
+            frames.append(seg["frames"])
             continue
+        if path not in transition_frames:
+            transition_frames[path] = _media_frames(path, fps)
+        frames.append(transition_frames[path])
+    return frames
 
-        video_path = video_layer["path"]
-        tmp_out = os.path.join(temp_dir, f"tmp_clip_{idx}_{uuid.uuid4().hex[:6]}.mp4")
-
-        is_transition_clip = "Transition.mov" in video_path
-
-        inputs = ["-i", video_path]
-        filter_complex = []
-
-        if not is_transition_clip and logo_path and os.path.exists(logo_path):
-            inputs += ["-i", logo_path]
-
-            filter_complex.append("[0:v]split=2[bg][fg]")
-            filter_complex.append(
-                f"[bg]scale={width}:{height}:force_original_aspect_ratio=increase,"
-                f"crop={width}:{height},"
-                f"boxblur={blur_amount}:1[bg_blur]"
-            )
-            filter_complex.append(
-                f"[fg]scale=-2:{height}:force_original_aspect_ratio=decrease[fg_scaled]"
-            )
-            filter_complex.append(
-                f"[bg_blur][fg_scaled]overlay=(W-w)/2:(H-h)/2[composed]"
-            )
-            filter_complex.append(
-                f"[composed][1:v]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2[with_logo]"
-            )
-            filter_complex.append(
-                f"[with_logo]fps={fps},setsar=1,format=yuv420p[outv]"
-            )
+
+def build_segments_audio_timeline(plan, sources, frames, transition_audio=None):
+    """
+    Timeline audio khớp từng mẫu với video đã concat của renderer "segments".
+    sources: segment plan ứng với từng file hình theo thứ tự concat (None =
+    transition chèn giữa, lấy audio từ transition_audio); frames: số frame
+    từng file. Ranh giới các đoạn tính từ tổng số frame (số nguyên) -> không
+    dồn sai số. audioTracks (âm thanh transition của build_editly_config)
+    đặt theo frame trên plan, đổi sang timeline thật theo segment chứa frame
+    đó (segment không có hình như gap đen -> đầu clip kế tiếp).
+    """
+    def to_samples(n):
+        return seconds_to_samples(frames_to_seconds(n, plan.fps))
+
+    timeline = AudioTimeline()
+    clip_start = {}
+    elapsed = 0
+    cursor = 0
+    for n, seg in zip(frames, sources):
+        elapsed += n
+        end = to_samples(elapsed)
+        if seg is None:
+            timeline.add_segment(transition_audio, 0, end - cursor)
         else:
-            filter_complex.append("[0:v]split=2[bg][fg]")
-            filter_complex.append(
-                f"[bg]scale={width}:{height}:force_original_aspect_ratio=increase,"
-                f"crop={width}:{height},"
-                f"boxblur={blur_amount}:1[bg_blur]"
-            )
-            filter_complex.append(
-                f"[fg]scale=-2:{height}:force_original_aspect_ratio=decrease[fg_scaled]"
-            )
-            filter_complex.append(
-                f"[bg_blur][fg_scaled]overlay=(W-w)/2:(H-h)/2[composed]"
-            )
-            filter_complex.append(
-                f"[composed]fps={fps},setsar=1,format=yuv420p[outv]"
-            )
-
-        cmd = ["ffmpeg", "-y", "-hwaccel", "cuda"] + inputs
-        cmd += ["-filter_complex", ";".join(filter_complex)]
-        cmd += ["-map", "[outv]"]
-
-        if keep_audio:
-            cmd += ["-map", "0:a?"]
-
-        cmd += ["-c:v", "libx264", "-preset", "medium", "-crf", "18"]
-        if keep_audio:
-            cmd += ["-c:a", "aac", "-b:a", "320k"]
-
-        cmd += [tmp_out]
-        run(cmd)
-        clip_files.append(tmp_out)
+            clip_start.setdefault(seg["index"], cursor)
+            timeline.add_segment(seg["path"], seg["cut_from"], end - cursor, seg["volume"])
+        cursor = end
+
+    def anchor(frame):
+        for seg in plan.segments:
+            if frame < seg["start_frame"] + seg["frames"]:
+                if seg["index"] in clip_start:
+                    return clip_start[seg["index"]] + to_samples(frame - seg["start_frame"])
+                later = [clip_start[s["index"]] for s in plan.segments[seg["index"] + 1:]
+                         if s["index"] in clip_start]
+                return later[0] if later else cursor
+        return cursor
+
+    for track in plan.audio_tracks:
+        timeline.add_track(track["path"], anchor(track["start_frame"]), track["cut_from"],
+                           to_samples(track["frames"]), track["volume"])
+    return timeline
+
+
+def _render_segments_audio(plan, concat_files, sequence, sources, transition_audio,
+                           out_path, temp_dir, fps, workers=1, concat_mode=DEFAULT_CONCAT_MODE):
+    """
+    Decode audio nguồn ra PCM, ghép, rồi concat hình + encode AAC 1 lần + mux.
+    Nhiều file hình: lệnh concat ghi NUT ra pipe, lệnh mux đọc từ stdin.
+    Căn chỉnh kiểm tra trên video đầu ra (thời lượng stream hình).
+    """
+    timeline = build_segments_audio_timeline(plan, sources, _sequence_frames(sequence, sources, fps),
+                                             transition_audio)
+    print(f"🔊 Dựng audio: {len(timeline.segments)} đoạn, {len(timeline.tracks)} audioTracks")
+    with report_stage("extract_audio"):
+        run_parallel(timeline.plan_extract(temp_dir), workers)
+    with report_stage("assemble_audio"):
+        layers = timeline.assemble(temp_dir)
+    with report_stage("mux"):
+        duration = timeline.total_samples / AUDIO_RATE
+        if len(concat_files) == 1:
+            run(timeline.mux_cmd(layers, concat_files[0], out_path, SEGMENT_AUDIO_ARGS),
+                duration=duration, label="mux audio")
+        else:
+            concat_cmd, _ = _concat_video_cmd(concat_files, "pipe:1", temp_dir, concat_mode,
+                                                      ["-f", "nut"])
+            mux_cmd = timeline.mux_cmd(layers, "pipe:0", out_path, SEGMENT_AUDIO_ARGS, ["-f", "nut"])
+            get_process_manager().run_pipe(concat_cmd, mux_cmd, duration=duration, label="concat + mux")
+    out_info = probe_media_many([out_path]).get(out_path)
+    timeline.check_alignment(out_info["duration"] if out_info else None, fps)
+    return timeline.report
 
-    # Render transitions
-    trans_files = []
-    if transition_file:
-        for idx in range(len(clip_files) - 1):
-            trans_tmp = os.path.join(temp_dir, f"tmp_trans_{idx}_{uuid.uuid4().hex[:6]}.mp4")
 
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", transition_file,
-                "-vf",
-                f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},fps={fps},setsar=1,format=yuv420p",
-                "-c:v", "libx264",
-                "-preset", "medium",
-                "-crf", "18",
-                "-an",
-                trans_tmp
-            ]
-            run(cmd)
-            trans_files.append(trans_tmp)
 
-    # Concat video + transitions
-    final_sequence = []
-    for i, clip_file in enumerate(clip_files):
-        final_sequence.append(clip_file)
-        if i < len(trans_files):
-            final_sequence.append(trans_files[i])
+# ==========================================
+# RENDER 1 LẦN (SINGLE PASS)
+# ==========================================
+SINGLE_PASS_AUDIO_RATE = 48000
 
-    # Sử dụng concat demuxer thay vì filter để tránh command quá dài
-    temp_video_only = os.path.join(temp_dir, "temp_video.mp4")
-    concat_videos_simple(final_sequence, temp_video_only, temp_dir)
 
-    if keep_audio:
-        # Concat audio riêng
-        temp_audio = os.path.join(temp_dir, "temp_audio.aac")
-        
-        if len(clip_files) > 1:
-            audio_list_file = os.path.join(temp_dir, "audio_clip_list.txt")
-            with open(audio_list_file, "w", encoding="utf-8") as f:
-                for cf in clip_files:
-                    escaped_path = cf.replace("\\", "/").replace("'", "'\\''")
-                    f.write(f"file '{escaped_path}'\n")
-            
-            audio_cmd = [
-                "ffmpeg", "-y",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", audio_list_file,
-                "-vn",
-                "-c:a", "aac",
-                "-b:a", "320k",
-                temp_audio
-            ]
-            run(audio_cmd)
+def build_single_pass_cmd(config, filter_file, fps=None, blur_amount=None, background=None,
+                          plan=None, out_path=None, audio_args=SEGMENT_AUDIO_ARGS, video_args=(),
+                          filter_backend=None):
+    """
+    Dựng lệnh ffmpeg render cả timeline trong 1 tiến trình (không file tạm/clip).
+    - Mỗi clip là 1 input riêng đã cắt sẵn bằng -ss/-t (chỉ decode đoạn cần dùng),
+      ghép bằng concat filter -> mỗi frame decode 1 lần, encode 1 lần.
+    - Logo: 1 input PNG, overlay 1 lần trên cả timeline (enable theo các clip có logo).
+    - Transition: overlay theo thời điểm tuyệt đối trên timeline, audio của
+      transition (audioTracks) dùng chung input với hình.
+    - audioTracks không chồng nhau được nối thành 1 track hiệu ứng bằng concat,
+      chỉ amix 2 input thay vì N input.
+    plan: render plan đã dựng (vd: 1 đoạn của plan.window khi render chia
+    đoạn), None = dựng từ config. out_path/audio_args/video_args: thay đích,
+    codec audio và thêm tham số video cho từng đoạn.
+    filter_backend: dựng nền blur + video chính của clip contain-blur trên
+    CPU / GPU (filter_backends), None = cpu; frame về RAM trước concat.
+    Ghi filter graph vào filter_file. Trả về (cmd, duration) - duration là
+    thời lượng timeline (giây).
+    """
+    width = config.get("width", 1920)
+    height = config.get("height", 1080)
+    fps = fps or config.get("fps", 30)
+    keep_audio = config.get("keepSourceAudio", True)
+    out_path = out_path or config["outPath"]
+    filter_backend = filter_backend or CPU_BACKEND
+
+    input_args = []
+    input_keys = {}
+
+    def add_input(args, key=None):
+        if key is not None and key in input_keys:
+            return input_keys[key]
+        input_args.append(args)
+        if key is not None:
+            input_keys[key] = len(input_args) - 1
+        return len(input_args) - 1
+
+    def cut_args(cut_from, duration):
+        args = ["-ss", f"{cut_from:.6f}"] if cut_from else []
+        return args + ["-t", f"{duration:.6f}"]
+
+    silence = f"anullsrc=r={SINGLE_PASS_AUDIO_RATE}:cl=stereo"
+    a_norm = f"aresample={SINGLE_PASS_AUDIO_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo"
+
+    # Độ dài clip làm tròn theo frame (render_plan) -> hình và tiếng của từng clip dài đúng bằng nhau
+    plan = plan or compile_plan(config, fps)
+    infos = probe_media_many([seg["path"] for seg in plan.segments if seg["path"]])
+
+    chains = []
+    concat_pads = []
+    logo_ranges = {}
+    transitions = []
+
+    for i, segment in enumerate(plan.segments):
+        n_frames = segment["frames"]
+        duration = segment["duration"]
+        timeline = segment["start"]
+
+        if segment["kind"] == "video":
+            main_layer = next(l for l in config["clips"][segment["index"]]["layers"] if l["type"] == "video")
+            cut_from = segment["cut_from"]
+            src = f"fps={fps}"
+            if main_layer.get("resizeMode") == "contain-blur":
+                # Chỉ clip contain-blur decode thẳng lên GPU (nếu backend GPU)
+                decode = filter_backend.input_args() if filter_backend.on_device else []
+                idx = add_input(decode + cut_args(cut_from, duration) + ["-i", segment["path"]])
+                blur = blur_amount if blur_amount is not None else float(main_layer.get("blur", 0.2)) * 100
+                bg_opts = background or main_layer.get("background")
+                composed, label = filter_backend.composite(f"[{idx}:v]{src},", width, height, fps, blur, bg_opts,
+                                                           fg_width=width, divisible=2, suffix=f"_{i}")
+                chains.extend(composed)
+                finish = filter_backend.download()
+                chains.append(f"{label}{finish + ',' if finish else ''}"
+                              f"trim=end_frame={n_frames},setsar=1,format=yuv420p[v_{i}]")
+            else:
+                idx = add_input(cut_args(cut_from, duration) + ["-i", segment["path"]])
+                chains.append(
+                    f"[{idx}:v]{src},scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},"
+                    f"trim=end_frame={n_frames},setsar=1,format=yuv420p[v_{i}]"
+                )
+            info = infos.get(main_layer["path"]) or {}
+            if keep_audio and info.get("has_audio"):
+                chains.append(f"[{idx}:a]{a_norm},apad,atrim=duration={duration},asetpts=PTS-STARTPTS[a_{i}]")
+            else:
+                chains.append(f"{silence},atrim=duration={duration}[a_{i}]")
         else:
-            audio_cmd = ["ffmpeg", "-y", "-i", clip_files[0], "-vn", "-c:a", "aac", "-b:a", "320k", temp_audio]
-            run(audio_cmd)
-
-        final_cmd = [
-            "ffmpeg", "-y",
-            "-i", temp_video_only,
-            "-i", temp_audio,
-            "-c:v", "copy",
-            "-c:a", "copy",
-            out_path
+            color = segment["color"]
+            chains.append(f"color=c={color}:s={width}x{height}:r={fps}:d={duration},"
+                          f"setsar=1,format=yuv420p[v_{i}]")
+            chains.append(f"{silence},atrim=duration={duration}[a_{i}]")
+        concat_pads.append(f"[v_{i}][a_{i}]")
+
+        if segment["logo"]:
+            logo_ranges.setdefault(segment["logo"], []).append((timeline, timeline + duration))
+        transitions.extend(segment["overlays"])
+    timeline = plan.duration
+
+    chains.append("".join(concat_pads) + f"concat=n={len(concat_pads)}:v=1:a=1[base_v][base_a]")
+    current = "[base_v]"
+
+    # Logo: 1 frame, overlay lặp lại frame cuối (eof_action=repeat) cho cả timeline
+    for k, (path, ranges) in enumerate(logo_ranges.items()):
+        logo = prepare_logo(path, width, height, fit="canvas")
+        idx = add_input(["-i", logo])
+        enable = "+".join(f"between(t,{a:.3f},{b:.3f})" for a, b in ranges)
+        chains.append(f"[{idx}:v]format=rgba[logo_{k}]")
+        chains.append(f"{current}[logo_{k}]overlay=(W-w)/2:(H-h)/2:eof_action=repeat:"
+                      f"enable='{enable}'[v_logo_{k}]")
+        current = f"[v_logo_{k}]"
+
+    # Transition đè lên logo, dịch PTS tới đúng thời điểm trên timeline
+    for k, overlay in enumerate(transitions):
+        start, duration, cut_from = overlay["start"], overlay["duration"], overlay["cut_from"]
+        skip = overlay.get("skip", 0)
+        idx = add_input(cut_args(cut_from, skip + duration) + ["-i", overlay["path"]],
+                        key=(overlay["path"], round(cut_from, 3), round(skip + duration, 3), round(start - skip, 3)))
+        trim = f"trim=start={skip:.6f}," if skip else ""
+        chains.append(f"[{idx}:v]fps={fps},{trim}scale={width}:{height},"
+                      f"setpts=PTS-STARTPTS+{start:.6f}/TB[tr_{k}]")
+        chains.append(f"{current}[tr_{k}]overlay=0:0:eof_action=pass:"
+                      f"enable='between(t,{start:.3f},{start + duration:.3f})'[v_tr_{k}]")
+        current = f"[v_tr_{k}]"
+    chains.append(f"{current}null[final_v]")
+
+    # Audio tracks: dùng lại input của transition nếu cùng file/đoạn cắt/thời điểm
+    tracks = []
+    for track in plan.audio_tracks:
+        start, duration, cut_from = track["start"], track["duration"], track["cut_from"]
+        skip = track.get("skip", 0)
+        if duration <= 0 or start >= timeline:
+            continue
+        duration = min(duration, timeline - start)
+        key = (track["path"], round(cut_from, 3), round(skip + duration, 3), round(start - skip, 3))
+        idx = add_input(cut_args(cut_from, skip + duration) + ["-i", track["path"]], key=key)
+        tracks.append((start, duration, idx, track["volume"], skip))
+    tracks.sort()
+
+    if not tracks:
+        chains.append("[base_a]anull[final_a]")
+    else:
+        # skip: cắt bằng atrim (chính xác tới từng mẫu), không seek input
+        track_chains = [
+            f"[{idx}:a]{a_norm},{f'atrim=start={skip:.6f},asetpts=PTS-STARTPTS,' if skip else ''}"
+            f"volume={vol},apad,atrim=duration={duration},asetpts=PTS-STARTPTS"
+            for _, duration, idx, vol, skip in tracks
         ]
-        run(final_cmd)
+        overlapping = any(tracks[j][0] < tracks[j - 1][0] + tracks[j - 1][1] - 1e-6 for j in range(1, len(tracks)))
+        if overlapping:
+            # Các track chồng nhau -> amix từng track (chậm hơn nhưng đúng)
+            mix_pads = ["[base_a]"]
+            for k, (chain, (start, _, _, _, _)) in enumerate(zip(track_chains, tracks)):
+                delay = int(round(start * 1000))
+                chains.append(f"{chain},adelay={delay}:all=1[trk_{k}]")
+                mix_pads.append(f"[trk_{k}]")
+        else:
+            # Nối thành 1 track hiệu ứng: [im lặng][track][im lặng][track]...
+            pieces = []
+            cursor = 0.0
+            for k, (chain, (start, duration, _, _, _)) in enumerate(zip(track_chains, tracks)):
+                if start - cursor > 1e-6:
+                    chains.append(f"{silence},atrim=duration={start - cursor:.6f}[gap_{k}]")
+                    pieces.append(f"[gap_{k}]")
+                chains.append(f"{chain}[trk_{k}]")
+                pieces.append(f"[trk_{k}]")
+                cursor = start + duration
+            chains.append("".join(pieces) + f"concat=n={len(pieces)}:v=0:a=1[fx_a]")
+            mix_pads = ["[base_a]", "[fx_a]"]
+        # normalize=0: giữ nguyên âm lượng từng track (amix mặc định chia theo số input)
+        chains.append("".join(mix_pads) + f"amix=inputs={len(mix_pads)}:duration=first:"
+                      f"dropout_transition=0:normalize=0[final_a]")
+
+    with open(filter_file, "w", encoding="utf-8") as f:
+        f.write(";\n".join(chains))
+
+    cmd = [FFMPEG_EXEC, "-y"] + (filter_backend.global_args() if filter_backend.on_device else [])
+    for args in input_args:
+        cmd += args
+    cmd += ["-filter_complex_script", filter_file,
+            "-map", "[final_v]", "-map", "[final_a]"]
+    cmd += video_encoder_args(quality=18) + list(video_args)
+    cmd += ["-pix_fmt", "yuv420p", "-r", str(fps)] + list(audio_args) + [out_path]
+    return cmd, timeline
+
+
+# Renderer "stream" chia đoạn: mỗi đoạn (ranh giới clip) là 1 tiến trình encode
+# riêng, nối lại bằng stream copy -> dùng được nhiều encoder instance cùng lúc
+STREAM_PART_MIN_SECONDS = 60  # đoạn ngắn hơn thì chi phí khởi động + nối không đáng
+STREAM_PART_THREADS = 4  # libx264: số core cho mỗi đoạn khi tự chọn số đoạn
+STREAM_PART_EXT = ".mov"  # MOV giữ được PCM -> audio nối khớp từng mẫu, encode AAC 1 lần khi nối
+STREAM_PART_AUDIO_ARGS = ["-c:a", "pcm_s16le", "-ar", str(SINGLE_PASS_AUDIO_RATE), "-ac", "2"]
+
+
+def resolve_stream_parts(plan, config_dict=None):
+    """
+    Số đoạn render song song của renderer "stream". Ưu tiên config kênh
+    "stream_parts" (1 = không chia), không có thì theo máy: encoder phần cứng
+    -> MAX_ENCODER_SESSIONS phiên, libx264 -> số core / STREAM_PART_THREADS;
+    mỗi đoạn dài tối thiểu STREAM_PART_MIN_SECONDS giây.
+    Trả về danh sách (segment đầu, segment cuối) của từng đoạn.
+    """
+    value = (config_dict or {}).get("stream_parts")
+    if value is not None:
+        parts = int(value)
+    else:
+        if best_encoder() == "libx264":
+            parts = (os.cpu_count() or 1) // STREAM_PART_THREADS
+        else:
+            parts = MAX_ENCODER_SESSIONS
+        parts = min(parts, int(plan.duration // STREAM_PART_MIN_SECONDS))
+    return plan.split(max(1, parts))
+
+
+def stream_render_path(plan, config_dict=None):
+    """Nhánh của renderer "stream" (meta "path" trong render report): single_pass / split"""
+    return "split" if len(resolve_stream_parts(plan, config_dict)) > 1 else "single_pass"
+
+
+class RenderVerifyError(RuntimeError):
+    """Video đầu ra không khớp render plan (số frame / audio lệch quá 1 frame)"""
+
+
+def verify_render(out_path, plan):
+    """
+    So video đầu ra với plan: số frame hình và độ dài audio (lệch quá 1
+    frame -> không đạt). Trả về dict kết quả (ghi vào render report);
+    ok = None nếu không đọc được video (không có ffprobe...).
+    """
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,nb_frames,duration",
+           "-of", "json", out_path]
+    try:
+        streams = json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout)["streams"]
+    except (OSError, ValueError, KeyError, subprocess.CalledProcessError) as e:
+        print(f"⚠️ Không kiểm tra được video đầu ra: {e}")
+        return {"ok": None, "error": str(e)}
+    video = next((st for st in streams if st.get("codec_type") == "video"), {})
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    frames = int(video.get("nb_frames") or 0)
+    result = {"frames": frames, "expected_frames": plan.total_frames,
+              "duration": float(video.get("duration") or 0), "expected_duration": round(plan.duration, 6)}
+    problems = []
+    if frames != plan.total_frames:
+        problems.append(f"video có {frames} frame, plan là {plan.total_frames} frame")
+    if audio:
+        drift = float(audio.get("duration") or 0) - plan.duration
+        result["audio_drift_ms"] = round(drift * 1000, 3)
+        if abs(drift) > 1.0 / float(plan.fps):
+            problems.append(f"audio lệch video {drift * 1000:+.1f}ms (> 1 frame)")
+    result["ok"] = not problems
+    if problems:
+        result["error"] = "; ".join(problems)
+        print(f"❌ Video đầu ra không khớp plan: {result['error']}")
+    return result
+
+
+def _render_stream_parts(config, plan, ranges, fps, blur_amount, background, out_path, config_dict,
+                         filter_backend=None):
+    """
+    Mỗi đoạn timeline (ranh giới clip) render bằng 1 lệnh single-pass riêng,
+    cùng tham số encode, GOP đóng (đoạn nào cũng bắt đầu bằng keyframe),
+    audio PCM; chạy song song rồi nối bằng concat demuxer: hình stream copy,
+    audio encode AAC 1 lần cho cả video.
+    """
+    gop = max(1, int(round(float(fps) * 2)))
+    # build_single_pass_cmd encode bằng best_encoder() -> GOP đóng theo đúng encoder đó
+    part_args = _fixed_gop_args(best_encoder(), str(gop))
+    threads = _encoder_threads(len(ranges))
+    if threads:
+        part_args += ["-threads", str(threads)]
+    temp_dir = scratch_path("ffmpeg_parts_", need_bytes=estimate_scratch_bytes(plan.duration, reencode=True),
+                            config=config_dict)
+    with scratch(temp_dir):
+        os.makedirs(temp_dir, exist_ok=True)
+        cmds, part_files = [], []
+        for k, (first, last) in enumerate(ranges):
+            part_file = os.path.join(temp_dir, f"part_{k:03d}{STREAM_PART_EXT}")
+            cmd, _ = build_single_pass_cmd(config, os.path.join(temp_dir, f"part_{k:03d}_filter.txt"), fps,
+                                           blur_amount, background, plan=plan.window(first, last),
+                                           out_path=part_file, audio_args=STREAM_PART_AUDIO_ARGS,
+                                           video_args=part_args, filter_backend=filter_backend)
+            cmds.append(cmd)
+            part_files.append(part_file)
+
+        print(f"🎬 Render {len(ranges)} đoạn song song ({len(plan.segments)} clip)...")
+        with report_stage("render_parts"):
+            run_parallel(cmds, len(cmds))
+
+        list_file = os.path.join(temp_dir, "parts.txt")
+        _write_concat_list(list_file, part_files)
+        with report_stage("join_parts"):
+            run(["ffmpeg", "-y"] + CONCAT_INPUT_ARGS + ["-i", list_file, "-map", "0:v", "-map", "0:a"]
+                + _concat_video_args(CONCAT_MODE_COPY) + SEGMENT_AUDIO_ARGS + [out_path],
+                duration=plan.duration, label="join")
+
+
+def render_single_pass(video_config_path, config_dict=None):
+    """
+    Render cả video bằng 1 lệnh ffmpeg duy nhất (renderer "stream"):
+    không có file MP4 tạm cho từng clip, không decode lại khi concat.
+    Bố cục theo spec giống generate_ffmpeg_command; blur lấy theo config kênh
+    (blur * 100) như build_and_render_from_config.
+    Timeline dài -> chia thành nhiều đoạn tại ranh giới clip, encode song
+    song rồi nối (resolve_stream_parts). Xong thì đối chiếu số frame + độ
+    dài audio với plan (verify_render): lệch -> RenderVerifyError, video bị
+    xoá và job render tính là lỗi.
+    """
+    with open(video_config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    config_dict = config_dict or {}
+    out_path = config["outPath"]
+    fps = config_dict.get("fps") or config.get("fps", 30)
+    blur_amount = config_dict["blur"] * 100 if config_dict.get("blur") is not None else None
+    background = background_options(config_dict) if config_dict else None
+    filter_backend = resolve_filter_backend(config_dict)
+
+    plan = compile_plan(config, fps)
+    ranges = resolve_stream_parts(plan, config_dict)
+    check_output_space(out_path, plan.duration)
+    filter_file = scratch_path("ffmpeg_filter_", ".txt", config=config_dict)
+    report = RenderReport(out_path, renderer="stream", meta={
+        "clips": len(config["clips"]), "path": "split" if len(ranges) > 1 else "single_pass",
+        "parts": len(ranges), "duration": plan.duration, "filter_backend": filter_backend.name,
+    })
+    try:
+        with scratch(filter_file), scratch(out_path, keep=True), report:
+            if len(ranges) > 1:
+                _render_stream_parts(config, plan, ranges, fps, blur_amount, background, out_path, config_dict,
+                                     filter_backend)
+            else:
+                with report_stage("prepare_assets"):
+                    cmd, duration = build_single_pass_cmd(config, filter_file, fps, blur_amount, background,
+                                                          plan=plan, filter_backend=filter_backend)
+                with report_stage("render"):
+                    run(cmd, duration=duration, label="render")
+            with report_stage("verify"):
+                report.meta["verify"] = verify_render(out_path, plan)
+            if report.meta["verify"]["ok"] is False:
+                raise RenderVerifyError(f"Video đầu ra không khớp render plan: {report.meta['verify']['error']}")
+    except subprocess.CalledProcessError as e:
+        notify("error", "Lỗi render",
+               f"FFmpeg render thất bại!\n\nMã lỗi: {e.returncode}\n\nVui lòng kiểm tra console để xem chi tiết lỗi.")
+        raise
+    except RenderVerifyError as e:
+        notify("error", "Lỗi render", str(e))
+        raise
+
+    print("✅ DONE:", out_path)
+    notify("info", "Hoàn thành", f"Render video thành công!\n\nĐường dẫn:\n{out_path}")
+    return out_path
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render video từ file cấu hình editly (JSON)")
+    parser.add_argument("config", help="File JSON sinh bởi build_editly_config")
+    parser.add_argument("channel_config", help="config.json của kênh (fps, blur, ...)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Số job ffmpeg per-clip chạy song song (mặc định: số core)")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="Render cả video trong 1 lệnh ffmpeg (không file tạm cho từng clip)")
+    args = parser.parse_args()
+
+    with open(args.channel_config, "r", encoding="utf-8") as f:
+        channel_config = json.load(f)
+    get_process_manager().install_signal_handlers()
+    cleanup_stale_render_files()
+    if args.single_pass:
+        render_single_pass(args.config, channel_config)
     else:
-        import shutil
-        shutil.copy(temp_video_only, out_path)
\ No newline at end of file
+        build_and_render_from_config(args.config, channel_config, workers=args.workers)
@@ -4,8 +4,9 @@ from tkinter import ttk, messagebox
 import os
 import customtkinter as ctk
 from consts import *
-from editor_ui import EditorWindow, get_video_info
-from helper import read_all_folder_name, load_history_folder, read_all_file_name, read_json_file_content
+from editor_ui import EditorWindow
+from helper import (read_all_folder_name, load_history_folder, read_all_file_name, read_json_file_content,
+                    get_videos_info)
 
 class ClipViewerApp(ctk.CTkToplevel):
     def __init__(self, root, channel_name):
@@ -228,9 +229,10 @@ class ClipViewerApp(ctk.CTkToplevel):
             
             # Open Editor
             editor = EditorWindow(self.master if self.master else self, self.channel_name)
+            video_infos = get_videos_info([clip["path"] for clip in clips_list if clip.get("path")])
             
             for (index, clip) in enumerate(clips_list):
-                thumb_duration, thumb_path, width, height = get_video_info(clip.get("path"))
+                thumb_duration, thumb_path, width, height = video_infos.get(clip.get("path"), (0, None, 0, 0))
                 clip_obj = {
                     "path": clip.get("path"),
                     "duration": clip.get("duration"),
@@ -0,0 +1,391 @@
+"""
+Render Plan - Timeline đã "biên dịch" từ spec kiểu editly (build_editly_config)
+
+Spec JSON chỉ ghi clip/layer theo giây, mỗi nơi dùng lại tự tính thời lượng
+(graph, stream, segments, Premiere XML) - mỗi chỗ làm tròn một kiểu. Plan
+tính 1 lần cho mọi nơi:
+- Mỗi clip -> 1 segment: vị trí + độ dài theo FRAME (làm tròn từng clip,
+  vị trí = tổng frame các clip trước -> không cộng dồn sai số), input, đoạn
+  cắt và các thao tác (contain-blur, logo, transition...).
+- Transition (layer video phụ) và audioTracks đặt theo frame tuyệt đối.
+  audioTracks ghi thời điểm trên timeline spec (giây) -> đổi sang frame
+  tính từ đầu clip chứa thời điểm đó, không để sai số của spec dồn lại.
+- Mọi phép tính thời gian dùng số nguyên frame / fractions.Fraction (fps
+  dạng 30000/1001 cũng đúng); giây dạng float chỉ là giá trị hiển thị.
+- Ước lượng thời gian render từ lịch sử Logs/render_reports.jsonl
+  (realtime factor trung bình theo renderer + path).
+
+Sử dụng:
+    from render_plan import load_plan, estimate_render_time
+
+    plan = load_plan(spec_path, fps=30)
+    for seg in plan.segments:
+        print(seg["start_frame"], seg["frames"], seg["ops"])
+    print("\\n".join(plan.describe()))
+    estimate_render_time(plan, "segments", "direct")  # {"seconds": ..., "basis": ...}
+"""
+
+import json
+import math
+import os
+from fractions import Fraction
+
+from media_index import probe_media_many
+from render_report import load_reports, summarize_reports
+
+FILL_DEFAULT_DURATION = 0.1  # giây, clip chỉ có fill-color mà không ghi duration
+NTSC_BASES = (24, 30, 60)  # 23.976 / 29.97 / 59.94 = base * 1000/1001
+SNAP_EPSILON = Fraction(1, 10 ** 6)  # frame; sai số float của spec cộng dồn giây nhỏ hơn nhiều
+
+
+def frame_rate(fps):
+    """fps (25, 29.97, "30000/1001"...) -> Fraction; 29.97 hiểu là 30000/1001"""
+    rate = fps if isinstance(fps, Fraction) else Fraction(str(fps).strip())
+    if rate <= 0:
+        raise ValueError(f"fps không hợp lệ: {fps}")
+    for base in NTSC_BASES:
+        ntsc = Fraction(base * 1000, 1001)
+        if rate != base and abs(rate - ntsc) < Fraction(1, 100):
+            return ntsc
+    return rate
+
+
+def exact_seconds(seconds):
+    """Giây (float trong JSON / probe) -> Fraction theo đúng số thập phân đã ghi"""
+    if isinstance(seconds, (Fraction, int)):
+        return Fraction(seconds)
+    return Fraction(repr(float(seconds or 0)))
+
+
+def round_frames(seconds, fps):
+    """
+    Giây -> số frame gần nhất (làm tròn nửa lên, tính bằng Fraction). Giá trị
+    cách bội số của nửa frame chưa tới SNAP_EPSILON frame được coi là đúng bội
+    số đó: spec ghi 23.5 frame @ 60fps thành 0.39166666666666666 giây (=
+    23.4999...) vẫn làm tròn thành 24.
+    """
+    frames = exact_seconds(seconds) * frame_rate(fps)
+    grid = Fraction(round(frames * 2), 2)
+    if abs(frames - grid) < SNAP_EPSILON:
+        frames = grid
+    return math.floor(frames + Fraction(1, 2))
+
+
+def seconds_to_frames(seconds, fps):
+    """Làm tròn theo frame, tối thiểu 1 frame nếu thời lượng > 0"""
+    if exact_seconds(seconds) <= 0:
+        return 0
+    return max(1, round_frames(seconds, fps))
+
+
+def frames_to_seconds(frames, fps):
+    """Frame -> giây (Fraction, chính xác)"""
+    return Fraction(frames) / frame_rate(fps)
+
+
+def _seconds(frames, fps):
+    """Giây dạng float cho các trường start / duration (hiển thị, JSON)"""
+    return round(float(frames_to_seconds(frames, fps)), 6)
+
+
+class RenderPlan:
+    """
+    Timeline đã resolve. segments/audio_tracks là list dict (JSON được):
+    segment: index, kind ("video" / "fill"), path, cut_from, cut_to, color,
+             start_frame, frames, start, duration, resize, volume, logo,
+             overlays (transition, frame tuyệt đối), ops
+    audio track: path, cut_from, start_frame, frames, start, duration, volume
+    transition/audio track của plan.window có thêm skip (giây bỏ qua sau cut_from)
+    """
+
+    def __init__(self, width, height, fps, out_path=None, keep_audio=True):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.out_path = out_path
+        self.keep_audio = keep_audio
+        self.segments = []
+        self.audio_tracks = []
+
+    @property
+    def total_frames(self):
+        return sum(s["frames"] for s in self.segments)
+
+    @property
+    def duration(self):
+        return float(frames_to_seconds(self.total_frames, self.fps))
+
+    def frames_to_seconds(self, frames):
+        return float(frames_to_seconds(frames, self.fps))
+
+    def inputs(self):
+        """Mọi file nguồn mà plan đọc (clip, logo, transition, audioTracks)"""
+        paths = set()
+        for seg in self.segments:
+            if seg["path"]:
+                paths.add(seg["path"])
+            if seg["logo"]:
+                paths.add(seg["logo"])
+            paths.update(o["path"] for o in seg["overlays"])
+        paths.update(t["path"] for t in self.audio_tracks)
+        return sorted(paths)
+
+    def to_dict(self):
+        return {
+            "width": self.width, "height": self.height, "fps": self.fps,
+            "out_path": self.out_path, "keep_audio": self.keep_audio,
+            "total_frames": self.total_frames, "duration": round(self.duration, 6),
+            "inputs": self.inputs(),
+            "segments": self.segments, "audio_tracks": self.audio_tracks,
+        }
+
+    def split(self, parts):
+        """
+        Chia timeline thành tối đa `parts` đoạn liền nhau tại ranh giới clip,
+        số frame gần bằng nhau. Trả về [(segment đầu, segment cuối)]
+        """
+        parts = max(1, min(int(parts), len(self.segments)))
+        total = self.total_frames
+        ranges = []
+        first = 0
+        for i, seg in enumerate(self.segments):
+            end = seg["start_frame"] + seg["frames"]
+            remaining_parts = parts - len(ranges) - 1
+            remaining_segs = len(self.segments) - i - 1
+            if remaining_parts and (end >= total * (len(ranges) + 1) / parts or remaining_segs <= remaining_parts):
+                ranges.append((first, i))
+                first = i + 1
+        ranges.append((first, len(self.segments) - 1))
+        return ranges
+
+    def _clip_item(self, item, start, end):
+        """
+        Transition/audio track cắt theo khung frame [start, end), đặt lại về
+        frame 0 của khung. Phần bị cắt ở đầu ghi vào "skip" (giây, tính từ
+        cut_from) để cắt trong filter graph - seek input (-ss) không chính
+        xác tới từng mẫu audio.
+        """
+        a = max(item["start_frame"], start)
+        b = min(item["start_frame"] + item["frames"], end)
+        if b <= a:
+            return None
+        skip = exact_seconds(item.get("skip", 0)) + frames_to_seconds(a - item["start_frame"], self.fps)
+        return dict(item, start_frame=a - start, frames=b - a, skip=round(float(skip), 6),
+                    start=_seconds(a - start, self.fps), duration=_seconds(b - a, self.fps))
+
+    def window(self, first, last):
+        """
+        Plan con gồm segment first..last, frame 0 = đầu segment first.
+        Transition/audioTracks nằm vắt qua ranh giới được cắt theo khung
+        (cutFrom dịch theo phần bị cắt) -> ghép các plan con liền nhau cho
+        đúng timeline của plan gốc.
+        """
+        start = self.segments[first]["start_frame"]
+        end = self.segments[last]["start_frame"] + self.segments[last]["frames"]
+        sub = RenderPlan(self.width, self.height, self.fps, self.out_path, self.keep_audio)
+        for seg in self.segments[first:last + 1]:
+            sub.segments.append(dict(seg, start_frame=seg["start_frame"] - start,
+                                     start=_seconds(seg["start_frame"] - start, self.fps),
+                                     overlays=[], ops=[op for op in seg["ops"] if not op.startswith("transition")]))
+        for overlay in (o for seg in self.segments for o in seg["overlays"]):
+            clipped = self._clip_item(overlay, start, end)
+            if clipped:
+                owner = next(s for s in reversed(sub.segments) if s["start_frame"] <= clipped["start_frame"])
+                owner["overlays"].append(clipped)
+        for seg in sub.segments:
+            if seg["overlays"]:
+                seg["ops"].append(f"transition x{len(seg['overlays'])}")
+        for track in self.audio_tracks:
+            clipped = self._clip_item(track, start, end)
+            if clipped:
+                sub.audio_tracks.append(clipped)
+        return sub
+
+    def describe(self):
+        """Các dòng mô tả plan để in ra (dry-run)"""
+        lines = [f"🎞️ Plan: {len(self.segments)} segment, {self.total_frames} frame "
+                 f"({self.duration:.2f}s @ {self.fps}fps), {len(self.inputs())} input, "
+                 f"{len(self.audio_tracks)} audioTracks"]
+        for seg in self.segments:
+            source = os.path.basename(seg["path"]) if seg["path"] else seg["color"]
+            lines.append(f"  #{seg['index']:<3} {seg['start']:9.3f}s +{seg['frames']:>5}f  "
+                         f"{source}  [{', '.join(seg['ops'])}]")
+        return lines
+
+
+def _main_layers(clip):
+    layers = clip.get("layers", [])
+    main = next((l for l in layers if l["type"] == "video"), None)
+    fill = next((l for l in layers if l["type"] == "fill-color"), None)
+    return main, fill
+
+
+def _cut_duration(layer, infos):
+    """Thời lượng (Fraction giây) theo cutFrom/cutTo, không có cutTo thì theo file (media index)"""
+    cut_from = exact_seconds(layer.get("cutFrom") or 0)
+    if layer.get("cutTo") is not None:
+        return max(Fraction(0), exact_seconds(layer["cutTo"]) - cut_from)
+    info = infos.get(layer["path"])
+    return max(Fraction(0), exact_seconds(info["duration"]) - cut_from) if info else Fraction(0)
+
+
+def _offset_frames(offset, spec_length, frames, fps):
+    """
+    Độ lệch (giây) tính từ đầu clip dài spec_length giây (= frames frame trên
+    plan) -> frame trong clip, đo từ ranh giới gần nhất (đầu hoặc cuối clip).
+    Clip dài k + 0.5 frame được làm tròn thành k + 1; spec cũ cộng dồn giây
+    bằng float nên điểm "cuối clip" có thể nằm trước ranh giới vài epsilon,
+    đo từ đầu clip ra k -> đo từ cuối clip: điểm trong vòng nửa frame quanh
+    ranh giới luôn dính đúng ranh giới.
+    """
+    from_end = spec_length - offset
+    if from_end < offset:
+        frame = frames - round_frames(from_end, fps)
+    else:
+        frame = round_frames(offset, fps)
+    return min(frames, max(0, frame))
+
+
+def _anchor_frame(spec_time, bounds, total_frames, fps):
+    """
+    Thời điểm trên timeline spec (giây) -> frame trên plan, tính trong clip
+    chứa thời điểm đó (không dồn sai số của các clip đứng trước).
+    bounds: [(đầu clip trên spec, độ dài trên spec, start_frame, frames)]
+    """
+    spec_time = exact_seconds(spec_time)
+    for spec_start, spec_length, start_frame, frames in bounds:
+        if spec_time < spec_start + spec_length:
+            return start_frame + _offset_frames(spec_time - spec_start, spec_length, frames, fps)
+    return total_frames
+
+
+def compile_plan(config, fps=None):
+    """
+    Dựng RenderPlan từ spec (dict). fps: fps của lần render (config kênh),
+    None = fps ghi trong spec.
+    """
+    fps = fps or config.get("fps", 25)
+    plan = RenderPlan(config.get("width", 1920), config.get("height", 1080), fps,
+                      config.get("outPath"), config.get("keepSourceAudio", True))
+    clips = config.get("clips", [])
+
+    # Chỉ probe các file cần lấy thời lượng (layer không có cutTo)
+    need_probe = [l["path"] for c in clips for l in c.get("layers", [])
+                  if l["type"] == "video" and l.get("cutTo") is None]
+    need_probe += [t["path"] for t in config.get("audioTracks") or [] if t.get("cutTo") is None]
+    infos = probe_media_many(sorted(set(need_probe))) if need_probe else {}
+
+    cursor = 0
+    spec_cursor = Fraction(0)
+    bounds = []
+    for i, clip in enumerate(clips):
+        main, fill = _main_layers(clip)
+        if main:
+            duration = exact_seconds(clip.get("duration") or _cut_duration(main, infos))
+        else:
+            duration = exact_seconds(clip.get("duration") or FILL_DEFAULT_DURATION)
+        frames = seconds_to_frames(duration, fps)
+        bounds.append((spec_cursor, duration, cursor, frames))
+        spec_cursor += duration
+
+        seg = {
+            "index": i,
+            "kind": "video" if main else "fill",
+            "path": main["path"] if main else None,
+            "cut_from": float(main.get("cutFrom") or 0) if main else 0.0,
+            "cut_to": main.get("cutTo") if main else None,
+            "color": (fill or {}).get("color", "#000000") if not main else None,
+            "start_frame": cursor,
+            "frames": frames,
+            "start": _seconds(cursor, fps),
+            "duration": _seconds(frames, fps),
+            "resize": main.get("resizeMode") if main else None,
+            "volume": float(main.get("mixVolume", 1)) if main else 0.0,
+            "logo": None,
+            "overlays": [],
+            "ops": [],
+        }
+        for layer in clip.get("layers", []):
+            if layer is main or layer is fill:
+                continue
+            if layer["type"] == "image-overlay":
+                seg["logo"] = layer["path"]
+            elif layer["type"] == "video":
+                start = exact_seconds(layer.get("start", 0))
+                stop = layer.get("stop")
+                length = (exact_seconds(stop) - start) if stop is not None else _cut_duration(layer, infos)
+                offset = _offset_frames(max(Fraction(0), start), duration, frames, fps)
+                overlay_frames = seconds_to_frames(length, fps)
+                seg["overlays"].append({
+                    "kind": "transition",
+                    "path": layer["path"],
+                    "cut_from": float(layer.get("cutFrom") or 0),
+                    "cut_to": layer.get("cutTo"),
+                    "start_frame": cursor + offset,
+                    "frames": overlay_frames,
+                    "start": _seconds(cursor + offset, fps),
+                    "duration": _seconds(overlay_frames, fps),
+                })
+
+        if main:
+            if seg["cut_from"] or seg["cut_to"] is not None:
+                seg["ops"].append("cut")
+            seg["ops"].append(seg["resize"] or "scale")
+        else:
+            seg["ops"].append("fill")
+        if seg["logo"]:
+            seg["ops"].append("logo")
+        if seg["overlays"]:
+            seg["ops"].append(f"transition x{len(seg['overlays'])}")
+        plan.segments.append(seg)
+        cursor += frames
+
+    for track in config.get("audioTracks") or []:
+        start_frame = _anchor_frame(track.get("start") or 0, bounds, cursor, fps)
+        frames = seconds_to_frames(_cut_duration(track, infos), fps)
+        plan.audio_tracks.append({
+            "path": track["path"],
+            "cut_from": float(track.get("cutFrom") or 0),
+            "start_frame": start_frame,
+            "frames": frames,
+            "start": _seconds(start_frame, fps),
+            "duration": _seconds(frames, fps),
+            "volume": float(track.get("mixVolume", 1)),
+        })
+    return plan
+
+
+def load_plan(spec_path, fps=None):
+    with open(spec_path, "r", encoding="utf-8") as f:
+        return compile_plan(json.load(f), fps)
+
+
+def estimate_render_time(plan, renderer, path=None, reports=None):
+    """
+    Ước lượng thời gian render (giây) = thời lượng plan / realtime factor
+    trung bình các lần render thành công trước đó. Ưu tiên cùng renderer +
+    path, rồi cùng renderer, rồi mọi lần render. Chưa có lịch sử -> None.
+    """
+    summary = summarize_reports(load_reports() if reports is None else reports)
+
+    def pick(keys):
+        runs = sum(summary[k]["runs"] for k in keys)
+        weighted = [(summary[k]["avg_realtime_factor"], summary[k]["runs"]) for k in keys
+                    if summary[k]["avg_realtime_factor"]]
+        if not weighted:
+            return None
+        rtf = sum(f * n for f, n in weighted) / sum(n for _, n in weighted)
+        return rtf, runs
+
+    candidates = [
+        (f"{renderer}/{path}", [k for k in summary if k == (renderer, path)]),
+        (renderer, [k for k in summary if k[0] == renderer]),
+        ("mọi renderer", list(summary)),
+    ]
+    for basis, keys in candidates:
+        picked = pick(keys) if keys else None
+        if picked:
+            rtf, runs = picked
+            return {"seconds": round(plan.duration / rtf, 1), "realtime_factor": round(rtf, 3),
+                    "runs": runs, "basis": basis}
+    return None
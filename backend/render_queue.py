@@ -0,0 +1,583 @@
+"""
+Render Queue - Hàng đợi job render (SQLite) + worker chạy nền
+
+- Mỗi job là 1 file spec kiểu editly + kênh + renderer, trạng thái
+  queued -> running -> done / failed, lưu trong Queue/render_queue.sqlite3.
+- Worker lấy job theo thứ tự, chạy tối đa `concurrency` job cùng lúc (mặc định 1
+  để 2 render không tranh nhau GPU). Mỗi job chạy trong tiến trình render_cli
+  riêng nên 1 job crash không kéo theo worker.
+- Job đang chạy được cập nhật heartbeat. Worker chết (tắt máy, crash) -> job
+  quá hạn heartbeat được worker khác (hoặc lần khởi động sau) đưa lại vào
+  hàng đợi. render_cli chết theo worker (Linux: PR_SET_PDEATHSIG; mọi hệ:
+  stdin/stdout tới worker bị đóng -> tự huỷ) nên job không bị 2 tiến trình
+  cùng render ra 1 file. Job lỗi được thử lại tối đa max_attempts lần, cách
+  nhau RETRY_DELAY * số lần đã thử.
+- Tạm dừng / tiếp tục / huỷ (request_control, vd: từ editor): lưu vào cột
+  control, worker chuyển lệnh cho render_cli qua stdin (--control-stdin).
+  Tạm dừng có hiệu lực ở ranh giới segment; huỷ kill ffmpeg, dọn file tạm,
+  job chuyển sang cancelled (không thử lại).
+
+Sử dụng:
+    python -m render_queue worker --concurrency 1
+    python -m render_queue add --channel Kenh1 --spec ../Temp/Kenh1/spec.json
+    python -m render_queue list
+    python -m render_queue retry 12
+    python -m render_queue pause 12 / resume 12 / cancel 12
+
+    from render_queue import get_render_queue, ensure_worker
+    job_id = get_render_queue().enqueue("Kenh1", spec_path)
+    ensure_worker()
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from consts import RENDER_QUEUE_DB
+from ffmpeg_runner import pdeathsig_preexec
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINISHED = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+ACTION_PAUSE = "pause"
+ACTION_RESUME = "resume"
+ACTION_CANCEL = "cancel"
+
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_DELAY = 30         # giây, nhân với số lần đã thử
+HEARTBEAT_INTERVAL = 5   # giây
+STALE_AFTER = 60         # job/worker không heartbeat quá lâu -> coi như đã chết
+POLL_INTERVAL = 1
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def resolve_render_concurrency(concurrency=None):
+    """Ưu tiên: tham số > biến môi trường FUNNYVIDEO_RENDER_CONCURRENCY > 1"""
+    for value in (concurrency, os.environ.get("FUNNYVIDEO_RENDER_CONCURRENCY")):
+        try:
+            if value is not None and int(value) > 0:
+                return int(value)
+        except (TypeError, ValueError):
+            pass
+    return 1
+
+
+class RenderQueue:
+    def __init__(self, db_path=RENDER_QUEUE_DB):
+        self.db_path = str(db_path)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khi claim)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel TEXT NOT NULL,
+                    spec_path TEXT NOT NULL,
+                    renderer TEXT NOT NULL,
+                    payload TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    heartbeat_at REAL,
+                    progress TEXT,
+                    output TEXT,
+                    error TEXT,
+                    control TEXT
+                )
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "control" not in columns:
+                # DB tạo từ bản cũ: thêm cột điều khiển (NULL = chạy, "pause", "cancel")
+                conn.execute("ALTER TABLE jobs ADD COLUMN control TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before, id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    host TEXT,
+                    pid INTEGER,
+                    heartbeat_at REAL NOT NULL
+                )
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params)
+
+    def enqueue(self, channel, spec_path, renderer="graph", payload=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        cur = self._execute(
+            "INSERT INTO jobs (channel, spec_path, renderer, payload, status, max_attempts, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (channel, os.path.abspath(spec_path), renderer, json.dumps(payload or {}, ensure_ascii=False),
+             JOB_QUEUED, max_attempts, time.time())
+        )
+        print(f"📥 Đã thêm job render #{cur.lastrowid} ({channel}) vào hàng đợi")
+        return cur.lastrowid
+
+    def claim(self, worker_id):
+        """Lấy job queued cũ nhất (đã tới hạn) và chuyển sang running - atomic giữa các tiến trình"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND not_before <= ? ORDER BY id LIMIT 1",
+                    (JOB_QUEUED, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1, "
+                    "started_at = ?, heartbeat_at = ?, error = NULL WHERE id = ?",
+                    (JOB_RUNNING, worker_id, now, now, row["id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        job["attempts"] += 1
+        job["payload"] = json.loads(job["payload"] or "{}")
+        return job
+
+    def heartbeat(self, worker_id, job_ids=()):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, host, pid, heartbeat_at) VALUES (?, ?, ?, ?)",
+                (worker_id, socket.gethostname(), os.getpid(), now)
+            )
+            for job_id in job_ids:
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?",
+                             (now, job_id, JOB_RUNNING))
+
+    def unregister_worker(self, worker_id):
+        self._execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def alive_workers(self):
+        rows = self._execute("SELECT * FROM workers WHERE heartbeat_at >= ?",
+                             (time.time() - STALE_AFTER,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def set_progress(self, job_id, event):
+        self._execute("UPDATE jobs SET progress = ? WHERE id = ?",
+                      (json.dumps(event, ensure_ascii=False), job_id))
+
+    def finish(self, job_id, output):
+        self._execute(
+            "UPDATE jobs SET status = ?, output = ?, finished_at = ?, worker_id = NULL, control = NULL WHERE id = ?",
+            (JOB_DONE, output, time.time(), job_id)
+        )
+
+    def fail(self, job_id, error, stale_before=None):
+        """
+        Job lỗi: còn lượt thử thì xếp lại hàng đợi (có trễ), hết lượt thì failed.
+        stale_before: chỉ đổi nếu job vẫn running và heartbeat cũ hơn mốc này
+        (requeue_stale chạy định kỳ ở mọi worker, job có thể vừa xong) - không
+        đổi gì thì trả về None.
+        """
+        guard, guard_args = "", ()
+        if stale_before is not None:
+            guard = " AND status = ? AND COALESCE(heartbeat_at, 0) < ?"
+            guard_args = (JOB_RUNNING, stale_before)
+        job = self.get(job_id)
+        if job and job["attempts"] < job["max_attempts"]:
+            cur = self._execute(
+                "UPDATE jobs SET status = ?, error = ?, worker_id = NULL, not_before = ? WHERE id = ?" + guard,
+                (JOB_QUEUED, error, time.time() + RETRY_DELAY * job["attempts"], job_id) + guard_args
+            )
+            return JOB_QUEUED if cur.rowcount else None
+        cur = self._execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, worker_id = NULL, control = NULL "
+            "WHERE id = ?" + guard,
+            (JOB_FAILED, error, time.time(), job_id) + guard_args
+        )
+        return JOB_FAILED if cur.rowcount else None
+
+    def request_control(self, job_id, action):
+        """
+        Yêu cầu tạm dừng / tiếp tục / huỷ 1 job. Job còn queued mà bị huỷ ->
+        cancelled ngay; còn lại worker chuyển lệnh cho render_cli ở lần poll sau.
+        Trả về False nếu job đã kết thúc (hoặc đang bị huỷ).
+        """
+        if action not in (ACTION_PAUSE, ACTION_RESUME, ACTION_CANCEL):
+            raise ValueError(f"Lệnh điều khiển không hợp lệ: {action}")
+        if action == ACTION_CANCEL:
+            cur = self._execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, control = NULL WHERE id = ? AND status = ?",
+                (JOB_CANCELLED, time.time(), job_id, JOB_QUEUED)
+            )
+            if cur.rowcount:
+                return True
+        cur = self._execute(
+            "UPDATE jobs SET control = ? WHERE id = ? AND status IN (?, ?) AND COALESCE(control, '') != ?",
+            (None if action == ACTION_RESUME else action, job_id, JOB_QUEUED, JOB_RUNNING, ACTION_CANCEL)
+        )
+        return cur.rowcount > 0
+
+    def controls(self, job_ids):
+        """{job_id: control} của các job (None = chạy bình thường)"""
+        if not job_ids:
+            return {}
+        marks = ",".join("?" * len(job_ids))
+        rows = self._execute(f"SELECT id, control FROM jobs WHERE id IN ({marks})", tuple(job_ids)).fetchall()
+        return {row["id"]: row["control"] for row in rows}
+
+    def mark_cancelled(self, job_id):
+        self._execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, worker_id = NULL, control = NULL WHERE id = ?",
+            (JOB_CANCELLED, time.time(), job_id)
+        )
+
+    def release(self, job_id):
+        """Trả job về hàng đợi khi worker dừng chủ động (không tính là 1 lần thử)"""
+        self._execute(
+            "UPDATE jobs SET status = ?, worker_id = NULL, attempts = MAX(0, attempts - 1) "
+            "WHERE id = ? AND status = ?",
+            (JOB_QUEUED, job_id, JOB_RUNNING)
+        )
+
+    def requeue_stale(self):
+        """Job running mà worker đã mất heartbeat -> thử lại (hoặc failed nếu hết lượt)"""
+        cutoff = time.time() - STALE_AFTER
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE status = ? AND COALESCE(heartbeat_at, 0) < ?",
+            (JOB_RUNNING, cutoff)
+        ).fetchall()
+        requeued = 0
+        for row in rows:
+            status = self.fail(row["id"], "Worker dừng đột ngột khi đang render", stale_before=cutoff)
+            if status:
+                requeued += 1
+                print(f"♻️ Job #{row['id']} bị gián đoạn -> {status}")
+        return requeued
+
+    def retry(self, job_id):
+        """Cho job failed/cancelled chạy lại từ đầu (reset số lần thử)"""
+        cur = self._execute(
+            "UPDATE jobs SET status = ?, attempts = 0, not_before = 0, error = NULL, finished_at = NULL, "
+            "control = NULL WHERE id = ? AND status IN (?, ?)",
+            (JOB_QUEUED, job_id, JOB_FAILED, JOB_CANCELLED)
+        )
+        return cur.rowcount > 0
+
+    def get(self, job_id):
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"] or "{}")
+        return job
+
+    def list_jobs(self, status=None, limit=50):
+        if status:
+            rows = self._execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?",
+                                 (status, limit)).fetchall()
+        else:
+            rows = self._execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def wait(self, job_id, poll=2.0):
+        """Chờ tới khi job done/failed/cancelled, trả về job"""
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in JOB_FINISHED:
+                return job
+            time.sleep(poll)
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_render_queue():
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = RenderQueue()
+        return _default_queue
+
+
+class RenderWorker:
+    """
+    Lấy job từ hàng đợi và chạy bằng `python -m render_cli --spec ...`.
+    idle_exit: số giây rảnh liên tục thì tự thoát (None = chạy mãi, kiểu daemon)
+    """
+
+    def __init__(self, queue=None, concurrency=None, idle_exit=None):
+        self.queue = queue or get_render_queue()
+        self.concurrency = resolve_render_concurrency(concurrency)
+        self.idle_exit = idle_exit
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._active = {}  # job_id -> Popen
+        self._sent_controls = {}  # job_id -> control đã chuyển cho render_cli
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            with self._active_lock:
+                job_ids = list(self._active)
+            try:
+                self.queue.heartbeat(self.worker_id, job_ids)
+                # Job của worker khác chết giữa chừng (kể cả khi worker này
+                # chạy mãi hoặc khởi động trong vòng STALE_AFTER sau lúc đó)
+                self.queue.requeue_stale()
+            except Exception as e:
+                print(f"⚠️ Không ghi được heartbeat: {e}")
+
+    def _control_loop(self):
+        """Chuyển lệnh pause/resume/cancel (cột control) cho render_cli đang chạy job"""
+        while not self._stop.wait(POLL_INTERVAL):
+            with self._active_lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            try:
+                controls = self.queue.controls(list(active))
+            except Exception as e:
+                print(f"⚠️ Không đọc được lệnh điều khiển: {e}")
+                continue
+            for job_id, proc in active.items():
+                wanted = controls.get(job_id)
+                if wanted == self._sent_controls.get(job_id):
+                    continue
+                try:
+                    proc.stdin.write(f"{wanted or ACTION_RESUME}\n")
+                    proc.stdin.flush()
+                except (OSError, ValueError):
+                    continue  # render_cli vừa thoát
+                self._sent_controls[job_id] = wanted
+                print(f"🎛️ Job #{job_id}: {wanted or ACTION_RESUME}")
+
+    @staticmethod
+    def _render_cmd(job):
+        return [sys.executable, "-m", "render_cli", "--control-stdin",
+                "--channel", job["channel"], "--spec", job["spec_path"], "--renderer", job["renderer"]]
+
+    def _run_job(self, job):
+        job_id = job["id"]
+        cmd = self._render_cmd(job)
+        print(f"🎬 Job #{job_id} (lần {job['attempts']}/{job['max_attempts']}): {job['spec_path']}")
+        output, error, cancelled = None, None, False
+        # render_cli phải chết theo worker: nếu còn chạy, job bị requeue_stale
+        # đưa lại hàng đợi và 2 render cùng ghi vào 1 outPath
+        kwargs = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # Thread này sống tới khi render_cli thoát -> PDEATHSIG chỉ bắn khi worker chết
+            kwargs["preexec_fn"] = pdeathsig_preexec(signal.SIGTERM)
+        try:
+            proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, stdout=subprocess.PIPE,
+                                    stdin=subprocess.PIPE, text=True, encoding="utf-8", **kwargs)
+            with self._active_lock:
+                self._active[job_id] = proc
+            for line in proc.stdout:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                self.queue.set_progress(job_id, event)
+                if event.get("event") == "done":
+                    output = event.get("output")
+                elif event.get("event") == "error":
+                    error = event.get("message")
+                elif event.get("event") == "cancelled":
+                    cancelled = True
+            returncode = proc.wait()
+        except Exception as e:
+            returncode, error = -1, str(e)
+        finally:
+            with self._active_lock:
+                self._active.pop(job_id, None)
+                self._sent_controls.pop(job_id, None)
+
+        if cancelled:
+            self.queue.mark_cancelled(job_id)
+            print(f"🛑 Job #{job_id} đã huỷ")
+            return
+        if self._stop.is_set():
+            # Worker đang dừng (Ctrl+C) -> trả job lại, lần sau chạy tiếp
+            self.queue.release(job_id)
+            return
+        if returncode == 0:
+            self.queue.finish(job_id, output)
+            self._after_success(job)
+            print(f"✅ Job #{job_id} xong: {output}")
+        else:
+            status = self.queue.fail(job_id, error or f"render_cli thoát với mã {returncode}")
+            print(f"❌ Job #{job_id} lỗi ({error}) -> {status}")
+
+    @staticmethod
+    def _after_success(job):
+        """Việc làm sau khi render xong (giống render_video cũ): lưu clip đã dùng, xoá spec"""
+        payload = job["payload"]
+        try:
+            if payload.get("selected_clips"):
+                from clip_selector import save_used_videos
+                from render_config import get_used_videos_path
+                save_used_videos(payload["selected_clips"], get_used_videos_path(job["channel"]))
+            if payload.get("delete_spec") and os.path.exists(job["spec_path"]):
+                os.remove(job["spec_path"])
+        except Exception as e:
+            print(f"⚠️ Job #{job['id']}: lỗi khi dọn dẹp sau render: {e}")
+
+    @staticmethod
+    def _cleanup_stale_files():
+        """File tạm của các render chết giữa chừng (worker/render_cli bị kill, mất điện...)"""
+        try:
+            from render_helper import cleanup_stale_render_files
+            cleanup_stale_render_files()
+        except Exception as e:
+            print(f"⚠️ Lỗi khi dọn file tạm cũ: {e}")
+
+    def run(self):
+        print(f"👷 Render worker {self.worker_id} chạy tối đa {self.concurrency} job cùng lúc")
+        self.queue.heartbeat(self.worker_id)
+        self.queue.requeue_stale()
+        self._cleanup_stale_files()
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+        threading.Thread(target=self._control_loop, daemon=True).start()
+
+        threads = []
+        idle_since = time.time()
+        try:
+            while True:
+                threads = [t for t in threads if t.is_alive()]
+                while len(threads) < self.concurrency:
+                    job = self.queue.claim(self.worker_id)
+                    if job is None:
+                        break
+                    t = threading.Thread(target=self._run_job, args=(job,), daemon=True)
+                    t.start()
+                    threads.append(t)
+
+                if threads:
+                    idle_since = time.time()
+                elif self.idle_exit is not None and time.time() - idle_since >= self.idle_exit:
+                    print("💤 Hàng đợi trống, worker dừng")
+                    break
+                time.sleep(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            print("🛑 Đang dừng worker, trả các job đang chạy về hàng đợi...")
+            self._stop.set()
+            with self._active_lock:
+                for proc in self._active.values():
+                    proc.terminate()
+            for t in threads:
+                t.join()
+        finally:
+            self._stop.set()
+            self.queue.unregister_worker(self.worker_id)
+
+
+def ensure_worker(idle_exit=60):
+    """
+    Đảm bảo có worker đang chạy trên hàng đợi, nếu chưa có thì bật 1 worker
+    nền (tự thoát sau `idle_exit` giây rảnh).
+    """
+    queue = get_render_queue()
+    if queue.alive_workers():
+        return False
+    cmd = [sys.executable, "-m", "render_queue", "worker", "--idle-exit", str(idle_exit)]
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    subprocess.Popen(cmd, cwd=BACKEND_DIR, stdin=subprocess.DEVNULL, **kwargs)
+    # Chờ worker đăng ký để lần gọi tiếp theo không bật thêm worker thứ 2
+    deadline = time.time() + 10
+    while time.time() < deadline and not queue.alive_workers():
+        time.sleep(0.2)
+    print("👷 Đã bật render worker nền")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hàng đợi render video")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_worker = sub.add_parser("worker", help="Chạy worker lấy job từ hàng đợi")
+    p_worker.add_argument("--concurrency", type=int, default=None,
+                          help="Số job render chạy cùng lúc (mặc định: FUNNYVIDEO_RENDER_CONCURRENCY hoặc 1)")
+    p_worker.add_argument("--idle-exit", type=float, default=None,
+                          help="Tự thoát sau N giây không có job (mặc định: chạy mãi)")
+
+    p_add = sub.add_parser("add", help="Thêm 1 file spec vào hàng đợi")
+    p_add.add_argument("--channel", required=True)
+    p_add.add_argument("--spec", required=True)
+    p_add.add_argument("--renderer", default="graph", choices=["graph", "segments", "stream"])
+    p_add.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    p_list = sub.add_parser("list", help="Liệt kê job")
+    p_list.add_argument("--status", choices=[JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED])
+
+    p_retry = sub.add_parser("retry", help="Chạy lại job đã failed/cancelled")
+    p_retry.add_argument("job_id", type=int)
+
+    for action, help_text in ((ACTION_PAUSE, "Tạm dừng job (ở ranh giới segment tiếp theo)"),
+                              (ACTION_RESUME, "Chạy tiếp job đã tạm dừng"),
+                              (ACTION_CANCEL, "Huỷ job (kill ffmpeg, dọn file tạm)")):
+        p_control = sub.add_parser(action, help=help_text)
+        p_control.add_argument("job_id", type=int)
+
+    args = parser.parse_args(argv)
+    queue = get_render_queue()
+
+    if args.command == "worker":
+        RenderWorker(queue, args.concurrency, args.idle_exit).run()
+    elif args.command == "add":
+        print(queue.enqueue(args.channel, args.spec, args.renderer, max_attempts=args.max_attempts))
+    elif args.command == "list":
+        for job in queue.list_jobs(args.status):
+            detail = job["output"] or job["error"] or job["spec_path"]
+            progress = json.loads(job["progress"] or "{}")
+            if job["status"] == JOB_RUNNING and progress.get("event") == "progress":
+                pct = progress.get("percent")
+                eta = progress.get("eta")
+                detail = (f"{progress['label']} {pct if pct is not None else '?'}% "
+                          f"ETA {eta if eta is not None else '?'}s speed {progress.get('speed')}x")
+            status = "paused" if job["status"] == JOB_RUNNING and job.get("control") == ACTION_PAUSE else job["status"]
+            print(f"#{job['id']:<5} {status:<9} {job['attempts']}/{job['max_attempts']} "
+                  f"{job['channel']:<15} {detail}")
+    elif args.command == "retry":
+        print("✅ Đã xếp lại hàng đợi" if queue.retry(args.job_id) else "⚠️ Job không ở trạng thái failed/cancelled")
+    elif args.command in (ACTION_PAUSE, ACTION_RESUME, ACTION_CANCEL):
+        ok = queue.request_control(args.job_id, args.command)
+        print(f"✅ Đã gửi lệnh {args.command}" if ok else "⚠️ Job đã kết thúc hoặc đang bị huỷ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Render Report - Đo thời gian từng giai đoạn render (profiling)
+
+- Mỗi giai đoạn (chuẩn bị asset, render clip, concat, audio, mux...) ghi lại
+  wall time, CPU time (python + các tiến trình ffmpeg con), byte đọc/ghi và
+  danh sách lệnh ffmpeg của giai đoạn đó (fps encoder, speed...).
+- Kết thúc render: ghi <video>.report.json cạnh file MP4 và thêm 1 dòng tóm tắt
+  vào Logs/render_reports.jsonl để so sánh giữa các lần chạy.
+- Giả định mỗi tiến trình chỉ render 1 video tại 1 thời điểm (UI/CLI/worker
+  đều chạy render trong tiến trình con riêng hoặc tuần tự).
+
+Sử dụng:
+    from render_report import RenderReport, report_stage
+
+    with RenderReport(out_path, renderer="segments") as report:
+        with report_stage("render_clips"):
+            ...
+        report.meta["path"] = "direct"
+
+    # Tổng hợp các lần chạy (theo renderer + path)
+    python -m render_report summary
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from consts import RENDER_REPORTS_LOG
+from ffmpeg_runner import add_metrics_listener, remove_metrics_listener
+
+REPORT_VERSION = 1
+
+_active = None
+_active_lock = threading.Lock()
+
+
+class RenderReport:
+    def __init__(self, output, renderer, meta=None):
+        self.output = output
+        self.renderer = renderer
+        self.meta = dict(meta or {})
+        self.stages = []
+        self._current = None
+        self._lock = threading.Lock()
+        self._started = None
+        self._cpu_started = None
+        self.wall = None
+        self.cpu_python = None
+        self.ok = False
+
+    # --- context manager ---
+    def __enter__(self):
+        global _active
+        self._started = time.time()
+        self._cpu_started = time.process_time()
+        with _active_lock:
+            _active = self
+        add_metrics_listener(self._on_metrics)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        remove_metrics_listener(self._on_metrics)
+        with _active_lock:
+            if _active is self:
+                _active = None
+        self.wall = time.time() - self._started
+        self.cpu_python = time.process_time() - self._cpu_started
+        self.ok = exc_type is None
+        if exc_type is not None:
+            self.meta["error"] = f"{exc_type.__name__}: {exc}"
+        try:
+            self.write()
+        except OSError as e:
+            print(f"⚠️ Không ghi được báo cáo render: {e}")
+        return False
+
+    # --- thu thập ---
+    def _on_metrics(self, metrics):
+        with self._lock:
+            stage = self._current
+            if stage is None:
+                # Lệnh ffmpeg chạy ngoài mọi giai đoạn đã đánh dấu
+                stage = next((s for s in self.stages if s["name"] == "other"), None)
+                if stage is None:
+                    stage = self._begin("other")
+                    stage["wall"] = 0.0
+            stage["steps"].append(metrics)
+
+    def _begin(self, name):
+        stage = {"name": name, "started": time.time(), "wall": None,
+                 "cpu_python": None, "steps": []}
+        self.stages.append(stage)
+        return stage
+
+    @contextmanager
+    def stage(self, name):
+        with self._lock:
+            stage = self._current = self._begin(name)
+        cpu0 = time.process_time()
+        try:
+            yield stage
+        finally:
+            stage["wall"] = time.time() - stage["started"]
+            stage["cpu_python"] = time.process_time() - cpu0
+            with self._lock:
+                self._current = None
+
+    # --- xuất báo cáo ---
+    @staticmethod
+    def _summarize_stage(stage):
+        steps = stage["steps"]
+        cpu_ffmpeg = sum((s.get("cpu_user") or 0) + (s.get("cpu_sys") or 0) for s in steps)
+        frames = sum(s.get("frames") or 0 for s in steps)
+        step_wall = sum(s.get("wall") or 0 for s in steps)
+        return {
+            "name": stage["name"],
+            "wall": round(stage["wall"] or 0, 3),
+            "cpu": round((stage["cpu_python"] or 0) + cpu_ffmpeg, 3),
+            "cpu_ffmpeg": round(cpu_ffmpeg, 3),
+            "bytes_read": sum(s.get("bytes_read") or 0 for s in steps),
+            "bytes_written": sum(s.get("bytes_written") or 0 for s in steps),
+            "ffmpeg_steps": len(steps),
+            "frames": frames,
+            # fps encoder gộp: tổng frame / tổng thời gian của các lệnh (không tính song song)
+            "encoder_fps": round(frames / step_wall, 2) if step_wall > 0 and frames else None,
+        }
+
+    def to_dict(self, with_steps=True):
+        stages = []
+        for stage in self.stages:
+            item = self._summarize_stage(stage)
+            if with_steps:
+                item["steps"] = stage["steps"]
+            stages.append(item)
+        try:
+            output_bytes = os.path.getsize(self.output)
+        except OSError:
+            output_bytes = 0
+        duration = self.meta.get("duration")
+        return {
+            "version": REPORT_VERSION,
+            "time": round(self._started or time.time(), 3),
+            "output": self.output,
+            "renderer": self.renderer,
+            "ok": self.ok,
+            "wall": round(self.wall or 0, 3),
+            "cpu": round((self.cpu_python or 0) + sum(s["cpu_ffmpeg"] for s in stages), 3),
+            "output_bytes": output_bytes,
+            # > 1 nghĩa là render nhanh hơn thời gian thực
+            "realtime_factor": round(duration / self.wall, 3) if duration and self.wall else None,
+            "meta": self.meta,
+            "stages": stages,
+        }
+
+    def write(self):
+        report = self.to_dict()
+        if self.ok and self.output:
+            report_path = f"{os.path.splitext(self.output)[0]}.report.json"
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"📊 Báo cáo render: {report_path}")
+
+        summary = self.to_dict(with_steps=False)
+        os.makedirs(os.path.dirname(RENDER_REPORTS_LOG), exist_ok=True)
+        with open(RENDER_REPORTS_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        return report
+
+
+def active_report():
+    with _active_lock:
+        return _active
+
+
+@contextmanager
+def report_stage(name):
+    """Đánh dấu 1 giai đoạn của report đang chạy (không có report -> không làm gì)"""
+    report = active_report()
+    if report is None:
+        yield None
+        return
+    with report.stage(name) as stage:
+        yield stage
+
+
+def load_reports(log_path=RENDER_REPORTS_LOG):
+    reports = []
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    reports.append(json.loads(line))
+                except ValueError:
+                    pass
+    except OSError:
+        pass
+    return reports
+
+
+def summarize_reports(reports):
+    """
+    Gộp các lần render thành công theo (renderer, path).
+    Trả về {(renderer, path): {"runs", "avg_wall", "avg_realtime_factor", "stages": {name: {"avg_wall", "share"}}}}
+    """
+    groups = {}
+    for r in reports:
+        if not r.get("ok"):
+            continue
+        key = (r.get("renderer"), r.get("meta", {}).get("path", "-"))
+        groups.setdefault(key, []).append(r)
+
+    result = {}
+    for key, runs in groups.items():
+        total_wall = sum(r["wall"] for r in runs)
+        stage_wall = {}
+        for r in runs:
+            for s in r.get("stages", []):
+                stage_wall[s["name"]] = stage_wall.get(s["name"], 0) + s["wall"]
+        factors = [r["realtime_factor"] for r in runs if r.get("realtime_factor")]
+        result[key] = {
+            "runs": len(runs),
+            "avg_wall": total_wall / len(runs),
+            "avg_realtime_factor": sum(factors) / len(factors) if factors else None,
+            "stages": {
+                name: {"avg_wall": w / len(runs), "share": w / total_wall if total_wall else 0}
+                for name, w in stage_wall.items()
+            },
+        }
+    return result
+
+
+def _print_summary(summary):
+    if not summary:
+        print("Chưa có báo cáo render nào.")
+        return
+    for (renderer, path), s in sorted(summary.items(), key=lambda kv: str(kv[0])):
+        rtf = f"{s['avg_realtime_factor']:.2f}x" if s["avg_realtime_factor"] else "?"
+        print(f"== {renderer} / {path}: {s['runs']} lần, trung bình {s['avg_wall']:.1f}s, realtime {rtf}")
+        for name, st in sorted(s["stages"].items(), key=lambda kv: -kv[1]["avg_wall"]):
+            print(f"   {name:<16} {st['avg_wall']:8.2f}s  {st['share'] * 100:5.1f}%")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Báo cáo thời gian render")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_sum = sub.add_parser("summary", help="Tổng hợp các lần render theo renderer/path")
+    p_sum.add_argument("--last", type=int, default=None, help="Chỉ xét N lần render gần nhất")
+    args = parser.parse_args(argv)
+
+    if args.command == "summary":
+        reports = load_reports()
+        if args.last:
+            reports = reports[-args.last:]
+        _print_summary(summarize_reports(reports))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Scratch Space - Chỗ đặt file trung gian của render (ổ local nhanh / tmpfs)
+
+Trước đây thư mục tạm ffmpeg_render_<uuid> và file filter nằm cạnh video
+đầu ra - thư mục Output trên ổ mạng thì mọi file tạm đều ghi/đọc qua mạng.
+Giờ file trung gian đặt ở scratch root, chọn theo thứ tự:
+    1. tham số / config kênh "scratch_dir"
+    2. biến môi trường FUNNYVIDEO_SCRATCH_DIR
+    3. /dev/shm (tmpfs, Linux) nếu còn đủ chỗ với hệ số an toàn TMPFS_HEADROOM
+    4. Temp/render trong thư mục project
+Root không đủ chỗ cho ước lượng của lần render thì thử root tiếp theo;
+không root nào đủ -> ScratchSpaceError trước khi bắt đầu render. Thư mục
+chứa video đầu ra cũng được kiểm tra (ước lượng từ lịch sử render_reports).
+
+Sử dụng:
+    from scratch_space import scratch_path, check_output_space, estimate_scratch_bytes
+
+    check_output_space(out_path, duration)
+    temp_dir = scratch_path("ffmpeg_render_", need_bytes=estimate_scratch_bytes(duration))
+"""
+
+import os
+import shutil
+import sys
+import uuid
+
+from consts import SCRATCH_DIR
+from render_report import load_reports
+
+TMPFS_DIR = "/dev/shm"
+TMPFS_HEADROOM = 2.0  # tmpfs là RAM: chỉ dùng khi còn trống >= 2 lần lượng cần
+
+PCM_BYTES_PER_SEC = 48000 * 4  # audio_timeline: s16le stereo 48 kHz
+VIDEO_BYTES_PER_SEC = 2 * 1024 ** 2  # ước lượng thô khi chưa có lịch sử render (~16 Mbps)
+SCRATCH_MARGIN = 64 * 1024 ** 2
+OUTPUT_MARGIN = 1.2
+HISTORY_RUNS = 20
+
+
+class ScratchSpaceError(RuntimeError):
+    """Không còn đủ chỗ trống cho file tạm / video đầu ra"""
+
+
+def _human(n):
+    return f"{n / 1024 ** 3:.2f} GB" if n >= 1024 ** 3 else f"{n / 1024 ** 2:.0f} MB"
+
+
+def free_bytes(path):
+    """Dung lượng trống của ổ chứa path (path chưa tồn tại -> thư mục cha gần nhất)"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return 0
+
+
+def scratch_candidates(config=None):
+    """Các scratch root theo thứ tự ưu tiên: [(path, headroom)]"""
+    candidates = []
+    for value in ((config or {}).get("scratch_dir"), os.environ.get("FUNNYVIDEO_SCRATCH_DIR")):
+        if value:
+            candidates.append((os.path.abspath(os.path.expanduser(str(value))), 1.0))
+    if sys.platform.startswith("linux") and os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK):
+        candidates.append((os.path.join(TMPFS_DIR, "funnyvideo"), TMPFS_HEADROOM))
+    candidates.append((str(SCRATCH_DIR), 1.0))
+    return candidates
+
+
+def resolve_scratch_root(need_bytes=0, config=None):
+    """Scratch root đầu tiên còn đủ chỗ (đã tạo thư mục)"""
+    checked = []
+    for root, headroom in scratch_candidates(config):
+        free = free_bytes(root)
+        if free >= need_bytes * headroom:
+            try:
+                os.makedirs(root, exist_ok=True)
+            except OSError as e:
+                checked.append(f"{root}: {e}")
+                continue
+            return root
+        checked.append(f"{root}: trống {_human(free)}")
+    raise ScratchSpaceError(
+        f"Không đủ chỗ cho file tạm (cần ~{_human(need_bytes)}):\n" + "\n".join(checked))
+
+
+def scratch_path(prefix, suffix="", need_bytes=0, config=None):
+    """Đường dẫn mới (chưa tạo) trong scratch root phù hợp, vd: thư mục tạm / file filter"""
+    root = resolve_scratch_root(need_bytes, config)
+    return os.path.join(root, f"{prefix}{uuid.uuid4().hex[:8]}{suffix}")
+
+
+def estimate_scratch_bytes(duration, reencode=False):
+    """
+    File tạm của renderer "segments" cho video dài `duration` giây: PCM audio
+    (track nền + lớp hiệu ứng + đoạn đã decode) và video batch khi concat
+    kiểu reencode. Video nối cuối cùng đi qua pipe, không nằm trên đĩa.
+    """
+    need = duration * PCM_BYTES_PER_SEC * 3
+    if reencode:
+        need += duration * VIDEO_BYTES_PER_SEC
+    return int(need + SCRATCH_MARGIN)
+
+
+def estimate_output_bytes(duration):
+    """Dung lượng video đầu ra, theo byte/giây trung bình của các lần render gần nhất"""
+    rates = []
+    for report in load_reports()[-HISTORY_RUNS:]:
+        seconds = (report.get("meta") or {}).get("duration")
+        if report.get("ok") and seconds and report.get("output_bytes"):
+            rates.append(report["output_bytes"] / seconds)
+    rate = max(rates) if rates else VIDEO_BYTES_PER_SEC
+    return int(duration * rate * OUTPUT_MARGIN)
+
+
+def check_output_space(out_path, duration):
+    """Raise ScratchSpaceError nếu thư mục đầu ra không đủ chỗ cho video dài `duration` giây"""
+    need = estimate_output_bytes(duration)
+    free = free_bytes(os.path.dirname(os.path.abspath(out_path)))
+    if free < need:
+        raise ScratchSpaceError(
+            f"Thư mục đầu ra chỉ còn {_human(free)}, video cần ~{_human(need)}: {out_path}")
+    return need
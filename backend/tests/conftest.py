@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Module backend import phẳng (from consts import *) -> thêm backend/ vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,166 @@
+"""
+Audio timeline của renderer "segments": ranh giới đoạn tính theo tổng số frame
+(không dồn sai số), transition chèn giữa lấy audio transition, audioTracks
+nằm trong gap đen dời về đầu clip kế tiếp. assemble ghi đúng số mẫu cho track
+nền và từng lớp hiệu ứng; audio lệch hình quá 1 frame -> lỗi.
+"""
+
+import os
+
+import pytest
+
+import audio_timeline
+from audio_timeline import SAMPLE_BYTES, AudioAlignmentError, AudioTimeline
+from render_helper import build_segments_audio_timeline
+from render_plan import compile_plan, frames_to_seconds
+
+TRANSITION_AUDIO = "/ch/transition.mov"
+
+
+def _spec(fps, tracks=()):
+    """Clip a (2s), gap đen (1s), clip b (3s)"""
+    clips = [
+        {"layers": [{"type": "video", "path": "/clips/a.mp4", "cutFrom": 1.0, "cutTo": 3.0, "mixVolume": 0.5}]},
+        {"duration": 1.0, "layers": [{"type": "fill-color", "color": "#000000"}]},
+        {"layers": [{"type": "video", "path": "/clips/b.mp4", "cutFrom": 0.0, "cutTo": 3.0}]},
+    ]
+    return {"fps": fps, "clips": clips,
+            "audioTracks": [{"path": f"/fx/{i}.wav", "start": start, "cutFrom": 0.0, "cutTo": 0.5}
+                            for i, start in enumerate(tracks)]}
+
+
+def _to_samples(frames, fps):
+    return round(frames_to_seconds(frames, fps) * audio_timeline.AUDIO_RATE)
+
+
+def test_segments_follow_concat_sequence():
+    plan = compile_plan(_spec(30), 30)
+    a, gap, b = plan.segments
+    # Renderer "segments" bỏ gap đen, chèn transition 15 frame giữa 2 clip
+    timeline = build_segments_audio_timeline(plan, [a, None, b], [60, 15, 90], TRANSITION_AUDIO)
+
+    assert [(s["path"], s["cut_from"], s["samples"], s["volume"]) for s in timeline.segments] == [
+        ("/clips/a.mp4", 1.0, 96000, 0.5),
+        (TRANSITION_AUDIO, 0.0, 24000, 1.0),
+        ("/clips/b.mp4", 0.0, 144000, 1.0),
+    ]
+    assert timeline.total_samples == _to_samples(165, 30)
+
+
+def test_stings_anchored_across_fill_gap():
+    # 0.5s: trong clip a; 2.5s: trong gap đen -> đầu clip b; 4.0s: 1s sau đầu clip b
+    plan = compile_plan(_spec(30, tracks=(0.5, 2.5, 4.0)), 30)
+    a, gap, b = plan.segments
+    timeline = build_segments_audio_timeline(plan, [a, None, b], [60, 15, 90], TRANSITION_AUDIO)
+
+    b_start = 96000 + 24000
+    assert [t["start"] for t in timeline.tracks] == [24000, b_start, b_start + 48000]
+    assert [t["samples"] for t in timeline.tracks] == [24000] * 3
+    assert [t["path"] for t in timeline.tracks] == ["/fx/0.wav", "/fx/1.wav", "/fx/2.wav"]
+
+
+def test_sting_after_last_clip_lands_at_end():
+    plan = compile_plan(_spec(30, tracks=(10.0,)), 30)
+    a, gap, b = plan.segments
+    timeline = build_segments_audio_timeline(plan, [a, b], [60, 90])
+    assert timeline.tracks[0]["start"] == timeline.total_samples == _to_samples(150, 30)
+
+
+@pytest.mark.parametrize("fps", [24, 25, "30000/1001", 60])
+def test_boundaries_from_cumulative_frames(fps):
+    plan = compile_plan(_spec(fps), fps)
+    a, gap, b = plan.segments
+    # Cùng 1 clip xuất hiện 2 lần (vd: clip chia qua 2 batch) -> vị trí theo lần đầu
+    sources = [a, None, b, None, b]
+    frames = [a["frames"], 7, b["frames"], 7, b["frames"]]
+    timeline = build_segments_audio_timeline(plan, sources, frames, TRANSITION_AUDIO)
+
+    elapsed, cursor = 0, 0
+    for seg, n in zip(timeline.segments, frames):
+        elapsed += n
+        cursor += seg["samples"]
+        assert cursor == _to_samples(elapsed, plan.fps)
+    assert timeline.total_samples == _to_samples(sum(frames), plan.fps)
+
+
+# --- AudioTimeline.assemble ---
+@pytest.fixture
+def timeline(tmp_path, monkeypatch):
+    """Timeline có audio cho mọi file trừ /clips/silent.mp4; PCM nguồn ghi tay (thiếu / thừa mẫu)"""
+    monkeypatch.setattr(audio_timeline, "probe_media_many",
+                        lambda paths: {p: {"has_audio": p != "/clips/silent.mp4"} for p in paths})
+    timeline = AudioTimeline()
+    timeline.add_segment("/clips/a.mp4", 1.0, 4800)
+    timeline.add_segment(None, 0, 1000)
+    timeline.add_segment("/clips/silent.mp4", 0, 2000)
+    timeline.add_segment("/clips/a.mp4", 1.0, 4800)  # cùng nguồn + đoạn cắt: decode 1 lần
+    timeline.add_segment("/clips/b.mp4", 0, 3000)
+    timeline.add_track("/fx/0.wav", 0, 0, 2000)
+    timeline.add_track("/fx/1.wav", 1000, 0, 2000)  # chồng /fx/0 -> lớp thứ 2
+    timeline.add_track("/fx/0.wav", 14000, 0, 2000)  # vượt cuối timeline -> cắt
+    timeline.add_track("/fx/0.wav", 99999, 0, 2000)  # bắt đầu sau cuối timeline -> bỏ
+    return timeline
+
+
+def _write_pcm(path, samples, value=1):
+    with open(path, "wb") as f:
+        f.write(bytes([value]) * samples * SAMPLE_BYTES)
+
+
+def test_assemble_writes_exact_sample_counts(timeline, tmp_path):
+    cmds = timeline.plan_extract(str(tmp_path))
+    outputs = {cmd[-1]: cmd for cmd in cmds}
+    assert len(cmds) == 4  # a, b, /fx/0 (2000 mẫu), /fx/1
+    actual = {"/clips/a.mp4": 4700, "/clips/b.mp4": 3100, "/fx/0.wav": 2000, "/fx/1.wav": 2000}
+    for out, cmd in outputs.items():
+        _write_pcm(out, actual[cmd[cmd.index("-i") + 1]])
+
+    layers = timeline.assemble(str(tmp_path))
+    total = timeline.total_samples
+    assert total == 4800 + 1000 + 2000 + 4800 + 3000
+    assert len(layers) == 3
+    for path in layers:
+        assert os.path.getsize(path) == total * SAMPLE_BYTES
+    # a thiếu 100 mẫu (2 lần), b thừa 100 mẫu -> pad / cắt
+    assert timeline.report["fixed"] == 3
+    assert timeline.report["max_error_samples"] == 100
+    assert timeline.report["samples"] == total and timeline.report["layers"] == 3
+
+    with open(layers[0], "rb") as f:
+        base = f.read()
+    silent = slice(4800 * SAMPLE_BYTES, 7800 * SAMPLE_BYTES)  # gap + file không có audio
+    assert base[silent] == bytes(3000 * SAMPLE_BYTES)
+    assert base[4700 * SAMPLE_BYTES:4800 * SAMPLE_BYTES] == bytes(100 * SAMPLE_BYTES)  # pad cuối a
+
+
+def test_assemble_fails_on_wrong_length(timeline, tmp_path, monkeypatch):
+    for cmd in timeline.plan_extract(str(tmp_path)):
+        _write_pcm(cmd[-1], 10)
+    monkeypatch.setattr(audio_timeline, "_write_silence", lambda f, samples: None)
+    with pytest.raises(RuntimeError, match="sai độ dài"):
+        timeline.assemble(str(tmp_path))
+
+
+# --- check_alignment ---
+def test_alignment_within_one_frame():
+    timeline = AudioTimeline()
+    timeline.add_segment(None, 0, 48000)
+    assert timeline.check_alignment(1.0 - 0.9 / 30, 30) == pytest.approx(0.9 / 30)
+    assert timeline.report["ok"] is True
+
+
+@pytest.mark.parametrize("video_duration", [1.0 - 1.5 / 30, 1.0 + 1.5 / 30])
+def test_alignment_drift_over_one_frame_fails(video_duration):
+    timeline = AudioTimeline()
+    timeline.add_segment(None, 0, 48000)
+    with pytest.raises(AudioAlignmentError) as e:
+        timeline.check_alignment(video_duration, 30)
+    assert e.value.report is timeline.report
+    assert timeline.report["ok"] is False and "> 1 frame" in timeline.report["error"]
+
+
+def test_alignment_unknown_video_duration():
+    timeline = AudioTimeline()
+    timeline.add_segment(None, 0, 48000)
+    assert timeline.check_alignment(None, 30) is None
+    assert timeline.report["ok"] is None
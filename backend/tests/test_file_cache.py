@@ -0,0 +1,168 @@
+"""
+FileCache: giới hạn dung lượng xoá theo LRU (trừ key được protect), ghi qua
+reserve() -> put() không bao giờ để lộ file ghi dở, sweep_partials chỉ xoá
+file tạm đủ cũ. Đồng hồ giả để thứ tự last_used xác định.
+"""
+
+import itertools
+import os
+import threading
+import time
+
+import pytest
+
+import file_cache
+from file_cache import FileCache, make_key
+
+ENTRY_BYTES = 100
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.time của file_cache tăng 1 giây sau mỗi lần gọi"""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(file_cache.time, "time", lambda: float(next(ticks)))
+
+
+def _key(name):
+    return make_key({"name": name})
+
+
+def _add(cache, name, size=ENTRY_BYTES, protect=()):
+    key = _key(name)
+    tmp = cache.reserve(key, ".mp4")
+    with open(tmp, "wb") as f:
+        f.write(name.encode()[:1] * size)
+    return cache.put(key, tmp, ".mp4", protect=protect)
+
+
+def _cached(cache, *names):
+    return [name for name in names if cache.get(_key(name), ".mp4")]
+
+
+def test_evicts_least_recently_used(tmp_path, clock):
+    cache = FileCache(tmp_path / "cache", max_bytes=3 * ENTRY_BYTES)
+    for name in ("a", "b", "c"):
+        _add(cache, name)
+    assert cache.get(_key("a"), ".mp4")  # a vừa dùng -> b lâu nhất
+    _add(cache, "d")
+
+    assert cache.total_bytes() == 3 * ENTRY_BYTES
+    assert not os.path.exists(cache.path_for(_key("b"), ".mp4"))
+    assert _cached(cache, "a", "b", "c", "d") == ["a", "c", "d"]
+
+
+def test_evict_skips_protected_keys(tmp_path, clock):
+    cache = FileCache(tmp_path / "cache", max_bytes=2 * ENTRY_BYTES)
+    for name in ("a", "b"):
+        _add(cache, name)
+    # a (lâu nhất) đang được job hiện tại dùng: thêm c -> xoá b thay vì a
+    _add(cache, "c", protect={_key("a")})
+    assert _cached(cache, "a", "b", "c") == ["a", "c"]
+    assert cache.total_bytes() == 2 * ENTRY_BYTES
+
+    # Entry vừa put luôn được giữ, kể cả 1 mình đã vượt max_bytes
+    _add(cache, "big", size=5 * ENTRY_BYTES)
+    assert _cached(cache, "a", "c", "big") == ["big"]
+
+
+def test_no_limit_never_evicts(tmp_path, clock):
+    cache = FileCache(tmp_path / "cache")
+    for name in "abcdef":
+        _add(cache, name)
+    assert cache.evict() == 0
+    assert len(_cached(cache, *"abcdef")) == 6
+
+
+def test_reserve_put_is_atomic(tmp_path):
+    cache = FileCache(tmp_path / "cache")
+    key = _key("a")
+    tmp = cache.reserve(key, ".mp4")
+    assert tmp != cache.reserve(key, ".mp4")  # 2 tiến trình ghi cùng key không đè file tạm của nhau
+    assert os.path.dirname(tmp) == os.path.dirname(cache.path_for(key, ".mp4"))  # os.replace cùng ổ đĩa
+    assert ".part" in os.path.basename(tmp) and tmp.endswith(".mp4")
+
+    with open(tmp, "wb") as f:
+        f.write(b"half")
+        assert cache.get(key, ".mp4") is None  # đang ghi -> chưa có trong cache
+        f.write(b" done")
+    path = cache.put(key, tmp, ".mp4")
+    assert not os.path.exists(tmp)
+    assert cache.get(key, ".mp4") == path
+    with open(path, "rb") as f:
+        assert f.read() == b"half done"
+
+
+def test_readers_never_see_partial_file(tmp_path):
+    cache = FileCache(tmp_path / "cache")
+    key = _key("a")
+    payload = b"x" * 1024 * 1024
+    seen = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            path = cache.get(key, ".mp4")
+            if path:
+                with open(path, "rb") as f:
+                    seen.append(len(f.read()))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        for _ in range(5):
+            tmp = cache.reserve(key, ".mp4")
+            with open(tmp, "wb") as f:
+                for i in range(0, len(payload), 64 * 1024):
+                    f.write(payload[i:i + 64 * 1024])
+                    f.flush()
+            cache.put(key, tmp, ".mp4")
+            time.sleep(0.01)
+    finally:
+        stop.set()
+        thread.join()
+    assert seen and set(seen) == {len(payload)}
+
+
+def test_get_drops_entry_whose_file_is_gone(tmp_path):
+    cache = FileCache(tmp_path / "cache")
+    path = _add(cache, "a")
+    os.remove(path)
+    assert cache.get(_key("a"), ".mp4") is None
+    assert cache.total_bytes() == 0
+
+
+def test_discard_removes_partial(tmp_path):
+    cache = FileCache(tmp_path / "cache")
+    tmp = cache.reserve(_key("a"), ".mp4")
+    with open(tmp, "wb") as f:
+        f.write(b"x")
+    cache.discard(tmp)
+    cache.discard(tmp)  # đã xoá -> không lỗi
+    assert not os.path.exists(tmp)
+
+
+def test_sweep_partials_only_removes_old_partials(tmp_path):
+    cache = FileCache(tmp_path / "cache")
+    done = _add(cache, "done")
+    old_tmp = cache.reserve(_key("old"), ".mp4")
+    new_tmp = cache.reserve(_key("new"), ".mp4")
+    for path in (old_tmp, new_tmp):
+        with open(path, "wb") as f:
+            f.write(b"x")
+    old = time.time() - file_cache.PARTIAL_MAX_AGE - 60
+    for path in (old_tmp, done):
+        os.utime(path, (old, old))
+
+    assert cache.sweep_partials() == 1
+    assert not os.path.exists(old_tmp)
+    assert os.path.exists(new_tmp)  # có thể đang được tiến trình khác ghi
+    assert os.path.exists(done)  # entry cũ không phải file tạm
+    os.utime(new_tmp, (old, old))  # tiến trình ghi đã chết từ lâu
+    assert cache.sweep_partials() == 1
+    assert not os.path.exists(new_tmp)
+    assert cache.get(_key("done"), ".mp4") == done
+
+
+def test_sweep_partials_without_cache_dir(tmp_path):
+    assert FileCache(tmp_path / "missing").sweep_partials() == 0
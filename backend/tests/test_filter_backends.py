@@ -0,0 +1,116 @@
+"""
+Backend dựng hình (filter_backends): backend CPU là mặc định và chạy được ở
+đây, graph của nó giống bản cũ; backend GPU chỉ bật khi kênh chọn. Renderer
+"stream" dựng từ cùng 1 render plan dù backend nào.
+"""
+
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import filter_backends
+import render_helper
+from filter_backends import CPU_BACKEND, FILTER_BACKENDS, resolve_filter_backend
+from render_config import background_options
+from render_plan import compile_plan
+
+FULL = {"quality": "full", "mode": "dynamic"}
+GPU_CAPS = {"hwaccels": ["cuda", "vaapi"], "filters": ["scale_cuda", "overlay_cuda"]}
+
+# Graph render 1 clip (build_clip_cmd) trước khi có filter_backends
+LEGACY_CLIP_GRAPH = [
+    "[0:v]split=2[bg][fg]",
+    "[bg]scale=1920:1080:force_original_aspect_ratio=increase,crop=1920:1080,boxblur=20:1[bg_blur]",
+    "[fg]scale=-2:1080:force_original_aspect_ratio=decrease[fg_scaled]",
+    "[bg_blur][fg_scaled]overlay=(W-w)/2:(H-h)/2[composed]",
+    "[composed][1:v]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2[with_logo]",
+    "[with_logo]fps=30,setsar=1,format=yuv420p[outv]",
+]
+
+
+@pytest.fixture
+def gpu_machine(monkeypatch):
+    """Máy giả có NVIDIA: hwaccel cuda + scale_cuda / overlay_cuda"""
+    monkeypatch.setattr(filter_backends, "get_encoder_caps", lambda: GPU_CAPS)
+    monkeypatch.setattr(filter_backends, "has_hw_filters", lambda *names: all(n in GPU_CAPS["filters"] for n in names))
+    monkeypatch.setattr(filter_backends, "best_gpu_type", lambda: "nvidia")
+    monkeypatch.setattr(filter_backends, "hwaccel_args", lambda: ["-hwaccel", "cuda"])
+
+
+def test_cpu_is_default_even_with_gpu(gpu_machine):
+    assert resolve_filter_backend({}) is CPU_BACKEND
+    assert resolve_filter_backend({"gpu_type": "nvidia"}) is CPU_BACKEND
+    assert resolve_filter_backend({"filter_backend": "auto"}).name == "cuda"
+    assert resolve_filter_backend({"filter_backend": "cuda"}).name == "cuda"
+    assert resolve_filter_backend({"filter_backend": "bogus"}) is CPU_BACKEND
+
+
+def test_cpu_decode_falls_back_in_software(gpu_machine):
+    # -hwaccel không kèm -hwaccel_output_format: decode GPU lỗi thì ffmpeg tự về CPU
+    assert CPU_BACKEND.input_args() == ["-hwaccel", "cuda"]
+    assert "-hwaccel_output_format" in FILTER_BACKENDS["cuda"].input_args()
+
+
+def test_cpu_clip_graph_matches_legacy_graph():
+    assert CPU_BACKEND.clip_graph(1920, 1080, 30, 20, True, FULL) == LEGACY_CLIP_GRAPH
+    without_logo = CPU_BACKEND.clip_graph(1920, 1080, 30, 20, False, FULL)
+    assert without_logo == LEGACY_CLIP_GRAPH[:4] + ["[composed]fps=30,setsar=1,format=yuv420p[outv]"]
+
+
+def test_default_blur_quality_keeps_legacy_graph():
+    # Kênh không đặt blur_quality -> blur độ phân giải đầy đủ như trước (medium / low phải tự bật)
+    assert background_options({})["quality"] == "full"
+    assert CPU_BACKEND.clip_graph(1920, 1080, 30, 20, True, background_options({})) == LEGACY_CLIP_GRAPH
+    assert CPU_BACKEND.clip_graph(1920, 1080, 30, 20, True) == LEGACY_CLIP_GRAPH
+    medium = CPU_BACKEND.clip_graph(1920, 1080, 30, 20, True, background_options({"blur_quality": "medium"}))
+    assert "scale=480:270:force_original_aspect_ratio=increase,crop=480:270,boxblur=5:1" in medium[1]
+
+
+@pytest.mark.parametrize("quality", sorted(filter_backends.BLUR_QUALITY_SCALES))
+def test_cpu_clip_graph_has_no_hw_filters(quality):
+    graph = ";".join(CPU_BACKEND.clip_graph(1920, 1080, 30, 40, True, {"quality": quality, "mode": "hold", "fps": 2}))
+    assert not re.search(r"hwupload|hwdownload|_cuda|_vaapi", graph)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="cần ffmpeg")
+@pytest.mark.parametrize("quality", ["full", "low"])
+def test_cpu_clip_graph_runs_in_ffmpeg(quality):
+    graph = CPU_BACKEND.clip_graph(320, 180, 25, 20, True, {"quality": quality, "mode": "dynamic"})
+    cmd = ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=s=640x480:r=25:d=0.4",
+           "-f", "lavfi", "-i", "color=white@0.5:s=64x64:d=0.04,format=rgba",
+           "-filter_complex", ";".join(graph), "-map", "[outv]", "-f", "framemd5", "-"]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert [line for line in result.stdout.splitlines() if not line.startswith("#")]
+
+
+def _stream_spec(out_path):
+    clips = [{"layers": [{"type": "video", "path": f"/clips/{i}.mp4", "resizeMode": "contain-blur",
+                          "cutFrom": 1.0, "cutTo": 1.0 + length}]}
+             for i, length in enumerate((2.5, 1.0 + 1 / 60, 3.0))]
+    clips.insert(1, {"duration": 0.5, "layers": [{"type": "fill-color", "color": "#000000"}]})
+    return {"width": 1280, "height": 720, "fps": 30, "outPath": str(out_path), "clips": clips}
+
+
+@pytest.mark.parametrize("backend", ["cpu", "cuda", "vaapi"])
+def test_stream_graph_from_same_plan(backend, tmp_path, monkeypatch, gpu_machine):
+    monkeypatch.setattr(render_helper, "probe_media_many", lambda paths: {})
+    monkeypatch.setattr(render_helper, "video_encoder_args", lambda quality=23, encoder=None: [])
+    spec = _stream_spec(tmp_path / "out.mp4")
+    plan = compile_plan(spec, 30)
+    cmd, duration = render_helper.build_single_pass_cmd(spec, str(tmp_path / "filter.txt"), 30, 20, FULL,
+                                                         plan=plan, filter_backend=FILTER_BACKENDS[backend])
+    graph = (tmp_path / "filter.txt").read_text()
+
+    assert duration == plan.duration
+    video = [s for s in plan.segments if s["kind"] == "video"]
+    assert [int(n) for n in re.findall(r"trim=end_frame=(\d+)", graph)] == [s["frames"] for s in video]
+    assert f"color=c=#000000:s=1280x720:r=30:d={plan.segments[1]['duration']}" in graph
+    for seg in video:
+        assert ["-ss", f"{seg['cut_from']:.6f}", "-t", f"{seg['duration']:.6f}", "-i", seg["path"]] == \
+            cmd[cmd.index(seg["path"]) - 5:cmd.index(seg["path"]) + 1]
+    on_gpu = bool(re.search(r"hwupload|hwdownload|_cuda|_vaapi", graph))
+    assert on_gpu == (backend != "cpu")
+    assert ("-hwaccel_output_format" in cmd) == (backend != "cpu")
@@ -0,0 +1,207 @@
+"""
+Render farm qua thư mục dùng chung (render_farm): nhận task atomic, thử lại
+có trễ, hết lượt -> failed/, worker chết -> task về hàng đợi, kết quả theo
+key không chạy lại. Lệnh "ffmpeg" giả ghi file {out} và log mỗi lần chạy.
+"""
+
+import os
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+import ffmpeg_runner
+import render_farm
+from render_farm import DONE, FAILED, QUEUED, RUNNING, FarmTaskError, FarmWorker, RenderFarm
+
+FAKE_FFMPEG = """#!{python}
+import os, sys
+args = [a for a in sys.argv[1:] if a not in ("-progress", "pipe:1", "-nostats", "-hide_banner", "-loglevel", "error")]
+label, mode, out = args
+with open({log!r}, "a") as f:
+    f.write(label + "\\n")
+if mode == "fail":
+    sys.exit(1)
+with open(out, "w") as f:
+    f.write(label)
+"""
+
+
+@pytest.fixture
+def farm(tmp_path, monkeypatch):
+    monkeypatch.setattr(ffmpeg_runner, "FFMPEG_METRICS_LOG", str(tmp_path / "metrics.jsonl"))
+    monkeypatch.setattr(render_farm, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(render_farm, "HEARTBEAT_INTERVAL", 0.1)
+    return RenderFarm(tmp_path / "farm", max_attempts=2)
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    """(cmd(label, mode), runs()) - mode "ok" ghi {out}, "fail" thoát mã 1"""
+    log = tmp_path / "runs.log"
+    script = tmp_path / "fake_ffmpeg"
+    script.write_text(FAKE_FFMPEG.format(python=sys.executable, log=str(log)))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+    def cmd(label, mode="ok"):
+        return [str(script), label, mode, "{out}"]
+
+    def runs():
+        return log.read_text().split() if log.exists() else []
+
+    return cmd, runs
+
+
+def _names(farm, state):
+    return sorted(os.listdir(farm._path(state, "")))
+
+
+def test_submit_skips_existing_keys(farm, fake_ffmpeg):
+    cmd, _ = fake_ffmpeg
+    assert farm.submit("a", cmd("a"), ".mp4")
+    assert not farm.submit("a", cmd("a"), ".mp4")  # đang chờ
+    os.rename(farm._path(QUEUED, "a.json"), farm._path(RUNNING, "a.json"))
+    assert not farm.submit("a", cmd("a"), ".mp4")  # đang chạy
+
+    with open(farm.result_path("b", ".mp4"), "w") as f:
+        f.write("b")
+    assert not farm.submit("b", cmd("b"), ".mp4")  # đã có kết quả
+    assert "b.json" not in _names(farm, QUEUED)
+
+    with open(farm._path(FAILED, "c.json"), "w") as f:
+        f.write("{}")
+    assert farm.submit("c", cmd("c"), ".mp4")  # từng failed -> thử lại từ đầu
+    assert "c.json" not in _names(farm, FAILED)
+
+
+def test_claim_race_each_task_once(farm, fake_ffmpeg):
+    cmd, _ = fake_ffmpeg
+    keys = [f"k{i:02d}" for i in range(40)]
+    for key in keys:
+        farm.submit(key, cmd(key))
+    claimed = []
+    barrier = threading.Barrier(8)
+
+    def worker(n):
+        barrier.wait()
+        while True:
+            task = farm.claim(f"w{n}")
+            if task is None:
+                return
+            claimed.append(task["key"])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == keys
+    assert _names(farm, QUEUED) == []
+    assert len(_names(farm, RUNNING)) == len(keys)
+
+
+def test_claim_only_filters_keys(farm, fake_ffmpeg):
+    cmd, _ = fake_ffmpeg
+    farm.submit("mine", cmd("mine"))
+    farm.submit("other", cmd("other"))
+    assert farm.claim("w", only={"mine"})["key"] == "mine"
+    assert farm.claim("w", only={"mine"}) is None
+    assert _names(farm, QUEUED) == ["other.json"]
+
+
+def test_fail_requeues_with_delay_then_fails(farm, fake_ffmpeg, monkeypatch):
+    cmd, _ = fake_ffmpeg
+    farm.submit("a", cmd("a", "fail"))
+    task = farm.claim("w")
+    assert task["attempts"] == 1
+
+    before = time.time()
+    assert farm.fail(task, "lỗi 1") == QUEUED
+    queued = render_farm._read_json(farm._path(QUEUED, "a.json"))
+    assert queued["not_before"] >= before + render_farm.RETRY_DELAY
+    assert queued["error"] == "lỗi 1"
+    assert farm.claim("w") is None  # chưa tới hạn thử lại
+
+    monkeypatch.setattr(render_farm.time, "time", lambda: queued["not_before"] + 1)
+    task = farm.claim("w")
+    assert task["attempts"] == 2
+    assert farm.fail(task, "lỗi 2") == FAILED  # max_attempts = 2
+    assert _names(farm, QUEUED) == _names(farm, RUNNING) == []
+    assert render_farm._read_json(farm._path(FAILED, "a.json"))["error"] == "lỗi 2"
+
+
+def test_release_does_not_count_attempt(farm, fake_ffmpeg):
+    cmd, _ = fake_ffmpeg
+    farm.submit("a", cmd("a"))
+    farm.release(farm.claim("w"))
+    assert farm.claim("w")["attempts"] == 1
+
+
+def test_requeue_stale(farm, fake_ffmpeg):
+    cmd, _ = fake_ffmpeg
+    for key in ("dead", "finished", "alive"):
+        farm.submit(key, cmd(key), ".mp4")
+        farm.claim("w", only={key})
+    old = time.time() - render_farm.STALE_AFTER - 5
+    for key in ("dead", "finished"):
+        os.utime(farm._path(RUNNING, key + ".json"), (old, old))
+    with open(farm.result_path("finished", ".mp4"), "w") as f:
+        f.write("x")  # worker xong ngay trước khi bị coi là chết
+
+    assert farm.requeue_stale() == 1
+    assert _names(farm, RUNNING) == ["alive.json"]
+    assert _names(farm, QUEUED) == ["dead.json"]
+    task = render_farm._read_json(farm._path(QUEUED, "dead.json"))
+    assert task["attempts"] == 1 and "không phản hồi" in task["error"]
+    assert farm.requeue_stale() == 0
+
+
+def test_run_tasks_runs_each_key_once(farm, fake_ffmpeg):
+    cmd, runs = fake_ffmpeg
+    tasks = [(key, cmd(key), ".mp4") for key in ("a", "b", "c")]
+    results = farm.run_tasks(tasks, local_workers=2)
+    assert sorted(results) == ["a", "b", "c"]
+    for key, path in results.items():
+        assert path == farm.result_path(key, ".mp4")
+        with open(path) as f:
+            assert f.read() == key
+    assert sorted(runs()) == ["a", "b", "c"]
+    assert not [n for n in _names(farm, DONE) if ".part" in n]
+
+    # Gửi lại cùng key (job gửi lại / máy điều phối khác): dùng kết quả có sẵn
+    again = farm.run_tasks(tasks + [("d", cmd("d"), ".mp4")], local_workers=1)
+    assert again["a"] == results["a"]
+    assert sorted(runs()) == ["a", "b", "c", "d"]
+
+
+def test_run_tasks_retries_then_raises(farm, fake_ffmpeg, monkeypatch):
+    cmd, runs = fake_ffmpeg
+    monkeypatch.setattr(render_farm, "RETRY_DELAY", 0)
+    with pytest.raises(FarmTaskError):
+        farm.run_tasks([("bad", cmd("bad", "fail"), ".mp4")], local_workers=1)
+    assert runs() == ["bad", "bad"]  # max_attempts = 2
+    assert _names(farm, FAILED) == ["bad.json"]
+    assert not os.path.exists(farm.result_path("bad", ".mp4"))
+
+
+def test_worker_idle_exit(farm, fake_ffmpeg):
+    cmd, runs = fake_ffmpeg
+    farm.submit("a", cmd("a"), ".mp4")
+    FarmWorker(farm, concurrency=1, idle_exit=0.2).run()
+    assert runs() == ["a"]
+    assert farm.status()[DONE] == 1
+    assert farm.alive_workers() == []
+
+
+def test_publish_is_idempotent(farm, tmp_path):
+    src = tmp_path / "logo.png"
+    src.write_bytes(b"png")
+    path = farm.publish("logo", str(src), ".png")
+    assert path == farm.result_path("logo", ".png")
+    src.write_bytes(b"changed")
+    assert farm.publish("logo", str(src), ".png") == path
+    with open(path, "rb") as f:
+        assert f.read() == b"png"
+    assert _names(farm, DONE) == ["logo.png"]
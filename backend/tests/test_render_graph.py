@@ -0,0 +1,86 @@
+"""
+Renderer "graph" (editor) và "stream" (build_single_pass_cmd) dựng từ cùng 1
+render plan phải đặt transition ở đúng cùng các frame: vắt qua ranh giới 2
+clip, không bị cắt ở cuối clip trước.
+"""
+
+import random
+import re
+
+import pytest
+
+import render_helper
+from render_plan import compile_plan
+
+SEEDS = range(20)
+
+GRAPH_OVERLAY = re.compile(r"\[trans_\d+_shifted\]overlay=0:0:enable='between\(t,([\d.]+),([\d.]+)\)'")
+GRAPH_SHIFT = re.compile(r"setpts=PTS\+([\d.]+)/TB\[trans_\d+_shifted\]")
+STREAM_OVERLAY = re.compile(r"\[tr_\d+\]overlay=0:0:eof_action=pass:enable='between\(t,([\d.]+),([\d.]+)\)'")
+STREAM_SHIFT = re.compile(r"setpts=PTS-STARTPTS\+([\d.]+)/TB\[tr_\d+\]")
+
+
+def _spec(rng, out_path):
+    """Spec kiểu build_editly_config (không logo): transition đè pre_f frame cuối clip, dài hơn pre_f"""
+    fps = rng.choice((24, 25, 30, 60))
+    trans_f = rng.randint(3, 30)
+    pre_f = rng.randint(0, trans_f - 1)
+    trans_s, pre_s = trans_f / fps, pre_f / fps
+    clips, tracks, timeline = [], [], 0.0
+    count = rng.randint(2, 12)
+    for i in range(count):
+        duration = rng.randint(pre_f + 1, 200) / fps
+        layers = [{"type": "video", "path": f"/clips/{i}.mp4", "resizeMode": rng.choice(("contain-blur", "cover")),
+                   "cutFrom": 0.0, "cutTo": duration}]
+        if i < count - 1:
+            layers.append({"type": "video", "path": "/ch/transition.mov", "start": duration - pre_s,
+                           "stop": duration - pre_s + trans_s, "cutFrom": 0.0, "cutTo": trans_s})
+            tracks.append({"path": "/ch/transition.mov", "mixVolume": 1, "cutFrom": 0.0,
+                           "cutTo": trans_s, "start": timeline + duration - pre_s})
+        clips.append({"layers": layers})
+        timeline += duration
+    return {"width": 1280, "height": 720, "fps": fps, "outPath": str(out_path),
+            "clips": clips, "audioTracks": tracks}
+
+
+def _frames(pattern_window, pattern_shift, text, fps):
+    windows = [(round(float(a) * fps), round(float(b) * fps)) for a, b in pattern_window.findall(text)]
+    shifts = [round(float(s) * fps) for s in pattern_shift.findall(text)]
+    return windows, shifts
+
+
+@pytest.fixture(autouse=True)
+def no_probe(monkeypatch):
+    # Không chạy ffprobe/ffmpeg: chỉ dựng lệnh
+    monkeypatch.setattr(render_helper, "probe_media_many", lambda paths: {})
+    monkeypatch.setattr(render_helper, "video_encoder_args", lambda quality=23, encoder=None: [])
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_graph_and_stream_place_transitions_on_same_frames(seed, tmp_path):
+    rng = random.Random(seed)
+    spec = _spec(rng, tmp_path / "out.mp4")
+    fps = spec["fps"]
+    plan = compile_plan(spec, fps)
+    expected = [(o["start_frame"], o["start_frame"] + o["frames"]) for s in plan.segments for o in s["overlays"]]
+    assert len(expected) == len(spec["clips"]) - 1
+
+    render_helper.build_graph_cmd(spec, str(tmp_path / "graph.txt"))
+    render_helper.build_single_pass_cmd(spec, str(tmp_path / "stream.txt"), fps, plan=plan)
+    graph, graph_shift = _frames(GRAPH_OVERLAY, GRAPH_SHIFT, (tmp_path / "graph.txt").read_text(), fps)
+    stream, stream_shift = _frames(STREAM_OVERLAY, STREAM_SHIFT, (tmp_path / "stream.txt").read_text(), fps)
+
+    assert graph == stream == expected
+    assert graph_shift == stream_shift == [start for start, _ in expected]
+    # Transition dài hơn pre-overlap -> phần còn lại nằm trong clip sau, không bị cắt
+    for (start, end), seg in zip(expected, plan.segments):
+        assert start <= seg["start_frame"] + seg["frames"] < end
+
+
+def test_graph_clips_not_trimmed_by_transitions(tmp_path):
+    spec = _spec(random.Random(0), tmp_path / "out.mp4")
+    render_helper.build_graph_cmd(spec, str(tmp_path / "graph.txt"))
+    text = (tmp_path / "graph.txt").read_text()
+    # Transition overlay sau concat, trên cả timeline
+    assert "concat=" in text and text.index("concat=") < text.index("[trans_0_shifted]overlay")
+    assert "trim=duration=" not in text
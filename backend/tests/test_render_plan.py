@@ -0,0 +1,223 @@
+"""
+Timeline theo frame (render_plan + build_editly_config): không lệch frame dù
+spec dài, fps NTSC, clip dài lẻ nửa frame hay spec cũ cộng dồn giây bằng float.
+Spec sinh ngẫu nhiên với seed cố định -> lỗi nào cũng chạy lại được.
+"""
+
+import json
+import random
+from fractions import Fraction
+
+import pytest
+
+import render_config
+from render_plan import SNAP_EPSILON, compile_plan, frame_rate, frames_to_seconds, seconds_to_frames
+
+SEEDS = range(40)
+FPS_CHOICES = (24, 25, 30, 60, "30000/1001")
+LOGO = {"type": "image-overlay", "path": "/ch/logo.png", "position": "center", "width": 1.0}
+
+
+def _legacy_spec(rng, fps):
+    """
+    Spec kiểu build_editly_config cũ: độ dài clip là giây float tuỳ ý (có clip
+    dài đúng k + 0.5 frame), audioTracks đặt theo giây cộng dồn bằng float.
+    Trả về (spec, số frame transition, số frame pre-overlap).
+    """
+    rate = float(frame_rate(fps))
+    trans_f = rng.randint(3, 20)
+    pre_f = rng.randint(0, trans_f)
+    gap_f = rng.choice((0, 0, rng.randint(1, 10)))
+    trans_s, pre_s = trans_f / rate, pre_f / rate
+
+    clips, tracks = [], []
+    timeline = 0.0
+    count = rng.randint(2, 60)
+    for i in range(count):
+        if rng.random() < 0.4:
+            duration = (rng.randint(pre_f + 1, 300) + 0.5) / rate
+        else:
+            duration = rng.uniform((pre_f + 1) / rate, 10.0)
+        layers = [{"type": "video", "path": f"/clips/{i}.mp4", "resizeMode": "contain-blur",
+                   "cutFrom": 0.0, "cutTo": duration}, dict(LOGO)]
+        if i < count - 1:
+            layers.append({"type": "video", "path": "/ch/transition.mov",
+                           "start": duration - pre_s, "stop": duration - pre_s + trans_s,
+                           "cutFrom": 0.0, "cutTo": trans_s})
+            tracks.append({"path": "/ch/transition.mov", "mixVolume": 1, "cutFrom": 0.0,
+                           "cutTo": trans_s, "start": timeline + duration - pre_s})
+        clips.append({"layers": layers})
+        timeline += duration
+        if gap_f and i < count - 1:
+            clips.append({"duration": gap_f / rate,
+                          "layers": [{"type": "fill-color", "color": "#000000"}, dict(LOGO)]})
+            timeline += gap_f / rate
+    spec = {"width": 1920, "height": 1080, "fps": fps, "clips": clips, "audioTracks": tracks}
+    return spec, trans_f, pre_f
+
+
+def _assert_contiguous(plan):
+    cursor = 0
+    for seg in plan.segments:
+        assert seg["start_frame"] == cursor
+        assert seg["frames"] >= 1
+        cursor += seg["frames"]
+    assert plan.total_frames == cursor
+
+
+def _overlays(plan):
+    return [(seg, o) for seg in plan.segments for o in seg["overlays"]]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_compile_plan_legacy_spec_no_drift(seed):
+    rng = random.Random(seed)
+    fps = rng.choice(FPS_CHOICES)
+    spec, trans_f, pre_f = _legacy_spec(rng, fps)
+    plan = compile_plan(spec)
+    rate = frame_rate(fps)
+
+    _assert_contiguous(plan)
+    for seg, clip in zip(plan.segments, spec["clips"]):
+        length = clip.get("duration") or clip["layers"][0]["cutTo"]
+        # Làm tròn từng clip, không cộng dồn: lệch tối đa nửa frame (+ sai số float)
+        assert abs(seg["frames"] - Fraction(repr(length)) * rate) <= Fraction(1, 2) + SNAP_EPSILON
+
+    overlays = _overlays(plan)
+    assert len(overlays) == len(plan.audio_tracks)
+    for (seg, overlay), track in zip(overlays, plan.audio_tracks):
+        assert overlay["start_frame"] == seg["start_frame"] + seg["frames"] - pre_f
+        assert overlay["frames"] == trans_f
+        assert track["start_frame"] == overlay["start_frame"]
+        assert track["frames"] == trans_f
+
+
+def test_anchor_snaps_to_half_frame_clip_boundary():
+    # 0.18s @ 25fps = 4.5 frame -> mỗi clip 5 frame; 5 x 0.18 cộng float
+    # = 0.8999999999999999, nhỏ hơn ranh giới clip thứ 6 (frame 25)
+    timeline = 0.0
+    for _ in range(5):
+        timeline += 0.18
+    assert timeline < 0.9
+    clips = [{"layers": [{"type": "video", "path": f"/clips/{i}.mp4", "cutTo": 0.18}]}
+             for i in range(6)]
+    tracks = [{"path": "/ch/transition.mov", "cutTo": 0.2, "start": timeline},
+              {"path": "/ch/transition.mov", "cutTo": 0.2, "start": 0.9000000000000001}]
+    plan = compile_plan({"fps": 25, "clips": clips, "audioTracks": tracks})
+
+    assert [s["frames"] for s in plan.segments] == [5] * 6
+    assert [t["start_frame"] for t in plan.audio_tracks] == [25, 25]
+    assert plan.audio_tracks[0]["start_frame"] == plan.segments[5]["start_frame"]
+
+
+def _pieces(sub_plans, windows, items_of):
+    """Mảnh transition/audio của các plan con -> (frame tuyệt đối, số frame, skip)"""
+    pieces = []
+    for sub, (offset, _) in zip(sub_plans, windows):
+        for item in items_of(sub):
+            pieces.append((item["path"], offset + item["start_frame"], item["frames"], item["skip"]))
+    return sorted(pieces)
+
+
+def _expected_pieces(plan, windows, items):
+    expected = []
+    for item in items:
+        for start, end in windows:
+            a = max(item["start_frame"], start)
+            b = min(item["start_frame"] + item["frames"], end)
+            if b > a:
+                skip = frames_to_seconds(a - item["start_frame"], plan.fps)
+                expected.append((item["path"], a, b - a, round(float(skip), 6)))
+    return sorted(expected)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_split_windows_rejoin_exactly(seed):
+    rng = random.Random(1000 + seed)
+    spec, _, _ = _legacy_spec(rng, rng.choice(FPS_CHOICES))
+    plan = compile_plan(spec)
+
+    for parts in sorted({1, 2, 3, rng.randint(1, len(plan.segments)), len(plan.segments)}):
+        ranges = plan.split(parts)
+        assert len(ranges) == min(parts, len(plan.segments))
+        assert ranges[0][0] == 0 and ranges[-1][1] == len(plan.segments) - 1
+        assert all(b[0] == a[1] + 1 for a, b in zip(ranges, ranges[1:]))
+
+        subs = [plan.window(first, last) for first, last in ranges]
+        windows = []
+        for first, last in ranges:
+            start = plan.segments[first]["start_frame"]
+            windows.append((start, plan.segments[last]["start_frame"] + plan.segments[last]["frames"]))
+        assert sum(sub.total_frames for sub in subs) == plan.total_frames
+
+        rejoined = []
+        for sub, (offset, _) in zip(subs, windows):
+            _assert_contiguous(sub)
+            rejoined += [(s["index"], offset + s["start_frame"], s["frames"]) for s in sub.segments]
+        assert rejoined == [(s["index"], s["start_frame"], s["frames"]) for s in plan.segments]
+
+        for sub in subs:
+            for seg in sub.segments:
+                for overlay in seg["overlays"]:
+                    # Transition gắn vào segment chứa frame bắt đầu của nó
+                    assert seg["start_frame"] <= overlay["start_frame"] < seg["start_frame"] + seg["frames"]
+
+        overlays = [o for _, o in _overlays(plan)]
+        assert (_pieces(subs, windows, lambda p: [o for _, o in _overlays(p)])
+                == _expected_pieces(plan, windows, overlays))
+        assert (_pieces(subs, windows, lambda p: p.audio_tracks)
+                == _expected_pieces(plan, windows, plan.audio_tracks))
+        for item in overlays + plan.audio_tracks:
+            covered = sum(b - a for a, b in ((max(item["start_frame"], s), min(item["start_frame"] + item["frames"], e))
+                                             for s, e in windows) if b > a)
+            assert covered == item["frames"]
+
+
+@pytest.fixture
+def channel(tmp_path, monkeypatch):
+    channel_dir = tmp_path / "Channels" / "TestCh"
+    channel_dir.mkdir(parents=True)
+    (channel_dir / "logo.png").write_bytes(b"")
+    (channel_dir / "transition.mov").write_bytes(b"")
+    monkeypatch.setattr(render_config, "CHANNELS_DIR", tmp_path / "Channels")
+    monkeypatch.setattr(render_config, "TEMP_DIR", tmp_path / "Temp")
+    monkeypatch.setattr(render_config, "is_gpu_type_available", lambda gpu_type: True)
+    return tmp_path
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_build_editly_config_frame_cursor(seed, channel, monkeypatch):
+    rng = random.Random(2000 + seed)
+    fps = rng.choice((24, 25, 30, 60))
+    trans_f = rng.randint(3, 30)
+    pre_f = rng.randint(0, trans_f)
+    gap_f = rng.choice((0, rng.randint(1, 12)))
+    monkeypatch.setattr(render_config, "probe_duration_sec", lambda path: trans_f / fps)
+
+    durations = [rng.choice((rng.uniform(0.5, 12.0), (rng.randint(pre_f + 1, 200) + 0.5) / fps))
+                 for _ in range(rng.randint(2, 80))]
+    durations = [max(d, (pre_f + 1) / fps) for d in durations]
+    selected = [{"path": f"/clips/{i}.mp4", "duration": d} for i, d in enumerate(durations)]
+    config = {"fps": fps, "gap": f"00:00:00:{gap_f:02d}", "preoverlap": f"00:00:00:{pre_f:02d}",
+              "logo": "logo.png", "transition": "transition.mov", "blur": 0, "gpu_type": "cpu"}
+    spec_path = render_config.build_editly_config("TestCh", config, selected, str(channel / "out"))
+    with open(spec_path, encoding="utf-8") as f:
+        spec = json.load(f)
+    plan = compile_plan(spec)
+
+    clip_frames = [seconds_to_frames(d, fps) for d in durations]
+    _assert_contiguous(plan)
+    assert plan.total_frames == sum(clip_frames) + gap_f * (len(durations) - 1)
+    main = [s for s in plan.segments if s["kind"] == "video"]
+    assert [s["frames"] for s in main] == clip_frames
+
+    # Mọi thời điểm ghi trong spec là đúng 1 frame nguyên
+    for track in spec["audioTracks"]:
+        assert abs(track["start"] * fps - round(track["start"] * fps)) < 1e-6
+
+    overlays = _overlays(plan)
+    assert len(overlays) == len(plan.audio_tracks) == len(durations) - 1
+    for (seg, overlay), track in zip(overlays, plan.audio_tracks):
+        assert overlay["start_frame"] == seg["start_frame"] + seg["frames"] - pre_f
+        assert overlay["frames"] == trans_f
+        assert track["start_frame"] == overlay["start_frame"]
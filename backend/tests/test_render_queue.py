@@ -0,0 +1,146 @@
+"""
+Worker render_queue chết giữa chừng: render_cli con chết theo, job được worker
+khác đưa lại hàng đợi và chỉ render xong đúng 1 lần (không 2 tiến trình cùng
+ghi 1 outPath). render_cli tự huỷ khi stdin/stdout tới worker bị đóng.
+"""
+
+import io
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+import render_cli
+import render_queue
+from process_manager import get_process_manager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Thay render_cli: ghi log start/done, in sự kiện JSON như render_cli thật
+FAKE_CLI = """
+import json, os, sys, time
+spec, log, seconds = sys.argv[1], sys.argv[2], float(sys.argv[3])
+with open(log, "a") as f:
+    f.write(f"start {os.getpid()}\\n")
+print(json.dumps({"event": "start"}), flush=True)
+time.sleep(seconds)
+with open(log, "a") as f:
+    f.write(f"done {os.getpid()}\\n")
+print(json.dumps({"event": "done", "output": spec + ".mp4"}), flush=True)
+"""
+
+WORKER = """
+import sys
+import render_queue
+render_queue.HEARTBEAT_INTERVAL = 0.2
+render_queue.POLL_INTERVAL = 0.1
+
+class Worker(render_queue.RenderWorker):
+    @staticmethod
+    def _render_cmd(job):
+        return [sys.executable, {fake!r}, job["spec_path"], {log!r}, "30"]
+
+Worker(render_queue.RenderQueue({db!r})).run()
+"""
+
+
+def _alive(pid):
+    """Tiến trình còn chạy (zombie chưa được reap = đã chết)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def _log(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.split() for line in f if line.strip()]
+
+
+def _wait_for(predicate, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="PR_SET_PDEATHSIG chỉ có trên Linux")
+def test_killed_worker_job_requeued_and_rendered_once(tmp_path, monkeypatch):
+    db, log, fake = str(tmp_path / "queue.sqlite3"), str(tmp_path / "renders.log"), str(tmp_path / "fake_cli.py")
+    (tmp_path / "fake_cli.py").write_text(FAKE_CLI)
+    (tmp_path / "worker.py").write_text(textwrap.dedent(WORKER.format(fake=fake, log=log, db=db)))
+    queue = render_queue.RenderQueue(db)
+    job_id = queue.enqueue("TestCh", str(tmp_path / "spec.json"))
+
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    worker = subprocess.Popen([sys.executable, str(tmp_path / "worker.py")], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        assert _wait_for(lambda: _log(log), 20), "worker không chạy job"
+    finally:
+        worker.send_signal(signal.SIGKILL)
+        worker.wait()
+    orphan = int(_log(log)[0][1])
+    assert _wait_for(lambda: not _alive(orphan), 5), "render_cli vẫn chạy sau khi worker chết"
+    assert queue.get(job_id)["status"] == render_queue.JOB_RUNNING
+
+    # Worker thứ 2: requeue_stale định kỳ trong heartbeat loop nhận lại job
+    for name, value in (("STALE_AFTER", 1), ("RETRY_DELAY", 0), ("HEARTBEAT_INTERVAL", 0.2), ("POLL_INTERVAL", 0.1)):
+        monkeypatch.setattr(render_queue, name, value)
+
+    class Worker(render_queue.RenderWorker):
+        @staticmethod
+        def _render_cmd(job):
+            return [sys.executable, fake, job["spec_path"], log, "0.2"]
+
+    Worker(queue, idle_exit=3).run()
+
+    entries = _log(log)
+    assert [e[0] for e in entries] == ["start", "start", "done"]
+    assert entries[2][1] == entries[1][1] != str(orphan)
+    job = queue.get(job_id)
+    assert job["status"] == render_queue.JOB_DONE
+    assert job["attempts"] == 2
+    assert job["output"] == str(tmp_path / "spec.json") + ".mp4"
+
+
+class _ClosedPipe(io.StringIO):
+    def write(self, text):
+        raise BrokenPipeError(32, "Broken pipe")
+
+
+@pytest.fixture
+def manager():
+    manager = get_process_manager()
+    manager.reset()
+    yield manager
+    manager.reset()
+
+
+def test_render_cli_cancels_when_stdin_closes(manager):
+    render_cli._control_loop(io.StringIO("pause\nresume\n"), render_cli.JsonLinesReporter(io.StringIO()))
+    assert manager.is_cancelled
+
+
+def test_render_cli_cancel_command_stops_reading(manager):
+    out = io.StringIO()
+    render_cli._control_loop(io.StringIO("cancel\n"), render_cli.JsonLinesReporter(out))
+    assert manager.is_cancelled
+    assert '"action": "cancel"' in out.getvalue()
+
+
+def test_render_cli_cancels_when_stdout_breaks(manager):
+    reporter = render_cli.JsonLinesReporter(_ClosedPipe())
+    reporter.emit("progress", percent=1.0)
+    assert reporter.closed
+    assert manager.is_cancelled
+    reporter.emit("cancelled")  # không raise lần nữa
@@ -0,0 +1,101 @@
+"""
+Kiểm tra video đầu ra của renderer "stream" (verify_render): lệch số frame
+hoặc audio lệch hình quá 1 frame -> job lỗi, video bị xoá, report ghi ok =
+false. Ffprobe giả trả về stream theo từng test.
+"""
+
+import json
+import subprocess
+
+import pytest
+
+import render_helper
+import render_report
+from render_helper import RenderVerifyError, verify_render
+from render_plan import compile_plan
+
+FPS = 30
+
+
+def _spec(out_path):
+    clips = [{"layers": [{"type": "video", "path": f"/clips/{i}.mp4", "cutFrom": 0.0, "cutTo": 2.0}]}
+             for i in range(3)]
+    return {"width": 1280, "height": 720, "fps": FPS, "outPath": str(out_path), "clips": clips}
+
+
+@pytest.fixture
+def plan(tmp_path):
+    return compile_plan(_spec(tmp_path / "out.mp4"), FPS)
+
+
+@pytest.fixture
+def ffprobe(monkeypatch):
+    """ffprobe(frames, audio_duration) -> lần gọi subprocess.run sau trả về các stream này"""
+    def set_streams(frames, audio_duration=None):
+        streams = [{"codec_type": "video", "nb_frames": str(frames), "duration": str(frames / FPS)}]
+        if audio_duration is not None:
+            streams.append({"codec_type": "audio", "duration": str(audio_duration)})
+        stdout = json.dumps({"streams": streams})
+        monkeypatch.setattr(render_helper.subprocess, "run",
+                            lambda cmd, **kw: subprocess.CompletedProcess(cmd, 0, stdout, ""))
+    return set_streams
+
+
+def test_verify_accepts_drift_within_one_frame(plan, ffprobe):
+    ffprobe(plan.total_frames, plan.duration + 0.9 / FPS)
+    result = verify_render("out.mp4", plan)
+    assert result["ok"] is True
+    assert result["frames"] == result["expected_frames"] == plan.total_frames
+
+
+@pytest.mark.parametrize("frames_delta, drift_frames", [(1, 0), (-1, 0), (0, 1.5), (0, -1.5)])
+def test_verify_rejects_mismatch(plan, ffprobe, frames_delta, drift_frames):
+    ffprobe(plan.total_frames + frames_delta, plan.duration + drift_frames / FPS)
+    result = verify_render("out.mp4", plan)
+    assert result["ok"] is False
+    assert result["error"]
+
+
+def test_verify_without_ffprobe_is_unknown(plan, monkeypatch):
+    def missing(cmd, **kw):
+        raise FileNotFoundError("ffprobe")
+    monkeypatch.setattr(render_helper.subprocess, "run", missing)
+    assert verify_render("out.mp4", plan)["ok"] is None
+
+
+def _render(tmp_path, monkeypatch, verify):
+    spec_path = tmp_path / "spec.json"
+    out_path = tmp_path / "out.mp4"
+    spec_path.write_text(json.dumps(_spec(out_path)))
+    reports = tmp_path / "reports.jsonl"
+    monkeypatch.setattr(render_report, "RENDER_REPORTS_LOG", str(reports))
+    monkeypatch.setattr(render_helper, "check_output_space", lambda path, duration: None)
+    monkeypatch.setattr(render_helper, "build_single_pass_cmd", lambda *a, **kw: (["ffmpeg"], 6.0))
+    monkeypatch.setattr(render_helper, "run", lambda cmd, duration=None, label=None: out_path.write_bytes(b"mp4"))
+    monkeypatch.setattr(render_helper, "verify_render", lambda path, plan: dict(verify))
+    monkeypatch.setattr(render_helper, "notify", lambda *a: None)
+    try:
+        return render_helper.render_single_pass(str(spec_path))
+    finally:
+        assert reports.exists()
+
+
+def _last_report(tmp_path):
+    return json.loads((tmp_path / "reports.jsonl").read_text().splitlines()[-1])
+
+
+def test_render_fails_job_on_verify_mismatch(tmp_path, monkeypatch):
+    with pytest.raises(RenderVerifyError, match="180 frame"):
+        _render(tmp_path, monkeypatch, {"ok": False, "error": "video có 179 frame, plan là 180 frame"})
+    assert not (tmp_path / "out.mp4").exists()
+    report = _last_report(tmp_path)
+    assert report["ok"] is False
+    assert report["meta"]["verify"]["ok"] is False
+    assert "RenderVerifyError" in report["meta"]["error"]
+
+
+@pytest.mark.parametrize("ok", [True, None])
+def test_render_keeps_output_when_verified_or_unknown(tmp_path, monkeypatch, ok):
+    assert _render(tmp_path, monkeypatch, {"ok": ok}) == str(tmp_path / "out.mp4")
+    assert (tmp_path / "out.mp4").exists()
+    assert _last_report(tmp_path)["ok"] is True
@@ -0,0 +1,196 @@
+"""
+Thumbnail Engine - Tạo thumbnail cho nhiều video cùng lúc
+
+Trước đây mỗi file mở bằng cv2, decode frame 0 ở độ phân giải gốc, đổi
+BGR -> RGB, qua PIL rồi lưu PNG - lần lượt từng file. Giờ:
+- Seek tới keyframe ở ~THUMB_POSITION thời lượng (frame 0 hay là màn đen /
+  logo), chỉ decode keyframe (-skip_frame nokey, -noaccurate_seek): không
+  decode các frame P/B từ đầu GOP tới điểm cần lấy.
+- Scale xuống THUMBNAIL_SIZE ngay trong ffmpeg, lưu JPEG/WebP nhỏ gọn.
+- Mỗi tiến trình ffmpeg xử lý THUMB_BATCH file (nhiều input, nhiều output),
+  THUMB_WORKERS tiến trình chạy song song -> 1000 clip chỉ cần ~40 lần
+  khởi động ffmpeg thay vì 1000 lần mở file bằng cv2.
+- 1 file lỗi làm hỏng cả batch -> chạy lại từng file của batch đó; ffmpeg
+  vẫn không ra thumbnail (không có ffmpeg, seek keyframe lỗi...) -> dùng
+  cv2 cho file đó (seek bằng CAP_PROP_POS_MSEC).
+- Thumbnail lưu trong cache lâu dài (FileCache, THUMBNAIL_CACHE_DIR) theo key
+  = đường dẫn + size + mtime của file nguồn (+ kích thước/định dạng): 2 clip
+  trùng tên ở 2 topic không đè nhau, mở lại cửa sổ / phiên sau dùng lại
+  thumbnail cũ, sửa file nguồn thì tự tạo lại. Giới hạn dung lượng + LRU.
+
+Sử dụng:
+    from thumbnail_engine import make_thumbnails
+
+    thumbs = make_thumbnails(paths)   # {path: đường dẫn thumbnail hoặc None}
+"""
+
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from consts import THUMBNAIL_SIZE, THUMBNAIL_FORMAT, THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES
+from file_cache import FileCache, file_fingerprint, make_key
+from media_index import probe_media_many
+
+FFMPEG_EXEC = "ffmpeg"
+
+THUMB_BATCH = 24  # số file mỗi tiến trình ffmpeg
+THUMB_WORKERS = 4  # số tiến trình ffmpeg chạy song song
+THUMB_POSITION = 0.1  # lấy keyframe ở ~10% thời lượng clip
+THUMB_MAX_SEEK = 5.0  # ... nhưng không xa hơn 5 giây (clip dài)
+THUMB_TIMEOUT = 120
+
+JPEG_QUALITY = 4  # -q:v của mjpeg (2 = đẹp nhất, 31 = tệ nhất)
+WEBP_QUALITY = 75
+THUMB_FORMATS = ("jpg", "webp")
+
+THUMB_CACHE = FileCache(THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_MAX_BYTES)
+
+
+def thumbnail_time(duration):
+    """Thời điểm (giây) lấy thumbnail của clip dài `duration` giây"""
+    return min(max(0.0, float(duration or 0)) * THUMB_POSITION, THUMB_MAX_SEEK)
+
+
+def thumbnail_key(file_path, size=THUMBNAIL_SIZE, fmt=THUMBNAIL_FORMAT):
+    """Key cache: file nguồn (đường dẫn, size, mtime) + cách tạo thumbnail"""
+    return make_key({
+        "src": file_fingerprint(file_path),
+        "size": list(size),
+        "fmt": fmt,
+        "position": [THUMB_POSITION, THUMB_MAX_SEEK],
+    })
+
+
+def _output_args(fmt, size):
+    width, height = size
+    # -noaccurate_seek: keyframe trước điểm seek có pts âm, bị vsync bỏ mất ->
+    # đưa pts về 0 (chạy được cả ffmpeg cũ, không cần -fps_mode của 5.1+)
+    args = ["-frames:v", "1", "-an", "-sn", "-dn",
+            "-vf", f"setpts=PTS-STARTPTS,scale={width}:{height}"
+                   ":force_original_aspect_ratio=decrease:flags=fast_bilinear"]
+    if fmt == "webp":
+        return args + ["-c:v", "libwebp", "-quality", str(WEBP_QUALITY)]
+    return args + ["-c:v", "mjpeg", "-q:v", str(JPEG_QUALITY)]
+
+
+def build_thumbnail_cmd(jobs, size=THUMBNAIL_SIZE, fmt=THUMBNAIL_FORMAT):
+    """
+    1 lệnh ffmpeg cho nhiều file. jobs: [(file nguồn, thời điểm, file thumbnail)]
+    Input thứ i chỉ decode keyframe gần nhất trước thời điểm, ra output thứ i.
+    """
+    cmd = [FFMPEG_EXEC, "-hide_banner", "-loglevel", "error", "-y"]
+    for src, seek, _ in jobs:
+        cmd += ["-skip_frame", "nokey", "-noaccurate_seek", "-ss", f"{seek:.3f}", "-i", src]
+    for i, (_, _, out) in enumerate(jobs):
+        cmd += ["-map", f"{i}:v:0"] + _output_args(fmt, size) + ["-update", "1", out]
+    return cmd
+
+
+def _thumbnail_with_cv2(src, seek, out, size, fmt):
+    """Dự phòng khi máy không có ffmpeg"""
+    import cv2
+
+    video = cv2.VideoCapture(src)
+    try:
+        if not video.isOpened():
+            return False
+        video.set(cv2.CAP_PROP_POS_MSEC, seek * 1000)
+        ok, frame = video.read()
+        if not ok:
+            return False
+        h, w = frame.shape[:2]
+        scale = min(size[0] / w, size[1] / h, 1.0)
+        frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        params = ([cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY] if fmt == "webp"
+                  else [cv2.IMWRITE_JPEG_QUALITY, 85])
+        return cv2.imwrite(out, frame, params)
+    finally:
+        video.release()
+
+
+def _run_ffmpeg(jobs, size, fmt):
+    """Chạy 1 lệnh ffmpeg cho các job, True nếu thoát bình thường"""
+    try:
+        result = subprocess.run(build_thumbnail_cmd(jobs, size, fmt), capture_output=True,
+                                text=True, timeout=THUMB_TIMEOUT)
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        # FileNotFoundError: không có ffmpeg trong PATH
+        return False
+    return result.returncode == 0
+
+
+def _run_batch(jobs, size, fmt):
+    """
+    Chạy 1 batch. Lỗi (hoặc thiếu thumbnail) thì chạy lại từng file, vẫn lỗi
+    thì thử cv2. Trả về các job đã ra thumbnail.
+    """
+    if _run_ffmpeg(jobs, size, fmt):
+        done = [job for job in jobs if os.path.exists(job[2])]
+    else:
+        # Lệnh lỗi giữa chừng -> file đã ghi có thể hỏng, làm lại cả batch
+        done = []
+    missing = [job for job in jobs if job not in done]
+    if missing and len(jobs) > 1:
+        for job in missing:
+            done += _run_batch([job], size, fmt)
+        return done
+    for src, seek, out in missing:
+        try:
+            if _thumbnail_with_cv2(src, seek, out, size, fmt) and os.path.exists(out):
+                done.append((src, seek, out))
+                continue
+        except ImportError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Lỗi cv2 khi tạo thumbnail {src}: {e}")
+        print(f"⚠️ Không tạo được thumbnail: {src}")
+    return done
+
+
+def make_thumbnails(file_paths, size=THUMBNAIL_SIZE, fmt=THUMBNAIL_FORMAT, cache=None):
+    """
+    Thumbnail cho nhiều video: lấy từ cache, file chưa có thì tạo (song song,
+    nhiều file mỗi tiến trình) rồi đưa vào cache.
+    Trả về {path: đường dẫn thumbnail} - None nếu file không đọc được.
+    """
+    if fmt not in THUMB_FORMATS:
+        print(f"⚠️ Định dạng thumbnail không hợp lệ: {fmt}, dùng '{THUMB_FORMATS[0]}'")
+        fmt = THUMB_FORMATS[0]
+    cache = cache or THUMB_CACHE
+    ext = "." + fmt
+    paths = list(dict.fromkeys(p for p in file_paths if p))
+    thumbs = {p: None for p in paths}
+
+    keys = {}
+    missing = []
+    for path in paths:
+        try:
+            keys[path] = thumbnail_key(path, size, fmt)
+        except OSError:
+            continue
+        thumbs[path] = cache.get(keys[path], ext)
+        if thumbs[path] is None:
+            missing.append(path)
+    if not missing:
+        return thumbs
+
+    infos = probe_media_many(missing)
+    jobs = [(path, thumbnail_time(infos[path]["duration"]), cache.reserve(keys[path], ext))
+            for path in missing if infos.get(path)]
+
+    done = []
+    batches = [jobs[i:i + THUMB_BATCH] for i in range(0, len(jobs), THUMB_BATCH)]
+    with ThreadPoolExecutor(max_workers=max(1, min(THUMB_WORKERS, len(batches)))) as pool:
+        for batch_done in pool.map(lambda batch: _run_batch(batch, size, fmt), batches):
+            done += batch_done
+
+    # Không để lần dọn LRU xoá thumbnail của chính lần gọi này
+    protect = set(keys.values())
+    for src, _, tmp in done:
+        thumbs[src] = cache.put(keys[src], tmp, ext, protect=protect)
+    for _, _, tmp in jobs:
+        if os.path.exists(tmp):
+            cache.discard(tmp)
+    return thumbs
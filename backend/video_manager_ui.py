@@ -14,7 +14,7 @@ import json
 import os
 from consts import *
 from editor_ui import load_json
-from helper import get_video_info, load_channel_path, open_file_cross_platform
+from helper import get_videos_info, load_channel_path, open_file_cross_platform
 
 
 class VideoManagerWindow(ctk.CTkToplevel):
@@ -174,9 +174,15 @@ class VideoManagerWindow(ctk.CTkToplevel):
         total = len(used_videos_list)
         loaded = 0
 
+        # Probe + tạo thumbnail theo batch cho mọi video (thumbnail_engine)
+        self.stats_label.configure(text=f"⏳ Đang tạo thumbnail cho {total} video...")
+        self.update()
+        video_infos = get_videos_info([os.path.normpath(os.path.join(MAIN_CLIPS_DIR, p)) for p in used_videos_list])
+
         for rel_path in used_videos_list:
             abs_path = os.path.join(MAIN_CLIPS_DIR, rel_path)
             abs_path = os.path.normpath(abs_path)
+            video_info = video_infos[abs_path]
 
             if loaded % 10 == 0:
                 self.stats_label.configure(text=f"⏳ Đang tải {loaded}/{total} video...")
@@ -200,7 +206,7 @@ class VideoManagerWindow(ctk.CTkToplevel):
                 continue
 
             # Get video info
-            duration, thumb_path, width, height = get_video_info(abs_path)
+            duration, thumb_path, width, height = video_info
 
             self.all_videos.append({
                 'path': abs_path,
@@ -441,14 +447,6 @@ class VideoManagerWindow(ctk.CTkToplevel):
         if self.search_timer:
             self.after_cancel(self.search_timer)
 
-        # Clean up thumbnails
-        if TEMP_DIR.exists():
-            for f in TEMP_DIR.glob("thumb_*.png"):
-                try:
-                    os.remove(f)
-                except:
-                    pass
-
         self.master.deiconify()
         self.destroy()
 